@@ -1,8 +1,12 @@
 ﻿# app.py: Streamlit demo for the symptom-triage model
+import hashlib, io
+import pandas as pd
 import streamlit as st
-import numpy as np
 from joblib import load
 from rules import triage_from_rules
+from inference import TriageModel, fuse, top_k, triage_cases
+from records import case_from_record, iter_chunks
+from featurizer import precompile
 from demo_cases import DEMO_CASES  # Import the demo cases
 from medications import MEDICATION_GUIDE # Import the medication guide
 
@@ -16,9 +20,77 @@ def load_artifacts():
     vectorizer = load('vectorizer.joblib')
     clf = load('classifier.joblib')
     mlb = load('mlb.joblib')
-    return vectorizer, clf, mlb
+    return precompile(vectorizer), fuse(clf), mlb
 
-vectorizer, clf, mlb = load_artifacts()
+featurizer, scorer, mlb = load_artifacts()
+
+# --- Bulk CSV mode ---
+BULK_CHUNK = 1000
+BULK_MEMO_FILES = 3  # results kept per session, newest first
+BULK_COLUMNS = ['predicted_triage', 'predicted_emergency', 'predicted_conditions', 'predicted_probabilities', 'triage_error']
+
+def score_csv(data, progress=None):
+    """Triage every row of an intake CSV (needs a symptoms_text column) in vectorized chunks."""
+    df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    if 'symptoms_text' not in df.columns:
+        raise ValueError('the CSV needs a symptoms_text column')
+    model = TriageModel(featurizer, scorer, mlb.classes_)
+    rows, done = [], 0
+    for chunk in iter_chunks(df.to_dict('records'), BULK_CHUNK):
+        cases, positions, out = [], [], []
+        for rec in chunk:
+            try:
+                cases.append(case_from_record(rec))
+                positions.append(len(out))
+                out.append({})
+            except (TypeError, ValueError) as e:
+                out.append({'triage_error': f'invalid row: {e}'})
+        for pos, res in zip(positions, triage_cases(model, cases, 3) if cases else []):
+            out[pos] = {'predicted_triage': res['triage'], 'predicted_emergency': res['emergency'],
+                        'predicted_conditions': ', '.join(res['top_conditions']),
+                        'predicted_probabilities': ', '.join(f'{p:.2f}' for p in res['top_probabilities'])}
+        rows += out
+        done += len(chunk)
+        if progress:
+            progress(done, len(df))
+    # prefixed so they never collide with the upload's own columns (e.g. a labelled dataset's top_conditions)
+    result = pd.DataFrame(rows, index=df.index, columns=BULK_COLUMNS)
+    return pd.concat([df.drop(columns=BULK_COLUMNS, errors='ignore'), result], axis=1)
+
+def bulk_mode():
+    st.subheader('Bulk CSV triage')
+    st.caption('Upload a CSV with a `symptoms_text` column; `age`, `fever_temp_c`, `duration_days` and comma-separated `risk_factors` are used when present.')
+    uploaded = st.file_uploader('Intake CSV', type=['csv'])
+    if uploaded is None:
+        return
+    data = uploaded.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    # reruns (any widget change) reuse the scored file instead of recomputing it
+    memo = st.session_state.setdefault('bulk_results', {})
+    if digest not in memo:
+        bar = st.progress(0.0, text='Scoring...')
+        try:
+            scored = score_csv(data, lambda done, total: bar.progress(done / max(total, 1), text=f'Scored {done:,} / {total:,} rows'))
+        except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+            bar.empty()
+            st.error(f'Could not score this file: {e}')
+            return
+        bar.empty()
+        memo[digest] = scored
+        for old in list(memo)[:-BULK_MEMO_FILES]:
+            del memo[old]
+    scored = memo[digest]
+    errors = int(scored['triage_error'].notna().sum())
+    st.success(f'{len(scored):,} rows scored' + (f', {errors:,} with errors' if errors else ''))
+    st.write(scored['predicted_triage'].value_counts().rename_axis('triage').rename('rows'))
+    st.dataframe(scored.head(200), use_container_width=True)
+    st.download_button('Download results (CSV)', scored.to_csv(index=False).encode('utf-8'),
+                       file_name=f"{uploaded.name.rsplit('.', 1)[0]}_triaged.csv", mime='text/csv')
+
+mode = st.radio('Mode', ['Single case', 'Bulk CSV upload'], horizontal=True, label_visibility='collapsed')
+if mode == 'Bulk CSV upload':
+    bulk_mode()
+    st.stop()
 
 # --- New function to check for a demo case ---
 def find_demo_case(symptoms_text):
@@ -84,15 +156,10 @@ if submitted:
         # --- Original Model Logic ---
         else:
             txt = symptoms_text or ''
-            X = vectorizer.transform([txt])
-            try:
-                probs = clf.predict_proba(X)[0]
-            except Exception:
-                decision = clf.decision_function(X)[0]
-                probs = 1 / (1 + np.exp(-decision))
+            X = featurizer.transform([txt])
+            top_idx, top_probs = top_k(scorer.predict_proba(X), 5)
             labels = mlb.classes_
-            top_idx = np.argsort(-probs)[:5]
-            top = [(labels[i], float(probs[i])) for i in top_idx]
+            top = [(labels[i], float(p)) for i, p in zip(top_idx[0], top_probs[0])]
             fever_val = None if (fever_temp_c is None or fever_temp_c == 0.0) else float(fever_temp_c)
             triage, redflag = triage_from_rules(txt, float(age), fever_val, int(duration_days), risks)
 
@@ -0,0 +1,189 @@
+# audit.py: non-blocking audit log of triage decisions, written as rotating JSONL by a background thread
+import atexit, datetime, gzip, json, os, queue, shutil, threading, time
+
+OVERFLOW_POLICIES = ('drop', 'drop_oldest', 'block')
+
+def audit_record(req, res, ts):
+    """One log line: the /triage request body plus the decision, so records.iter_records can replay it."""
+    return {**req.model_dump(), 'triage': res.triage, 'emergency': res.emergency, 'top_conditions': res.top_conditions,
+            'top_probabilities': res.top_probabilities, 'model_version': res.model_version,
+            'ts': datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat(timespec='milliseconds')}
+
+class AuditLog:
+    """Request handlers call `record()`, which only enqueues; a writer thread does the disk work.
+
+    The writer drains the queue in batches into <directory>/audit-<utc time>-<pid>-<seq>.jsonl,
+    flushing after every batch, and rotates to a new file after `max_bytes` or
+    `max_age_s` (0 = never), gzipping rotated files when `compress` is set. When the
+    queue is full, `overflow` decides: 'drop' the new record, 'drop_oldest' queued
+    record, or 'block' the caller for up to `block_timeout_s` before dropping.
+    Drops are counted in `stats()`. `close()` writes everything queued, then stops.
+    """
+
+    def __init__(self, directory, max_bytes=64 << 20, max_age_s=3600.0, compress=True, queue_size=10000,
+                 overflow='drop', block_timeout_s=0.1, batch_size=512, flush_interval_s=1.0):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'overflow must be one of {OVERFLOW_POLICIES}')
+        self.directory = directory
+        self.max_bytes, self.max_age_s, self.compress = max_bytes, max_age_s, compress
+        self.overflow, self.block_timeout_s = overflow, block_timeout_s
+        self.batch_size, self.flush_interval_s = batch_size, flush_interval_s
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._counts = {'queued': 0, 'written': 0, 'dropped': 0, 'files': 0, 'write_errors': 0}
+        self._file = self._path = None
+        self._opened = self._seq = 0
+        self._compressors = []
+        self._closed = False
+        # records between their closed check and their enqueue; close() waits for
+        # them so none lands behind the stop sentinel, where it would never be written
+        self._state = threading.Condition()
+        self._in_flight = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+
+    def record(self, req, res, wait=True):
+        """Queue one decision; serialization happens on the writer thread.
+
+        True when queued, False when dropped. With wait=False (callers on an
+        event loop) the 'block' policy never waits: a full queue returns None
+        and the caller retries with wait=True off the loop.
+        """
+        with self._state:
+            if self._closed:
+                return False
+            self._in_flight += 1
+        try:
+            return self._enqueue((req, res, time.time()), wait)
+        finally:
+            with self._state:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._state.notify_all()
+
+    def _enqueue(self, item, wait):
+        try:
+            if self.overflow == 'block' and not wait:
+                self._queue.put_nowait(item)
+            elif self.overflow == 'block':
+                self._queue.put(item, timeout=self.block_timeout_s)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow == 'block' and not wait:
+                return None
+            if self.overflow != 'drop_oldest':
+                self._count('dropped')
+                return False
+            try:
+                self._queue.get_nowait()
+                self._count('dropped')
+                self._queue.put_nowait(item)
+            except (queue.Empty, queue.Full):
+                self._count('dropped')
+                return False
+        self._count('queued')
+        return True
+
+    def _open(self):
+        self._seq += 1
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S')
+        # the pid keeps files apart when several server workers share the directory
+        self._path = os.path.join(self.directory, f'audit-{stamp}-{os.getpid()}-{self._seq:04d}.jsonl')
+        self._file = open(self._path, 'a', encoding='utf-8')
+        self._opened = time.monotonic()
+        self._count('files')
+
+    def _rotate(self):
+        self._file.close()
+        path, self._file = self._path, None
+        if self.compress:
+            # gzip off the writer thread so the queue keeps draining meanwhile
+            t = threading.Thread(target=_gzip_file, args=(path,), name='audit-gzip', daemon=True)
+            t.start()
+            self._compressors = [c for c in self._compressors if c.is_alive()] + [t]
+
+    def _write(self, items):
+        if self._file is not None and ((self.max_bytes and self._file.tell() >= self.max_bytes)
+                                       or (self.max_age_s and time.monotonic() - self._opened >= self.max_age_s)):
+            self._rotate()
+        if not items:
+            return
+        if self._file is None:
+            self._open()
+        try:
+            self._file.write(''.join(json.dumps(audit_record(*item)) + '\n' for item in items))
+            self._file.flush()
+            self._count('written', len(items))
+        except (OSError, ValueError, TypeError):
+            self._count('write_errors', len(items))
+
+    def _run(self):
+        while True:
+            items = []
+            try:
+                items.append(self._queue.get(timeout=self.flush_interval_s))
+                while len(items) < self.batch_size:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            stop = any(item is None for item in items)
+            self._write([item for item in items if item is not None])
+            if stop:
+                return
+
+    def close(self, timeout=10.0):
+        """Stop accepting records, write out the queue, close (and compress) the last file."""
+        with self._state:
+            if self._closed:
+                return
+            self._closed = True
+            self._state.wait_for(lambda: not self._in_flight, timeout)
+        try:
+            self._queue.put(None, timeout=timeout)  # sentinel after everything already queued
+        except queue.Full:
+            # the writer is stuck (e.g. a hung disk): make room rather than hang shutdown
+            try:
+                self._queue.get_nowait()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
+        if self._file is not None:
+            self._rotate()
+        for t in self._compressors:
+            t.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        return {**counts, 'pending': self._queue.qsize(), 'overflow': self.overflow, 'directory': self.directory}
+
+def _gzip_file(path):
+    with open(path, 'rb') as src, gzip.open(f'{path}.gz.tmp', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(f'{path}.gz.tmp', f'{path}.gz')
+    os.remove(path)
+
+def from_env(environ=os.environ):
+    """An AuditLog configured from MEDTRIAGE_AUDIT_* variables, or None when MEDTRIAGE_AUDIT_DIR is unset."""
+    directory = environ.get('MEDTRIAGE_AUDIT_DIR')
+    if not directory:
+        return None
+    return AuditLog(directory,
+                    max_bytes=int(float(environ.get('MEDTRIAGE_AUDIT_MAX_MB', '64')) * (1 << 20)),
+                    max_age_s=float(environ.get('MEDTRIAGE_AUDIT_ROTATE_S', '3600')),
+                    compress=environ.get('MEDTRIAGE_AUDIT_COMPRESS', '1').lower() not in ('0', 'false', 'no'),
+                    queue_size=int(environ.get('MEDTRIAGE_AUDIT_QUEUE', '10000')),
+                    overflow=environ.get('MEDTRIAGE_AUDIT_OVERFLOW', 'drop'),
+                    block_timeout_s=float(environ.get('MEDTRIAGE_AUDIT_BLOCK_MS', '100')) / 1e3)
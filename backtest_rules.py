@@ -0,0 +1,137 @@
+# backtest_rules.py: compare a candidate rule set with the current one over the dataset and request logs
+import argparse, csv, json, sys, time
+import numpy as np
+import pandas as pd
+from records import CASE_FIELDS, iter_records
+from rules import RuleSet, TRIAGE_LABELS, risk_column, symptom_column, triage_from_rules
+from score_bulk import ID_FIELDS
+
+NUMERIC_FIELDS = ('age', 'fever_temp_c', 'duration_days')
+
+def _frame(path, fmt=None):
+    """(DataFrame of raw case fields, number of unreadable records) for a .csv or .jsonl file."""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    if fmt == 'csv':
+        wanted = set(CASE_FIELDS + ID_FIELDS)
+        # text columns stay strings; numeric ones go through the C parser and
+        # only fall back to object dtype if a value is not a number
+        text_cols = {c: str for c in wanted if c not in NUMERIC_FIELDS}
+        df = pd.read_csv(path, dtype=text_cols, keep_default_na=False, na_values={c: [''] for c in NUMERIC_FIELDS},
+                         encoding='utf-8-sig', usecols=lambda c: c in wanted)
+        return df, 0
+    recs = list(iter_records(path, 'jsonl'))
+    good = [r for r in recs if '_error' not in r]
+    return pd.DataFrame.from_records(good), len(recs) - len(good)
+
+def load_cases(path, fmt=None):
+    """Columns ready for RuleSet.evaluate, normalised like records.case_from_record."""
+    df, unreadable = _frame(path, fmt)
+    n = len(df)
+    bad = np.zeros(n, dtype=bool)
+    nums = {}
+    for name in NUMERIC_FIELDS:
+        raw = df[name] if name in df else pd.Series(np.nan, index=df.index)
+        nums[name] = raw if pd.api.types.is_numeric_dtype(raw) else pd.to_numeric(raw, errors='coerce')
+        if nums[name] is not raw:
+            # values that are present but not numbers are rejected, as case_from_record would
+            bad |= (raw.notna() & (raw != '')).to_numpy() & nums[name].isna().to_numpy()
+    ids = pd.Series([None] * n, dtype=object)
+    for f in reversed(ID_FIELDS):
+        if f in df:
+            ids = df[f].where(df[f].notna() & (df[f] != ''), ids)
+    text = lambda name: df[name].where(df[name].notna(), '').tolist() if name in df else [''] * n
+    return {
+        'symptoms_text': text('symptoms_text'),
+        'age': nums['age'].fillna(25.0).to_numpy(float),
+        'fever_temp_c': nums['fever_temp_c'].to_numpy(float),
+        'duration_days': np.trunc(nums['duration_days'].fillna(3).to_numpy(float)),
+        'risk_factors': text('risk_factors'),
+        'id': ids.tolist(),
+        'valid': ~bad,
+        'unreadable': unreadable,
+    }
+
+def evaluate(rules, cases):
+    return rules.evaluate(*(cases[f] for f in CASE_FIELDS))[0]
+
+def prepare(cases):
+    """Share the text scans between the rule sets: phrase lists they have in common are matched once."""
+    return {**cases, 'symptoms_text': symptom_column(cases['symptoms_text']), 'risk_factors': risk_column(cases['risk_factors'])}
+
+def transition_matrix(before, after):
+    labels = TRIAGE_LABELS + sorted((set(before) | set(after)) - set(TRIAGE_LABELS))
+    index = {l: i for i, l in enumerate(labels)}
+    m = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    np.add.at(m, (pd.Series(before).map(index).to_numpy(), pd.Series(after).map(index).to_numpy()), 1)
+    return labels, m
+
+def format_matrix(labels, m):
+    width = max(len(l) for l in labels + ['current \\ candidate']) + 2
+    lines = ['current \\ candidate'.ljust(width) + ''.join(l.rjust(width) for l in labels)]
+    lines += [a.ljust(width) + ''.join(str(v).rjust(width) for v in row) for a, row in zip(labels, m)]
+    return '\n'.join(lines)
+
+def verify(rules, cases, n):
+    """Rows among the first n where the batch evaluator disagrees with triage_from_rules."""
+    labels = evaluate(rules, {f: cases[f][:n] for f in CASE_FIELDS})
+    bad = []
+    for i, label in enumerate(labels):
+        fever = cases['fever_temp_c'][i]
+        ref = triage_from_rules(cases['symptoms_text'][i], cases['age'][i], None if np.isnan(fever) else fever,
+                                int(cases['duration_days'][i]), [r.strip() for r in cases['risk_factors'][i].split(',')]
+                                if isinstance(cases['risk_factors'][i], str) else cases['risk_factors'][i])[0]
+        if ref != label:
+            bad.append(i)
+    return bad
+
+def main(args):
+    current = RuleSet.current()
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = current.updated(json.load(f))
+    before_all, after_all, changed, sources = [], [], [], {}
+    load_s = eval_s = 0.0
+    for path in args.inputs:
+        t0 = time.perf_counter()
+        cases = load_cases(path)
+        keep = np.flatnonzero(cases['valid'])
+        if len(keep) < len(cases['valid']):
+            cases = {k: ([v[i] for i in keep] if isinstance(v, list) else v[keep]) if k not in ('valid', 'unreadable') else v for k, v in cases.items()}
+        t1 = time.perf_counter()
+        prepared = prepare(cases)
+        before, after = evaluate(current, prepared), evaluate(candidate, prepared)
+        t2 = time.perf_counter()
+        load_s, eval_s = load_s + t1 - t0, eval_s + t2 - t1
+        if args.verify:
+            mismatched = verify(current, cases, args.verify)
+            if mismatched:
+                sys.exit(f'{path}: batch evaluator disagrees with triage_from_rules on rows {mismatched[:10]}')
+        diff = np.flatnonzero(before != after)
+        changed += [(path, int(keep[i]), cases['id'][i], cases['symptoms_text'][i], before[i], after[i]) for i in diff]
+        before_all.append(before)
+        after_all.append(after)
+        sources[path] = {'rows': len(before), 'changed': len(diff), 'skipped': int(len(cases['valid']) - len(keep) + cases['unreadable'])}
+    before, after = np.concatenate(before_all), np.concatenate(after_all)
+    labels, m = transition_matrix(before, after)
+    print(format_matrix(labels, m))
+    for row in changed[:args.show]:
+        print(f'  {row[0]}:{row[1]} {row[2] or ""} {row[4]} -> {row[5]}  {row[3][:100]}')
+    if args.changed_out:
+        with open(args.changed_out, 'w', newline='', encoding='utf-8') as f:
+            w = csv.writer(f)
+            w.writerow(['source', 'row', 'id', 'symptoms_text', 'current', 'candidate'])
+            w.writerows(changed)
+    rows = len(before)
+    print({'rows': rows, 'changed': len(changed), 'sources': sources, 'transitions': {f'{labels[i]} -> {labels[j]}': int(m[i, j])
+           for i, j in zip(*np.nonzero(m)) if i != j}, 'load_s': round(load_s, 2), 'evaluate_s': round(eval_s, 2),
+           'rows_per_s': round(rows / eval_s) if eval_s else None, 'changed_out': args.changed_out})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest a candidate triage rule set against the current rules')
+    parser.add_argument('inputs', nargs='*', default=['medtriage_dataset.csv'], help='dataset CSVs and/or JSONL request logs')
+    parser.add_argument('--candidate', type=str, required=True,
+                        help='JSON of RuleSet fields to replace, plus optional {"add": {...}, "remove": {...}} phrase edits')
+    parser.add_argument('--changed-out', type=str, default=None, help='CSV of every row whose triage label changes')
+    parser.add_argument('--show', type=int, default=10, help='changed rows to print')
+    parser.add_argument('--verify', type=int, default=0, help='check the batch evaluator against triage_from_rules on the first N rows of each input')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,133 @@
+# benchmarks/bench_backend.py: /triage throughput of the thread and process inference backends by CPU count
+# Usage: python -m benchmarks.bench_backend --cores 1 2 4 8 --concurrency 32
+import argparse, asyncio, json, os, socket, subprocess, sys, time, urllib.request
+import numpy as np
+from benchmarks.loadgen import Connection, load_payloads
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _wait_ready(port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1) as r:
+                if r.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+def _cpu_seconds(pid):
+    """user + system CPU seconds of `pid` and of each of its child processes."""
+    def own(p):
+        with open(f'/proc/{p}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    children = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            children += [int(c) for c in f.read().split()]
+    return own(pid), {c: own(c) for c in children}
+
+async def closed_loop(port, payloads, concurrency, duration, warmup, pid):
+    """`concurrency` keep-alive clients, each sending its next request as soon as the last one returns."""
+    latencies, errors = [], [0]
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    measure_from, stop_at = start + warmup, start + warmup + duration
+
+    async def client(i):
+        conn = Connection('127.0.0.1', port, '/triage')
+        j = i
+        while True:
+            t0 = loop.time()
+            if t0 >= stop_at:
+                break
+            try:
+                status = await conn.request(payloads[j % len(payloads)])
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+                status = None
+                conn.close()
+            if t0 >= measure_from:
+                if status == 200:
+                    latencies.append(loop.time() - t0)
+                else:
+                    errors[0] += 1
+            j += concurrency
+        conn.close()
+
+    async def cpu_window():
+        await asyncio.sleep(warmup)
+        before = _cpu_seconds(pid)
+        await asyncio.sleep(duration)
+        return before, _cpu_seconds(pid)
+
+    (before, after), *_ = await asyncio.gather(cpu_window(), *(client(i) for i in range(concurrency)))
+    n = max(len(latencies), 1)
+    server_cpu = after[0] - before[0]
+    worker_cpu = sum(t - before[1].get(c, 0.0) for c, t in after[1].items())
+    lat_ms = np.asarray(latencies) * 1e3
+    return {'requests': len(latencies), 'errors': errors[0], 'throughput': round(len(latencies) / duration, 1),
+            # CPU per request in the server process and in its worker processes
+            'server_cpu_us': round(server_cpu / n * 1e6, 1), 'worker_cpu_us': round(worker_cpu / n * 1e6, 1),
+            'p50_ms': round(float(np.percentile(lat_ms, 50)), 2) if len(lat_ms) else None,
+            'p99_ms': round(float(np.percentile(lat_ms, 99)), 2) if len(lat_ms) else None}
+
+def run_one(backend, cores, args, payloads):
+    port = _free_port()
+    backend, _, microbatch = backend.partition('+')
+    env = {**os.environ, 'MEDTRIAGE_BACKEND': backend, 'MEDTRIAGE_PROCESS_WORKERS': str(args.process_workers or cores),
+           'MEDTRIAGE_MICROBATCH': '1' if microbatch else '0',
+           'MEDTRIAGE_CACHE_SIZE': '0'}  # every request is scored, not answered from the cache
+    cpus = sorted(os.sched_getaffinity(0))
+    server_cpus = cpus[:cores]
+    # the server (and its worker processes, which inherit the mask) gets `cores` CPUs;
+    # the load generator runs on the others when there are any
+    cmd = ['taskset', '-c', ','.join(map(str, server_cpus)), sys.executable, '-W', 'ignore', '-m', 'uvicorn', 'serve:app',
+           '--port', str(port), '--log-level', 'warning']
+    server = subprocess.Popen(cmd, env=env)
+    try:
+        _wait_ready(port)
+        rest = [c for c in cpus if c not in server_cpus]
+        if rest:
+            os.sched_setaffinity(0, rest)
+        result = asyncio.run(closed_loop(port, payloads, args.concurrency, args.duration, args.warmup, server.pid))
+    finally:
+        os.sched_setaffinity(0, cpus)
+        server.terminate()
+        server.wait()
+    return {'backend': backend + ('+microbatch' if microbatch else ''), 'cores': cores, 'workers': (args.process_workers or cores) if backend == 'process' else None,
+            'client_shares_cpus': not rest, **result}
+
+def main(args):
+    available = len(os.sched_getaffinity(0))
+    payloads = load_payloads(args)
+    rows = []
+    for cores in args.cores:
+        if cores > available:
+            print({'skipped_cores': cores, 'available': available})
+            continue
+        for backend in args.backends:
+            rows.append(run_one(backend, cores, args, payloads))
+            print(rows[-1])
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cores', type=int, nargs='+', default=[1, 2, 4, 8], help='CPUs the server may use (taskset)')
+    parser.add_argument('--backends', nargs='+', choices=['thread', 'thread+microbatch', 'process'],
+                        default=['thread', 'thread+microbatch', 'process'])
+    parser.add_argument('--process-workers', type=int, default=0, help='process backend workers (default: one per server core)')
+    parser.add_argument('--concurrency', type=int, default=32, help='clients with one request in flight each')
+    parser.add_argument('--duration', type=float, default=15.0, help='measured seconds per configuration')
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--replay', type=str, default=None, help='JSONL of /triage request bodies (default: synthesize)')
+    parser.add_argument('--synthesize', type=int, default=2000)
+    parser.add_argument('--out', type=str, default=None)
+    args = parser.parse_args()
+    main(args)
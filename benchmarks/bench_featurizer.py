@@ -0,0 +1,34 @@
+# benchmarks/bench_featurizer.py: TfidfVectorizer.transform vs the precompiled TfidfFeaturizer
+# Usage: python -m benchmarks.bench_featurizer [--data medtriage_dataset.csv]
+import argparse, warnings
+import pandas as pd
+from joblib import load
+from benchmarks.timing import best_of
+from featurizer import TfidfFeaturizer, check_parity
+
+def main(args):
+    warnings.filterwarnings('ignore')
+    texts = pd.read_csv(args.data)['symptoms_text'].fillna('').astype(str).tolist()
+    vectorizer = load('vectorizer.joblib')
+    featurizer = TfidfFeaturizer.from_vectorizer(vectorizer)
+    print({'texts': len(texts), 'mismatched': len(check_parity(featurizer, vectorizer, texts))})
+
+    singles = texts[:args.n_single]
+    print(f"{'mode':<16} {'sklearn_tps':>12} {'featurizer_tps':>15} {'speedup':>8}")
+    s_ref = best_of(lambda: [vectorizer.transform([t]) for t in singles], args.repeat)
+    s_new = best_of(lambda: [featurizer.transform([t]) for t in singles], args.repeat)
+    print(f"{'single':<16} {len(singles) / s_ref:>12.0f} {len(singles) / s_new:>15.0f} {s_ref / s_new:>7.1f}x")
+    for bs in args.batch_sizes:
+        batches = [texts[i:i + bs] for i in range(0, len(texts), bs)]
+        b_ref = best_of(lambda: [vectorizer.transform(b) for b in batches], args.repeat)
+        b_new = best_of(lambda: [featurizer.transform(b) for b in batches], args.repeat)
+        print(f"{'batch=' + str(bs):<16} {len(texts) / b_ref:>12.0f} {len(texts) / b_new:>15.0f} {b_ref / b_new:>7.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--n-single', type=int, default=1000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32, 256, 5000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,51 @@
+# benchmarks/bench_memory.py: resident memory per worker, joblib artifacts vs the memory-mapped flat artifact
+# Usage: python -m benchmarks.bench_memory [--workers 1 4 16]
+import argparse, multiprocessing as mp, warnings
+
+def _smaps():
+    # Rss counts shared pages in full; Pss splits each shared page between the
+    # processes mapping it, so sum(Pss) is the real footprint of N workers.
+    out = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Shared_Clean:'):
+                out[parts[0][:-1].lower()] = int(parts[1]) / 1024.0
+    return out
+
+def _worker(flat, ready, release, results):
+    warnings.filterwarnings('ignore')
+    import inference  # import cost is measured separately from the model
+    before = _smaps()
+    model = inference.TriageModel.load('.', flat=flat)
+    model.predict_top(['fever, productive cough, shortness of breath'], 3)
+    ready.wait()  # every worker has loaded before anyone measures
+    after = _smaps()
+    results.put({'rss': after['rss'], 'pss': after['pss'], 'model_rss': after['rss'] - before['rss'], 'model_pss': after['pss'] - before['pss']})
+    release.wait()
+
+def measure(n, flat):
+    ctx = mp.get_context('spawn')
+    ready, release, results = ctx.Barrier(n), ctx.Barrier(n + 1), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(flat, ready, release, results)) for _ in range(n)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in range(n)]
+    release.wait()
+    for p in procs:
+        p.join()
+    mean = lambda k: sum(r[k] for r in rows) / n
+    return {'rss': mean('rss'), 'pss': mean('pss'), 'model_rss': mean('model_rss'), 'model_pss': mean('model_pss'), 'total_pss': n * mean('pss')}
+
+def main(args):
+    print(f"{'artifact':<8} {'workers':>7} {'rss_mb':>8} {'pss_mb':>8} {'model_rss_mb':>13} {'model_pss_mb':>13} {'total_pss_mb':>13}")
+    for n in args.workers:
+        for name, flat in (('joblib', False), ('flat', True)):
+            r = measure(n, flat)
+            print(f"{name:<8} {n:>7} {r['rss']:>8.1f} {r['pss']:>8.1f} {r['model_rss']:>13.2f} {r['model_pss']:>13.2f} {r['total_pss']:>13.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,40 @@
+# benchmarks/bench_metrics.py: cost of the /metrics instrumentation on the serving path
+# Usage: python -m benchmarks.bench_metrics [--requests 2000]
+import argparse, warnings
+from benchmarks.timing import best_of
+
+def main(args):
+    warnings.filterwarnings('ignore')
+    import serve
+    from fastapi.testclient import TestClient
+    from metrics import REGISTRY, Histogram, Registry
+
+    h = Histogram('bench_seconds', 'bench', ['stage'], registry=Registry())
+    n = 200_000
+    per_observe = best_of(lambda: [h.observe(0.0003, 'score') for _ in range(n)], args.repeat) / n
+
+    serve.response_cache.maxsize = 0  # measure scoring, not cache hits
+    req = serve.TriageRequest(symptoms_text='fever 39C, productive cough, short of breath', age=54, risk_factors=['smoker'])
+    client = TestClient(serve.app)
+    body = req.model_dump()
+    results = {}
+    for enabled in (False, True, False, True):
+        REGISTRY.enabled = enabled
+        score = best_of(lambda: [serve.score_requests([req]) for _ in range(args.requests)], args.repeat) / args.requests
+        http = best_of(lambda: [client.post('/triage', json=body) for _ in range(args.requests // 4)], args.repeat) / (args.requests // 4)
+        results[enabled] = (score, http)  # second pass of each setting wins, after warm-up
+    REGISTRY.enabled = True
+    render = best_of(lambda: client.get('/metrics'), args.repeat)
+
+    print({'observe_us': round(per_observe * 1e6, 3), 'scrape_ms': round(render * 1e3, 3)})
+    print(f"{'path':<16} {'off_us':>9} {'on_us':>9} {'overhead':>9}")
+    for i, name in enumerate(('score_requests', 'POST /triage')):
+        off, on = results[False][i], results[True][i]
+        print(f"{name:<16} {off * 1e6:>9.1f} {on * 1e6:>9.1f} {(on - off) / off:>8.1%}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args)
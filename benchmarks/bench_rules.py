@@ -0,0 +1,70 @@
+# benchmarks/bench_rules.py: per-phrase substring scans vs the one-pass combined rule regex
+# Usage: python -m benchmarks.bench_rules [--data medtriage_dataset.csv]
+import argparse, random, time
+import pandas as pd
+import rules
+from rules import PhraseMatcher
+
+def rule_phrases():
+    return {'red_flag': list(rules.RED_FLAGS), 'urgent': list(rules.URGENT_PHRASES), 'urinary': list(rules.URINARY_PHRASES),
+            'urinary_pain': list(rules.URINARY_PAIN_PHRASES), 'gp': list(rules.GP_PHRASES)}
+
+def grow_phrases(base, words, n_total, rng):
+    # pad the red-flag list with plausible 2-3 word phrases built from dataset words
+    phrases = {c: list(p) for c, p in base.items()}
+    have = {p for ps in phrases.values() for p in ps}
+    while len(have) < n_total:
+        p = ' '.join(rng.sample(words, rng.randint(2, 3)))
+        if p not in have:
+            have.add(p)
+            phrases['red_flag'].append(p)
+    return phrases
+
+def naive_categories(pairs, txt):
+    return {c for p, c in pairs if p in txt}
+
+def timeit(fn, texts, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for t in texts:
+            fn(t)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(texts) * 1e6
+
+def main(args):
+    rng = random.Random(0)
+    df = pd.read_csv(args.data)
+    corpus = [str(t).lower() for t in df['symptoms_text']]
+    words = sorted({w for t in corpus for w in t.replace(',', ' ').split() if w.isalpha() and len(w) > 2})
+    base = rule_phrases()
+
+    # parity on the real rules over the dataset
+    pairs = [(p, c) for c, ps in base.items() for p in ps]
+    mismatches = sum(naive_categories(pairs, t) != rules._MATCHER.categories(t) for t in corpus)
+    print({'parity_rows': len(corpus), 'mismatches': mismatches})
+
+    print(f"{'phrases':>8} {'text_len':>8} {'naive_us':>9} {'combined_us':>12} {'speedup':>8}")
+    for n_phrases in args.phrases:
+        phrases = grow_phrases(base, words, n_phrases, rng)
+        matcher = PhraseMatcher(phrases)
+        pairs = [(p, c) for c, ps in phrases.items() for p in ps]
+        for length in args.lengths:
+            texts = []
+            for _ in range(args.n_texts):
+                t = ''
+                while len(t) < length:
+                    t += rng.choice(corpus) + ' '
+                texts.append(t[:length])
+            naive_us = timeit(lambda t: naive_categories(pairs, t), texts)
+            combined_us = timeit(matcher.categories, texts)
+            print(f'{len(pairs):>8} {length:>8} {naive_us:>9.2f} {combined_us:>12.2f} {naive_us / combined_us:>7.2f}x')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--phrases', type=int, nargs='+', default=[33, 100, 300, 1000])
+    parser.add_argument('--lengths', type=int, nargs='+', default=[64, 256, 1024, 4096])
+    parser.add_argument('--n-texts', type=int, default=300)
+    args = parser.parse_args()
+    main(args)
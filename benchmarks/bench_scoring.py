@@ -0,0 +1,37 @@
+# benchmarks/bench_scoring.py: OneVsRestClassifier.predict_proba vs the fused LinearScorer
+# Usage: python -m benchmarks.bench_scoring [--data medtriage_dataset.csv --split test]
+import argparse, warnings
+import numpy as np
+import pandas as pd
+from joblib import load
+from benchmarks.timing import best_of
+from inference import LinearScorer
+
+def main(args):
+    warnings.filterwarnings('ignore')
+    df = pd.read_csv(args.data)
+    texts = df[df.split == args.split]['symptoms_text'].fillna('').tolist()
+    vectorizer, clf = load('vectorizer.joblib'), load('classifier.joblib')
+    scorer = LinearScorer.from_classifier(clf)
+    X = vectorizer.transform(texts)
+    rows = [X[i] for i in range(X.shape[0])]
+
+    ref, fused = clf.predict_proba(X), scorer.predict_proba(X)
+    print({'rows': len(texts), 'max_abs_diff': float(np.abs(ref - fused).max()),
+           'same_top3': bool((np.argsort(-ref, axis=1)[:, :3] == np.argsort(-fused, axis=1)[:, :3]).all())})
+
+    single_ovr = best_of(lambda: [clf.predict_proba(r) for r in rows], args.repeat) / len(rows)
+    single_fused = best_of(lambda: [scorer.predict_proba(r) for r in rows], args.repeat) / len(rows)
+    batch_ovr = best_of(lambda: clf.predict_proba(X), args.repeat)
+    batch_fused = best_of(lambda: scorer.predict_proba(X), args.repeat)
+    print(f"{'path':<10} {'ovr_ms':>9} {'fused_ms':>9} {'speedup':>8}")
+    print(f"{'single':<10} {single_ovr * 1e3:>9.4f} {single_fused * 1e3:>9.4f} {single_ovr / single_fused:>7.1f}x")
+    print(f"{'batch':<10} {batch_ovr * 1e3:>9.3f} {batch_fused * 1e3:>9.3f} {batch_ovr / batch_fused:>7.1f}x  ({len(rows)} rows)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--split', type=str, default='test')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args)
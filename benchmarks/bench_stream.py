@@ -0,0 +1,88 @@
+# benchmarks/bench_stream.py: /triage/stream throughput and server memory as the upload grows
+# Usage: python -m benchmarks.bench_stream [--lines 10000 100000]
+import argparse, asyncio, csv, json, os, socket, subprocess, sys, time
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+def _lines(data):
+    with open(data, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+    return [(json.dumps({'symptoms_text': r['symptoms_text'], 'age': float(r['age']), 'duration_days': int(r['duration_days'])}) + '\n').encode()
+            for r in rows]
+
+async def stream(port, lines, n, pid):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'POST /triage/stream HTTP/1.1\r\nHost: bench\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n')
+    peak, first, got = [0.0], [None], [0]
+    t0 = time.perf_counter()
+
+    async def upload():
+        # written chunk by chunk with drain(), so the client holds no more than
+        # the socket buffers; server backpressure slows this loop down
+        for start in range(0, n, 200):
+            body = b''.join(lines[i % len(lines)] for i in range(start, min(start + 200, n)))
+            writer.write(b'%x\r\n%s\r\n' % (len(body), body))
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def download():
+        while (await reader.readline()).strip():  # status line and headers
+            pass
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                return
+            chunk = await reader.readexactly(size + 2)
+            got[0] += chunk.count(b'\n') - 1
+            if first[0] is None:
+                first[0] = time.perf_counter() - t0
+
+    async def sample():
+        while True:
+            peak[0] = max(peak[0], _rss_mb(pid))
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample())
+    await asyncio.gather(upload(), download())
+    sampler.cancel()
+    writer.close()
+    elapsed = time.perf_counter() - t0
+    return {'lines': n, 'results': got[0], 'seconds': round(elapsed, 2), 'lines_per_s': round(n / elapsed),
+            'first_result_ms': round(first[0] * 1e3, 1), 'peak_rss_mb': round(peak[0], 1)}
+
+def main(args):
+    port = _free_port()
+    env = {**os.environ, 'MEDTRIAGE_CACHE_SIZE': '0'}
+    server = subprocess.Popen([sys.executable, '-W', 'ignore', '-m', 'uvicorn', 'serve:app', '--port', str(port), '--log-level', 'warning'], env=env)
+    try:
+        for _ in range(200):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        lines = _lines(args.data)
+        print({'idle_rss_mb': round(_rss_mb(server.pid), 1)})
+        for n in args.lines:
+            print(asyncio.run(stream(port, lines, n, server.pid)))
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    args = parser.parse_args()
+    main(args)
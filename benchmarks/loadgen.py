@@ -0,0 +1,184 @@
+# benchmarks/loadgen.py: open-loop load generator for POST /triage over keep-alive connections
+# Usage: uvicorn serve:app --port 8000 &
+#        python -m benchmarks.loadgen --rate 200 --duration 20
+#        python -m benchmarks.loadgen --replay intake.jsonl --start-rate 50 --step 1.5 --max-rate 2000
+import argparse, asyncio, json, random, sys
+from collections import Counter
+from urllib.parse import urlsplit
+import numpy as np
+from records import case_from_record, iter_records
+
+QUANTILES = (50, 90, 99, 99.9)
+
+def load_payloads(args):
+    if args.replay:
+        recs = [r for r in iter_records(args.replay, 'jsonl') if '_error' not in r]
+        payloads = [case_from_record(r) for r in recs]
+    else:
+        import make_dataset  # seeds its RNGs on import, so synthesized payloads are reproducible
+        payloads = [case_from_record(make_dataset.generate_case(i + 1)) for i in range(args.synthesize)]
+    if not payloads:
+        raise SystemExit('no payloads to send')
+    return [json.dumps(p).encode('utf-8') for p in payloads]
+
+class Connection:
+    """One persistent HTTP/1.1 connection; one request in flight at a time."""
+
+    def __init__(self, host, port, path):
+        self.host, self.port, self.path = host, port, path
+        self.reader = self.writer = None
+
+    async def request(self, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = (f'POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n').encode('ascii')
+        self.writer.write(head + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('server closed the connection')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            headers[k.strip().lower()] = v.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+async def run_step(url, payloads, rate, duration, connections, arrival, timeout, seed):
+    """Send `rate * duration` requests on a fixed schedule and time each from its scheduled start.
+
+    Arrivals never wait for earlier responses (open loop): when every connection
+    is busy they queue, and that queueing counts towards their latency, so a
+    slow server cannot hide its own delay by slowing the client down.
+    """
+    u = urlsplit(url)
+    rng = random.Random(seed)
+    queue = asyncio.Queue()
+    latencies, errors = [], Counter()
+    max_backlog = 0
+    loop = asyncio.get_running_loop()
+
+    async def worker():
+        conn = Connection(u.hostname, u.port or 80, u.path or '/triage')
+        while True:
+            item = await queue.get()
+            if item is None:
+                conn.close()
+                return
+            scheduled, body = item
+            try:
+                status = await asyncio.wait_for(conn.request(body), timeout)
+                if status == 200:
+                    latencies.append(loop.time() - scheduled)
+                else:
+                    errors[f'http_{status}'] += 1
+            except asyncio.TimeoutError:
+                errors['timeout'] += 1
+                conn.close()
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+                errors['connection'] += 1
+                conn.close()
+
+    workers = [asyncio.create_task(worker()) for _ in range(connections)]
+    n = max(1, int(rate * duration))
+    t0 = loop.time()
+    at = t0
+    for i in range(n):
+        last = at
+        delay = at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        queue.put_nowait((at, payloads[i % len(payloads)]))
+        max_backlog = max(max_backlog, queue.qsize())
+        at += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+    for _ in workers:
+        queue.put_nowait(None)
+    # elapsed runs until the last response, so a backlog the server cannot clear lowers throughput
+    await asyncio.gather(*workers)
+    elapsed = loop.time() - t0
+    ok = len(latencies)
+    lat_ms = np.asarray(latencies) * 1e3
+    # Poisson arrivals only average `rate`; judge throughput against what was actually offered
+    offered = n / max(last - t0 + 1.0 / rate, 1e-9)
+    out = {'target_rate': rate, 'offered_rate': round(offered, 1), 'sent': n, 'ok': ok, 'errors': sum(errors.values()), 'error_rate': round(sum(errors.values()) / n, 4),
+           'error_kinds': dict(errors), 'throughput': round(ok / elapsed, 1), 'seconds': round(elapsed, 2), 'max_backlog': max_backlog}
+    for q in QUANTILES:
+        out[f'p{q:g}_ms'] = round(float(np.percentile(lat_ms, q)), 2) if ok else None
+    return out
+
+def saturated(step, args):
+    return (step['throughput'] < args.min_throughput_ratio * step['offered_rate'] or step['error_rate'] > args.max_error_rate
+            or (args.slo_p99_ms is not None and (step['p99_ms'] is None or step['p99_ms'] > args.slo_p99_ms)))
+
+def rate_steps(args):
+    if args.rate is not None:
+        return [args.rate]
+    rates, r = [], args.start_rate
+    while r <= args.max_rate:
+        rates.append(r)
+        r *= args.step
+    return rates
+
+def print_step(step, flag):
+    print(f"{step['target_rate']:>9.1f} {step['throughput']:>9.1f} {step['p50_ms'] or float('nan'):>8.2f} {step['p90_ms'] or float('nan'):>8.2f} "
+          f"{step['p99_ms'] or float('nan'):>8.2f} {step['p99.9_ms'] or float('nan'):>9.2f} {step['error_rate']:>7.2%} {step['max_backlog']:>8}{flag}", flush=True)
+
+def main(args):
+    payloads = load_payloads(args)
+    print(f'[loadgen] {len(payloads)} payloads -> {args.url}, {args.connections} connections, {args.arrival} arrivals', file=sys.stderr)
+    print(f"{'target/s':>9} {'achieved':>9} {'p50_ms':>8} {'p90_ms':>8} {'p99_ms':>8} {'p99.9_ms':>9} {'errors':>7} {'backlog':>8}")
+    steps, last_ok = [], None
+    for i, rate in enumerate(rate_steps(args)):
+        step = asyncio.run(run_step(args.url, payloads, rate, args.duration, args.connections, args.arrival, args.timeout, args.seed + i))
+        step['saturated'] = saturated(step, args)
+        steps.append(step)
+        print_step(step, '  SATURATED' if step['saturated'] else '')
+        if step['saturated']:
+            break
+        last_ok = rate
+    summary = {'url': args.url, 'payloads': len(payloads), 'connections': args.connections, 'max_sustained_rate': last_ok,
+               'saturated_at': steps[-1]['target_rate'] if steps[-1]['saturated'] else None}
+    print(summary)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({**summary, 'steps': steps}, f, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Open-loop load test for POST /triage')
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8000/triage')
+    parser.add_argument('--replay', type=str, default=None, help='JSONL of /triage request bodies (default: synthesize)')
+    parser.add_argument('--synthesize', type=int, default=2000, help='payloads to generate with make_dataset.generate_case')
+    parser.add_argument('--rate', type=float, default=None, help='single fixed arrival rate (requests/s)')
+    parser.add_argument('--start-rate', type=float, default=50.0)
+    parser.add_argument('--step', type=float, default=1.5, help='rate multiplier between steps')
+    parser.add_argument('--max-rate', type=float, default=5000.0)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per step')
+    parser.add_argument('--connections', type=int, default=64, help='keep-alive connections (max requests in flight)')
+    parser.add_argument('--arrival', choices=['uniform', 'poisson'], default='poisson')
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--slo-p99-ms', type=float, default=None, help='a step whose p99 exceeds this is saturated')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--min-throughput-ratio', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, default=None, help='write every step as JSON')
+    args = parser.parse_args()
+    main(args)
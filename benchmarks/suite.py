@@ -0,0 +1,164 @@
+# benchmarks/suite.py: reproducible speed benchmarks with a regression check against a stored baseline
+# Usage: python -m benchmarks.suite run [--out perf.json] [--save-baseline]
+#        python -m benchmarks.suite compare [--current perf.json] [--baseline perf_baseline.json] [--threshold 0.15]
+import argparse, asyncio, json, os, platform, statistics, subprocess, sys, time, warnings
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import sklearn
+from benchmarks.timing import best_of
+from records import case_from_record
+
+PERF_OUT = 'perf.json'
+BASELINE = 'perf_baseline.json'
+# a fresh interpreter per sample, so imports and artifact reads are really cold
+COLD_LOAD = ('import time; t0 = time.perf_counter(); from inference import TriageModel; '
+             'm = TriageModel.load({dir!r}, flat={flat}); print(time.perf_counter() - t0)')
+
+def _per_call(fn, items, repeat):
+    """Median per-call seconds for fn(item), keeping each item's fastest of `repeat` passes."""
+    best = np.full(len(items), np.inf)
+    for _ in range(repeat):
+        for i, item in enumerate(items):
+            t0 = time.perf_counter()
+            fn(item)
+            best[i] = min(best[i], time.perf_counter() - t0)
+    return best
+
+def _latency(name, samples):
+    return {f'{name}_p50_us': (float(np.percentile(samples, 50)) * 1e6, 'us', 'lower'),
+            f'{name}_p99_us': (float(np.percentile(samples, 99)) * 1e6, 'us', 'lower')}
+
+def bench_rules(cases, repeat):
+    from rules import triage_from_rules
+    fn = lambda: [triage_from_rules(c['symptoms_text'], c['age'], c['fever_temp_c'], c['duration_days'], c['risk_factors']) for c in cases]
+    return {'rules_cases_per_s': (len(cases) / best_of(fn, repeat), 'cases/s', 'higher')}
+
+def bench_model(model, texts, repeat):
+    out = {}
+    out.update(_latency('featurize_single', _per_call(lambda t: model.featurize([t]), texts, repeat)))
+    out['featurize_batch_rows_per_s'] = (len(texts) / best_of(lambda: model.featurize(texts), repeat), 'rows/s', 'higher')
+    X = model.featurize(texts)
+    rows = [X[i] for i in range(X.shape[0])]
+    out.update(_latency('score_single', _per_call(model.predict_proba, rows, repeat)))
+    out['score_batch_rows_per_s'] = (len(texts) / best_of(lambda: model.predict_proba(X), repeat), 'rows/s', 'higher')
+    return out
+
+def bench_cold_load(model_dir, samples):
+    out = {}
+    for name, flat in (('flat', 'True'), ('joblib', 'False')):
+        if flat == 'True' and not os.path.exists(os.path.join(model_dir, 'model_flat.bin')):
+            continue
+        times = [float(subprocess.run([sys.executable, '-c', COLD_LOAD.format(dir=model_dir, flat=flat)], capture_output=True,
+                                      text=True, check=True, cwd=os.getcwd()).stdout) for _ in range(samples)]
+        out[f'cold_load_{name}_ms'] = (statistics.median(times) * 1e3, 'ms', 'lower')
+    return out
+
+def bench_http(cases, repeat):
+    # the response cache would turn every repeat into a hit; measure the scoring path
+    os.environ['MEDTRIAGE_CACHE_SIZE'] = '0'
+    import httpx, serve
+
+    async def go():
+        transport = httpx.ASGITransport(app=serve.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            for c in cases[:20]:
+                await client.post('/triage', json=c)
+            best = np.full(len(cases), np.inf)
+            for _ in range(repeat):
+                for i, c in enumerate(cases):
+                    t0 = time.perf_counter()
+                    r = await client.post('/triage', json=c)
+                    best[i] = min(best[i], time.perf_counter() - t0)
+                    r.raise_for_status()
+            return best
+
+    return _latency('http_triage', asyncio.run(go()))
+
+def run(args):
+    warnings.filterwarnings('ignore')
+    from inference import TriageModel, artifact_fingerprint
+    df = pd.read_csv(args.data)
+    df = df[df.split == args.split]
+    cases = [case_from_record(rec) for rec in df.to_dict('records')]
+    texts = [c['symptoms_text'] for c in cases]
+    model = TriageModel.load(args.model_dir)
+
+    results = {}
+    t0 = time.perf_counter()
+    for name, fn in (('rules', lambda: bench_rules(cases, args.repeat)),
+                     ('model', lambda: bench_model(model, texts, args.repeat)),
+                     ('cold_load', lambda: bench_cold_load(args.model_dir, args.cold_samples)),
+                     ('http', lambda: bench_http(cases, args.repeat))):
+        results.update(fn())
+        print(f'[suite] {name} done ({time.perf_counter() - t0:.1f}s)', file=sys.stderr)
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'sklearn': sklearn.__version__,
+                        'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count()},
+        'inputs': {'data': args.data, 'data_sha256': artifact_fingerprint([args.data]), 'split': args.split, 'rows': len(cases),
+                   'model_version': model.version, 'repeat': args.repeat},
+        'results': {k: {'value': round(v, 3), 'unit': unit, 'better': better} for k, (v, unit, better) in results.items()},
+    }
+    for path in [args.out] + ([args.baseline] if args.save_baseline else []):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    print_results(report)
+    print({'out': args.out, 'baseline_saved': args.baseline if args.save_baseline else None})
+
+def print_results(report):
+    print(f"{'benchmark':<28} {'value':>12} unit")
+    for k, r in report['results'].items():
+        print(f"{k:<28} {r['value']:>12,.3f} {r['unit']}")
+
+def compare(current, baseline, threshold):
+    """Rows of (name, baseline, current, relative change, regressed); change > 0 is always worse."""
+    rows = []
+    for name, base in baseline['results'].items():
+        cur = current['results'].get(name)
+        if cur is None or not base['value']:
+            continue
+        change = (cur['value'] - base['value']) / base['value']
+        if base['better'] == 'higher':
+            change = -change
+        rows.append((name, base['value'], cur['value'], change, change > threshold))
+    return rows
+
+def main_compare(args):
+    with open(args.current) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if current['inputs'].get('data_sha256') != baseline['inputs'].get('data_sha256'):
+        print('warning: baseline was measured on a different dataset', file=sys.stderr)
+    if current['environment'] != baseline['environment']:
+        print('warning: baseline was measured in a different environment', file=sys.stderr)
+    rows = compare(current, baseline, args.threshold)
+    print(f"{'benchmark':<28} {'baseline':>12} {'current':>12} {'worse_by':>9}")
+    for name, base, cur, change, regressed in rows:
+        print(f"{name:<28} {base:>12,.3f} {cur:>12,.3f} {change:>8.1%}{'  REGRESSION' if regressed else ''}")
+    regressions = [r[0] for r in rows if r[4]]
+    print({'compared': len(rows), 'threshold': args.threshold, 'regressions': regressions})
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Speed benchmarks for rules, featurization, scoring, cold load and /triage')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('run')
+    p.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    p.add_argument('--split', type=str, default='test')
+    p.add_argument('--model-dir', type=str, default='.')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--cold-samples', type=int, default=5)
+    p.add_argument('--out', type=str, default=PERF_OUT)
+    p.add_argument('--baseline', type=str, default=BASELINE)
+    p.add_argument('--save-baseline', action='store_true', help='also store this run as the baseline')
+    p = sub.add_parser('compare')
+    p.add_argument('--current', type=str, default=PERF_OUT)
+    p.add_argument('--baseline', type=str, default=BASELINE)
+    p.add_argument('--threshold', type=float, default=0.15, help='flag results worse than the baseline by more than this fraction')
+    args = parser.parse_args()
+    if args.cmd == 'run':
+        run(args)
+    else:
+        sys.exit(main_compare(args))
@@ -0,0 +1,11 @@
+# benchmarks/timing.py: timing helpers shared by the benchmark scripts
+import time
+
+def best_of(fn, repeat):
+    """Fastest wall time in seconds of `repeat` calls to fn(), to keep scheduler noise out."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
@@ -0,0 +1,99 @@
+# cache.py: bounded in-process LRU/TTL cache for triage responses
+import threading, time
+from collections import OrderedDict
+
+def request_key(symptoms_text, age, fever_temp_c, duration_days, risk_factors):
+    # Only normalisations the model and rules are invariant to: both lowercase
+    # the text, no rule phrase or token starts or ends with whitespace, and
+    # risk factors are only tested for membership. sex/exposures are unused.
+    return ((symptoms_text or '').lower().strip(), float(age), None if fever_temp_c is None else float(fever_temp_c),
+            duration_days, tuple(sorted(set(risk_factors or []))))
+
+class ResponseCache:
+    """Thread-safe LRU cache with an optional per-entry time to live.
+
+    The cache is bound to a model version; binding a different version drops
+    every entry, so responses from an old model are never served.
+    """
+
+    def __init__(self, maxsize=4096, ttl=None):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = float(ttl) if ttl else None
+        self.version = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def bind(self, version):
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.invalidations += 1
+                self._data.clear()
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get(self, key, wait=True):
+        # wait=False (event-loop callers): a lookup that would wait for the lock is a miss
+        if not self._lock.acquire(blocking=wait):
+            return None
+        try:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+        finally:
+            self._lock.release()
+
+    def put(self, key, value, version=None, wait=True):
+        # version: the model that produced value; a result computed by a model
+        # that was swapped out mid-request is dropped instead of cached.
+        # wait=False skips the put rather than wait for the lock.
+        if self.maxsize == 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            if version is not None and version != self.version:
+                return
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def entries(self):
+        """A point-in-time copy of the (key, (expires, value)) pairs, oldest first."""
+        with self._lock:
+            return list(self._data.items())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl_s': self.ttl,
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
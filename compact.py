@@ -0,0 +1,110 @@
+# compact.py: pruned, reduced-precision flat artifacts with a size / load / latency / F1 report
+import argparse, json, os, shutil, statistics, tempfile, time
+import numpy as np
+import pandas as pd
+from sklearn.metrics import f1_score
+from featurizer import TfidfFeaturizer
+from flat_artifact import FLAT_ARTIFACT, WEIGHT_DTYPES, load_flat, write_flat
+from inference import LinearScorer, TriageModel
+from train_baseline import split_labels
+
+def prune(model, tol):
+    """Drop vocabulary columns whose |weight| is <= tol for every label.
+
+    The dropped terms also leave the TF-IDF norm, so the remaining features
+    shift slightly; the report measures what that costs.
+    """
+    feat, scorer = model.featurizer, model.scorer
+    keep = np.flatnonzero(np.abs(scorer.weights).max(axis=1) > tol)
+    terms = sorted(feat.vocabulary, key=feat.vocabulary.__getitem__)
+    featurizer = TfidfFeaturizer({terms[c]: i for i, c in enumerate(keep)}, None if feat.idf is None else feat.idf[keep],
+                                 lowercase=feat.lowercase, strip_accents=feat.strip_accents, token_pattern=feat.token_pattern,
+                                 ngram_range=feat.ngram_range, sublinear_tf=feat.sublinear_tf, norm=feat.norm)
+    scorer = LinearScorer(scorer.weights[keep], scorer.intercept, multilabel=scorer.multilabel)
+    return TriageModel(featurizer, scorer, model.labels, version=model.version)
+
+def variant_version(version, tol, weight_dtype):
+    return f'{version}-p{tol:g}-{weight_dtype}'
+
+def load_val(path, labels):
+    df = pd.read_csv(path)
+    val = df[df.split == 'val']
+    index = {label: j for j, label in enumerate(labels)}
+    Y = np.zeros((len(val), len(labels)), dtype=int)
+    for i, conditions in enumerate(val['top_conditions'].apply(split_labels)):
+        Y[i, [index[c] for c in conditions if c in index]] = 1
+    return val['symptoms_text'].tolist(), Y
+
+def evaluate(path, texts, Y, repeats=5):
+    load_ms = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        model = load_flat(path)
+        load_ms.append((time.perf_counter() - t0) * 1e3)
+    # one-vs-rest predicts a label when its decision function is positive
+    pred = (model.scorer.decision_function(model.featurize(texts)) > 0).astype(int)
+    per_request = []
+    for _ in range(repeats):  # best of several passes, to keep scheduler noise out of small differences
+        times = []
+        for text in texts:
+            t0 = time.perf_counter()
+            model.predict_top([text], 3)
+            times.append((time.perf_counter() - t0) * 1e6)
+        per_request.append(statistics.median(times))
+    return {'bytes': os.path.getsize(path), 'n_features': model.scorer.n_features,
+            'load_ms': round(statistics.median(load_ms), 2), 'request_us': round(min(per_request), 1),
+            'macro_f1_val': round(float(f1_score(Y, pred, average='macro', zero_division=0)), 4),
+            'micro_f1_val': round(float(f1_score(Y, pred, average='micro', zero_division=0)), 4)}
+
+def main(args):
+    source = TriageModel.load(args.model_dir, flat=False)
+    source_version = source.version
+    with open(args.metrics) as f:
+        reference = json.load(f)
+    texts, Y = load_val(args.data, [str(x) for x in source.labels])
+    variants = [(tol, dt) for tol in args.prune_tol for dt in args.weight_dtype]
+    if (args.out or args.publish) and len(variants) != 1:
+        raise SystemExit('--out/--publish need exactly one --prune-tol and one --weight-dtype')
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for tol, weight_dtype in variants:
+            # a new model per variant: setting its version must not touch `source`
+            model = prune(source, tol) if tol > 0 else TriageModel(source.featurizer, source.scorer, source.labels)
+            model.version = variant_version(source_version, tol, weight_dtype)
+            path = os.path.join(tmp, f'p{tol:g}-{weight_dtype}.bin')
+            write_flat(path, model, weight_dtype, source=source_version)
+            row = {'prune_tol': tol, 'weight_dtype': weight_dtype, **evaluate(path, texts, Y)}
+            for k in ('macro_f1_val', 'micro_f1_val'):
+                row[f'{k}_delta'] = round(row[k] - reference[k], 4)
+            rows.append(row)
+            if args.out:
+                shutil.copy2(path, args.out)
+            if args.publish:
+                from model_registry import publish
+                src = os.path.join(tmp, 'publish')
+                os.makedirs(src, exist_ok=True)
+                shutil.copy2(path, os.path.join(src, FLAT_ARTIFACT))
+                row['published'] = publish(src, args.publish, activate=args.activate)
+    cols = ['prune_tol', 'weight_dtype', 'n_features', 'bytes', 'load_ms', 'request_us', 'macro_f1_val', 'macro_f1_val_delta', 'micro_f1_val', 'micro_f1_val_delta']
+    print(' '.join(f'{c:>18}' for c in cols))
+    for row in rows:
+        print(' '.join(f'{row[c]!s:>18}' for c in cols))
+    report = {'source_version': source_version, 'reference': {k: reference[k] for k in ('macro_f1_val', 'micro_f1_val')}, 'variants': rows}
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print({'report': args.report, 'out': args.out, 'published': [r.get('published') for r in rows if r.get('published')]})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prune and quantize the trained model into compact flat artifacts')
+    parser.add_argument('--model-dir', type=str, default='.', help='directory with the joblib artifacts from train_baseline.py')
+    parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--metrics', type=str, default='metrics.json', help='reference F1 values to report deltas against')
+    parser.add_argument('--prune-tol', type=float, nargs='+', default=[0.0, 0.3, 0.5, 1.0],
+                        help='drop features whose largest |weight| over all labels is <= this (0 keeps all)')
+    parser.add_argument('--weight-dtype', choices=WEIGHT_DTYPES, nargs='+', default=list(WEIGHT_DTYPES))
+    parser.add_argument('--out', type=str, default=None, help='write the (single) variant to this flat artifact path')
+    parser.add_argument('--publish', type=str, default=None, metavar='ROOT', help='publish the (single) variant under a model registry root')
+    parser.add_argument('--activate', action='store_true', help='with --publish, make it the CURRENT version')
+    parser.add_argument('--report', type=str, default='compact_report.json')
+    args = parser.parse_args()
+    main(args)
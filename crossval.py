@@ -0,0 +1,208 @@
+# crossval.py: parallel stratified k-fold evaluation with per-class, calibration and triage-rule reports
+import argparse, json, os, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np, pandas as pd, scipy.sparse as sp
+from scipy.special import expit
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.preprocessing import MultiLabelBinarizer, normalize
+from backtest_rules import load_cases
+from records import CASE_FIELDS
+from rules import RuleSet, TRIAGE_LABELS
+from train_baseline import CLF_PARAMS, VECTORIZER_PARAMS, limit_features, peak_rss_mb, split_labels
+
+# TfidfVectorizer learns its vocabulary and idf from the rows it is fitted on,
+# so the TF-IDF matrix cannot be shared between folds as is. The n-gram counts
+# underneath it can: they are computed once for the whole dataset and saved as
+# arrays every fold worker memory-maps. A fold then derives its own vocabulary
+# (min_df, max_features) and idf from its training rows only and rebuilds the
+# exact matrices TfidfVectorizer.fit_transform / transform would produce.
+
+N_BINS = 10
+
+_shared = None
+
+def count_features(texts):
+    p = VECTORIZER_PARAMS
+    counter = CountVectorizer(lowercase=p['lowercase'], strip_accents=p['strip_accents'], ngram_range=p['ngram_range'], dtype=np.int32)
+    return counter.fit_transform(texts), len(counter.vocabulary_)
+
+def save_shared(work_dir, **arrays):
+    for name, a in arrays.items():
+        np.save(os.path.join(work_dir, f'{name}.npy'), a)
+
+def _init_worker(work_dir):
+    # every worker maps the same arrays instead of receiving the matrix by pickle
+    global _shared
+    a = {name[:-4]: np.load(os.path.join(work_dir, name), mmap_mode='r') for name in os.listdir(work_dir) if name.endswith('.npy')}
+    counts = sp.csr_matrix((a.pop('data'), a.pop('indices'), a.pop('indptr')), shape=tuple(a.pop('shape')), copy=False)
+    _shared = {'counts': counts, **a}
+
+def fold_tfidf(counts, train, test):
+    """The TF-IDF matrices a TfidfVectorizer fitted on the train rows gives for train and test rows."""
+    X_train, X_test = counts[train], counts[test]
+    df_arr = np.bincount(X_train.indices, minlength=counts.shape[1])
+    tf_arr = np.bincount(X_train.indices, weights=X_train.data, minlength=counts.shape[1])
+    kept = limit_features(df_arr, tf_arr)
+    idf = np.log((1 + len(train)) / (1 + df_arr[kept])) + 1  # smooth_idf
+    out = []
+    for X in (X_train[:, kept], X_test[:, kept]):
+        X = X.astype(np.float64)
+        np.log(X.data, out=X.data)
+        X.data += 1  # sublinear_tf
+        out.append(normalize(X @ sp.diags(idf), copy=False))
+    return out[0], out[1], len(kept)
+
+def fit_fold(X, Y):
+    """Weights (n_features x n_labels) and intercepts of train_baseline's classifier fitted on one fold."""
+    clf = OneVsRestClassifier(LogisticRegression(**CLF_PARAMS)).fit(X, Y)
+    # a label with a single class in the fold gets a constant predictor instead of a regression
+    fitted = [hasattr(e, 'coef_') for e in clf.estimators_]
+    weights = np.column_stack([e.coef_.ravel() if f else np.zeros(X.shape[1]) for e, f in zip(clf.estimators_, fitted)])
+    intercept = np.array([e.intercept_[0] if f else (np.inf if e.y_ else -np.inf) for e, f in zip(clf.estimators_, fitted)])
+    return weights, intercept
+
+def calibration_bins(P, Y):
+    """Per label and probability bin: [count, sum of probabilities, positives]."""
+    b = np.minimum((P * N_BINS).astype(int), N_BINS - 1) + N_BINS * np.arange(P.shape[1])
+    bins = np.zeros((P.shape[1] * N_BINS, 3))
+    bins[:, 0] = np.bincount(b.ravel(), minlength=len(bins))
+    bins[:, 1] = np.bincount(b.ravel(), weights=P.ravel(), minlength=len(bins))
+    bins[:, 2] = np.bincount(b.ravel(), weights=Y.ravel(), minlength=len(bins))
+    return bins.reshape(P.shape[1], N_BINS, 3)
+
+def ece(bins):
+    """Expected calibration error: bin-weighted |mean probability - positive rate|."""
+    bins = bins.reshape(-1, N_BINS, 3).sum(axis=0)
+    return float(np.abs(bins[:, 1] - bins[:, 2]).sum() / max(bins[:, 0].sum(), 1))
+
+def run_fold(k):
+    s = _shared
+    test = np.flatnonzero(s['fold'] == k)
+    train = np.flatnonzero(s['fold'] != k)
+    Y_train, Y_test = np.asarray(s['Y'][train]).astype(bool), np.asarray(s['Y'][test]).astype(bool)
+    t0 = time.perf_counter()
+    X_train, X_test, n_features = fold_tfidf(s['counts'], train, test)
+    t1 = time.perf_counter()
+    weights, intercept = fit_fold(X_train, Y_train)
+    t2 = time.perf_counter()
+    D = np.asarray(X_test @ weights) + intercept
+    P, pred = expit(D), D > 0  # one-vs-rest predicts a label when its decision function is positive
+    tp, fp, fn = (pred & Y_test).sum(axis=0), (pred & ~Y_test).sum(axis=0), (~pred & Y_test).sum(axis=0)
+    denom = 2 * tp + fp + fn
+    top = P.argmax(axis=1)
+    top_hit = top == s['primary'][test]
+    top_p = P[np.arange(len(test)), top]
+    rule_hit = s['rule_triage'][test] == s['triage'][test]
+    bins = calibration_bins(P, Y_test)
+    return {'fold': k, 'n_train': len(train), 'n_test': len(test), 'n_features': n_features,
+            'macro_f1': float(np.mean(np.where(denom > 0, 2 * tp / np.maximum(denom, 1), 0.0))),  # zero_division=0
+            'micro_f1': float(2 * tp.sum() / max(denom.sum(), 1)),
+            'top1_accuracy': float(top_hit.mean()), 'ece': ece(bins),
+            'rule_agreement': float(rule_hit.mean()),
+            'tp': tp.tolist(), 'fp': fp.tolist(), 'fn': fn.tolist(), 'support': Y_test.sum(axis=0).tolist(),
+            'bins': bins.tolist(), 'top1_bins': calibration_bins(top_p[:, None], top_hit[:, None]).tolist(),
+            'featurize_s': round(t1 - t0, 3), 'fit_s': round(t2 - t1, 3), 'score_s': round(time.perf_counter() - t2, 3)}
+
+def _prf(tp, fp, fn):
+    precision = np.where(tp + fp > 0, tp / np.maximum(tp + fp, 1), 0.0)
+    recall = np.where(tp + fn > 0, tp / np.maximum(tp + fn, 1), 0.0)
+    f1 = np.where(2 * tp + fp + fn > 0, 2 * tp / np.maximum(2 * tp + fp + fn, 1), 0.0)
+    return precision, recall, f1
+
+def _mean_std(values):
+    return {'mean': round(float(np.mean(values)), 4), 'std': round(float(np.std(values, ddof=1)) if len(values) > 1 else 0.0, 4)}
+
+def summarize(folds, labels, rule_triage, triage, rule_red, red):
+    """Per-class precision/recall/F1 and calibration pooled over all test folds, plus fold-to-fold spread."""
+    tp, fp, fn = (np.sum([f[key] for f in folds], axis=0) for key in ('tp', 'fp', 'fn'))
+    support = np.sum([f['support'] for f in folds], axis=0)
+    bins = np.sum([f['bins'] for f in folds], axis=0)
+    precision, recall, f1 = _prf(tp, fp, fn)
+    per_class = [{'label': label, 'support': int(support[j]), 'precision': round(float(precision[j]), 4),
+                  'recall': round(float(recall[j]), 4), 'f1': round(float(f1[j]), 4), 'ece': round(ece(bins[j]), 4)}
+                 for j, label in enumerate(labels)]
+    names = TRIAGE_LABELS + sorted((set(triage) | set(rule_triage)) - set(TRIAGE_LABELS))
+    index = {l: i for i, l in enumerate(names)}
+    confusion = np.zeros((len(names), len(names)), dtype=np.int64)
+    np.add.at(confusion, (pd.Series(triage).map(index).to_numpy(), pd.Series(rule_triage).map(index).to_numpy()), 1)
+    return {
+        'folds': {key: _mean_std([f[key] for f in folds]) for key in ('macro_f1', 'micro_f1', 'top1_accuracy', 'ece', 'rule_agreement')},
+        'pooled': {'macro_f1': round(float(f1.mean()), 4), 'micro_f1': round(float(2 * tp.sum() / max((2 * tp + fp + fn).sum(), 1)), 4),
+                   'ece': round(ece(bins), 4), 'top1_ece': round(ece(np.sum([f['top1_bins'] for f in folds], axis=0)), 4)},
+        'per_class': per_class,
+        'triage_rules': {'agreement': round(float((rule_triage == triage).mean()), 4),
+                         'red_flag_agreement': round(float((rule_red == red).mean()), 4),
+                         'labels': names, 'dataset_vs_rules': confusion.tolist()},
+    }
+
+def main(args):
+    phases, t0 = {}, time.perf_counter()
+    cases = load_cases(args.data)
+    meta = pd.read_csv(args.data, usecols=['top_conditions', 'primary_condition', 'triage_label', 'red_flags_present'],
+                       dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    mlb = MultiLabelBinarizer()
+    Y = mlb.fit_transform(meta['top_conditions'].map(split_labels)).astype(np.int8)
+    labels = [str(c) for c in mlb.classes_]
+    primary = meta['primary_condition'].map({c: j for j, c in enumerate(labels)}).fillna(-1).to_numpy(np.int64)
+    fold = np.empty(len(meta), dtype=np.int16)
+    for k, (_, test) in enumerate(StratifiedKFold(args.folds, shuffle=True, random_state=args.seed).split(np.zeros(len(meta)), meta['primary_condition'])):
+        fold[test] = k
+    phases['load_s'] = time.perf_counter() - t0
+
+    t = time.perf_counter()
+    rule_triage, rule_red = RuleSet.current().evaluate(*(cases[f] for f in CASE_FIELDS))
+    triage, red = meta['triage_label'].to_numpy(object), (meta['red_flags_present'] == 'Y').to_numpy()
+    phases['rules_s'] = time.perf_counter() - t
+
+    with tempfile.TemporaryDirectory(prefix='medtriage_cv_', dir=args.work_dir) as work_dir:
+        t = time.perf_counter()
+        counts, n_terms = count_features(cases['symptoms_text'])
+        save_shared(work_dir, data=counts.data, indices=counts.indices, indptr=counts.indptr, shape=np.array(counts.shape),
+                    Y=Y, primary=primary, fold=fold, rule_triage=rule_triage.astype(str), triage=triage.astype(str))
+        nnz = counts.nnz
+        del counts
+        phases['count_s'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        workers = max(1, min(args.workers, args.folds))
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(work_dir,)) as pool:
+            folds = list(pool.map(run_fold, range(args.folds)))
+        phases['folds_s'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    summary = summarize(folds, labels, rule_triage, triage, rule_red, red)
+    phases['summary_s'] = time.perf_counter() - t
+    phases['total_s'] = time.perf_counter() - t0
+    for key in ('featurize_s', 'fit_s', 'score_s'):
+        phases[f'fold_{key}'] = _mean_std([f[key] for f in folds])
+    own, children = peak_rss_mb()
+    report = {'data': args.data, 'rows': len(meta), 'folds': args.folds, 'seed': args.seed, 'workers': workers,
+              'n_terms': n_terms, 'count_nnz': int(nnz), 'peak_rss_mb': own, 'peak_worker_rss_mb': children,
+              'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+              'phases': {k: round(v, 2) if isinstance(v, float) else v for k, v in phases.items()},
+              **summary,
+              'per_fold': [{k: v for k, v in f.items() if k not in ('tp', 'fp', 'fn', 'support', 'bins', 'top1_bins')} for f in folds]}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'label':<34} {'support':>8} {'precision':>9} {'recall':>7} {'f1':>7} {'ece':>7}")
+    for r in summary['per_class']:
+        print(f"{r['label']:<34} {r['support']:>8} {r['precision']:>9.4f} {r['recall']:>7.4f} {r['f1']:>7.4f} {r['ece']:>7.4f}")
+    print({k: f"{v['mean']:.4f} ± {v['std']:.4f}" for k, v in summary['folds'].items()})
+    print({**summary['pooled'], 'rule_agreement': summary['triage_rules']['agreement'], 'red_flag_agreement': summary['triage_rules']['red_flag_agreement']})
+    print({'out': args.out, **report['phases'], 'peak_rss_mb': own, 'peak_worker_rss_mb': children})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stratified k-fold cross-validation of the baseline model')
+    parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--folds', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='fold processes (capped at --folds)')
+    parser.add_argument('--work-dir', type=str, default=None, help='where the shared count matrix is written (default: system temp)')
+    parser.add_argument('--out', type=str, default='crossval_report.json')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,142 @@
+# featurizer.py: serve-time TF-IDF featurizer equivalent to the fitted TfidfVectorizer
+import re, argparse
+from collections import Counter
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import strip_accents_unicode
+from sklearn.utils.sparsefuncs_fast import inplace_csr_row_normalize_l1, inplace_csr_row_normalize_l2
+
+DEFAULT_TOKEN_PATTERN = r'(?u)\b\w\w+\b'
+SMALL_BATCH = 16
+
+class TfidfFeaturizer:
+    """Word n-gram TF-IDF using only the vocabulary, idf weights and the norm.
+
+    Produces the same CSR rows as `TfidfVectorizer.transform` (same data,
+    indices and indptr) without the per-call validation and the intermediate
+    count matrix, for single texts and batches alike.
+    """
+
+    def __init__(self, vocabulary, idf, lowercase=True, strip_accents='unicode', token_pattern=DEFAULT_TOKEN_PATTERN,
+                 ngram_range=(1, 1), sublinear_tf=False, norm='l2'):
+        if strip_accents not in (None, 'unicode'):
+            raise ValueError(f'unsupported strip_accents={strip_accents!r}')
+        if norm not in (None, 'l1', 'l2'):
+            raise ValueError(f'unsupported norm={norm!r}')
+        self.vocabulary = dict(vocabulary)
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float64)
+        self.lowercase = lowercase
+        self.strip_accents = strip_accents
+        self.token_pattern = token_pattern
+        # a maximal run of two or more word characters is what the default
+        # pattern matches, and the version without \b assertions scans faster
+        self._findall = re.compile(r'(?u)\w\w+' if token_pattern == DEFAULT_TOKEN_PATTERN else token_pattern).findall
+        self.ngram_range = tuple(ngram_range)
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+        self.n_features = len(self.vocabulary)
+
+    @classmethod
+    def from_vectorizer(cls, vec):
+        p = vec.get_params()
+        unsupported = {k: p[k] for k in ('preprocessor', 'tokenizer', 'stop_words') if p.get(k) is not None}
+        if p['analyzer'] != 'word' or p['binary'] or unsupported:
+            raise ValueError(f'cannot precompile vectorizer with analyzer={p["analyzer"]!r} binary={p["binary"]} {unsupported}')
+        idf = vec.idf_ if p.get('use_idf', False) else None
+        return cls(vec.vocabulary_, idf, lowercase=p['lowercase'], strip_accents=p['strip_accents'],
+                   token_pattern=p['token_pattern'], ngram_range=p['ngram_range'],
+                   sublinear_tf=p.get('sublinear_tf', False), norm=p.get('norm'))
+
+    def _doc_columns(self, doc):
+        # vocabulary column of every n-gram in `doc`, once per occurrence
+        if self.lowercase:
+            doc = doc.lower()
+        if self.strip_accents and not doc.isascii():
+            doc = strip_accents_unicode(doc)
+        tokens = self._findall(doc)
+        vocab_get = self.vocabulary.get
+        min_n, max_n = self.ngram_range
+        cols = []
+        for n in range(min_n, min(max_n, len(tokens)) + 1):
+            grams = tokens if n == 1 else map(' '.join, zip(*[tokens[i:] for i in range(n)]))
+            cols += [c for c in map(vocab_get, grams) if c is not None]
+        return cols
+
+    def _count_small(self, doc_cols):
+        indptr, indices, values = [0], [], []
+        for cols in doc_cols:
+            counts = Counter(cols)
+            keys = sorted(counts)
+            indices += keys
+            values += map(counts.__getitem__, keys)
+            indptr.append(len(indices))
+        return np.asarray(indptr, dtype=np.int32), np.asarray(indices, dtype=np.int32), np.asarray(values, dtype=np.float64)
+
+    def _count_batch(self, doc_cols):
+        # np.unique over row * n_features + col yields the (row, col) pairs sorted
+        # by row then column, i.e. the sorted-indices CSR layout, with counts
+        lengths = [len(c) for c in doc_cols]
+        rows = np.repeat(np.arange(len(doc_cols), dtype=np.int64), lengths)
+        flat = np.fromiter((c for cols in doc_cols for c in cols), dtype=np.int64, count=sum(lengths))
+        keys, counts = np.unique(rows * self.n_features + flat, return_counts=True)
+        indptr = np.zeros(len(doc_cols) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(keys // self.n_features, minlength=len(doc_cols)), out=indptr[1:])
+        return indptr, (keys % self.n_features).astype(np.int32), counts.astype(np.float64)
+
+    def transform(self, texts):
+        if isinstance(texts, str):
+            raise ValueError('expected an iterable of texts, got a single string')
+        doc_cols = [self._doc_columns(doc) for doc in texts]
+        # numpy's fixed per-call cost only pays off beyond a handful of rows
+        count = self._count_small if len(doc_cols) < SMALL_BATCH else self._count_batch
+        indptr, idx, data = count(doc_cols)
+        # same element-wise steps, in the same order, as TfidfTransformer.transform
+        if self.sublinear_tf:
+            np.log(data, data)
+            data += 1.0
+        if self.idf is not None:
+            data *= self.idf[idx]
+        X = sp.csr_matrix((data, idx, indptr), shape=(len(doc_cols), self.n_features))
+        X.has_sorted_indices = True
+        if self.norm == 'l2':
+            inplace_csr_row_normalize_l2(X)
+        elif self.norm == 'l1':
+            inplace_csr_row_normalize_l1(X)
+        return X
+
+def precompile(vec):
+    """A TfidfFeaturizer for `vec` when its settings are supported, else `vec` unchanged."""
+    try:
+        return TfidfFeaturizer.from_vectorizer(vec)
+    except (AttributeError, ValueError):
+        return vec
+
+def check_parity(featurizer, vectorizer, texts, batch_size=512):
+    """Count texts whose featurizer rows differ from vectorizer.transform, in batches and one at a time."""
+    ref = vectorizer.transform(texts)
+    ref.sort_indices()
+    mismatched = set()
+    for start in range(0, len(texts), batch_size):
+        got = featurizer.transform(texts[start:start + batch_size])
+        for i in range(got.shape[0]):
+            a, b = got[i], ref[start + i]
+            if not (np.array_equal(a.indices, b.indices) and np.array_equal(a.data, b.data)):
+                mismatched.add(start + i)
+    for i, t in enumerate(texts):
+        a, b = featurizer.transform([t]), ref[i]
+        if not (np.array_equal(a.indices, b.indices) and np.array_equal(a.data, b.data)):
+            mismatched.add(i)
+    return sorted(mismatched)
+
+if __name__ == '__main__':
+    import pandas as pd
+    from joblib import load
+    parser = argparse.ArgumentParser(description='Check featurizer parity with vectorizer.joblib over a dataset')
+    parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--vectorizer', type=str, default='vectorizer.joblib')
+    args = parser.parse_args()
+    vectorizer = load(args.vectorizer)
+    texts = pd.read_csv(args.data)['symptoms_text'].fillna('').astype(str).tolist()
+    bad = check_parity(TfidfFeaturizer.from_vectorizer(vectorizer), vectorizer, texts)
+    print({'texts': len(texts), 'mismatched': len(bad), 'first_mismatches': bad[:10]})
+    raise SystemExit(1 if bad else 0)
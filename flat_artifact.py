@@ -0,0 +1,127 @@
+# flat_artifact.py: single-file, memory-mappable model artifact shared by all workers
+import argparse, json, mmap, os, struct
+import numpy as np
+
+MAGIC = b'MTFLAT01'
+FLAT_ARTIFACT = 'model_flat.bin'
+ALIGN = 64
+
+WEIGHT_DTYPES = ('float64', 'float32', 'int8')
+
+# Layout: MAGIC | uint64 header length | JSON header | padding | arrays.
+# Every array starts on a 64-byte boundary; the header records its dtype,
+# shape and offset. Strings (vocabulary terms in column order, class labels)
+# are stored newline-joined as UTF-8 bytes. Compact artifacts store weights
+# (and idf) as float32, or weights as int8 with one float scale per label.
+
+def _join_strings(items, what):
+    items = [str(x) for x in items]
+    if any('\n' in x for x in items):
+        raise ValueError(f'{what} contains a newline and cannot be stored')
+    return np.frombuffer('\n'.join(items).encode('utf-8'), dtype=np.uint8)
+
+def quantize_int8(weights):
+    """Symmetric per-label int8 weights and the float scale of each label column."""
+    scales = np.abs(weights).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(weights / scales).astype(np.int8), scales
+
+def write_flat(path, model, weight_dtype='float64', source=None):
+    """Write a TriageModel whose featurizer is a TfidfFeaturizer and scorer a LinearScorer.
+
+    `source` is the fingerprint of the joblib artifacts the model came from
+    (default: its version), checked by TriageModel.load against the joblib files beside the flat one.
+    """
+    feat, scorer = model.featurizer, model.scorer
+    if not hasattr(feat, 'vocabulary') or not hasattr(scorer, 'weights'):
+        raise TypeError('flat export needs a precompiled featurizer and a fused linear scorer')
+    if weight_dtype not in WEIGHT_DTYPES:
+        raise ValueError(f'weight_dtype must be one of {WEIGHT_DTYPES}')
+    terms = sorted(feat.vocabulary, key=feat.vocabulary.__getitem__)
+    real = np.float64 if weight_dtype == 'float64' else np.float32
+    arrays = {
+        'vocabulary': _join_strings(terms, 'vocabulary'),
+        'idf': np.zeros(0) if feat.idf is None else np.ascontiguousarray(feat.idf, dtype=real),
+        'weights': np.ascontiguousarray(scorer.weights, dtype=real),
+        'intercept': np.ascontiguousarray(scorer.intercept, dtype=np.float64),
+        'classes': _join_strings(model.labels, 'class labels'),
+    }
+    if weight_dtype == 'int8':
+        arrays['weights'], arrays['weight_scales'] = quantize_int8(np.asarray(scorer.weights, dtype=np.float64))
+    header = {
+        'featurizer': {'lowercase': feat.lowercase, 'strip_accents': feat.strip_accents, 'token_pattern': feat.token_pattern,
+                       'ngram_range': list(feat.ngram_range), 'sublinear_tf': feat.sublinear_tf, 'norm': feat.norm,
+                       'use_idf': feat.idf is not None},
+        'scorer': {'multilabel': bool(scorer.multilabel), 'weight_dtype': weight_dtype},
+        'n_features': len(terms),
+        'version': model.version,
+        'source': source or model.version,
+        'arrays': {},
+    }
+    # two passes: offsets depend on the header length, which depends on the offsets
+    for _ in range(2):
+        head = json.dumps(header).encode('utf-8')
+        offset = -(-(len(MAGIC) + 8 + len(head)) // ALIGN) * ALIGN
+        for name, arr in arrays.items():
+            header['arrays'][name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+            offset = -(-(offset + arr.nbytes) // ALIGN) * ALIGN
+    head = json.dumps(header).encode('utf-8')
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(head)) + head)
+        for name, arr in arrays.items():
+            f.write(b'\0' * (header['arrays'][name]['offset'] - f.tell()))
+            f.write(arr.tobytes())
+    os.replace(tmp, path)  # readers never see a half-written file
+    return path
+
+def read_flat(path):
+    """Map the file read-only; returns (header, arrays) where arrays are views on the shared pages."""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(MAGIC)] != MAGIC:
+        raise ValueError(f'{path} is not a flat model artifact')
+    (head_len,) = struct.unpack('<Q', mm[len(MAGIC):len(MAGIC) + 8])
+    header = json.loads(mm[len(MAGIC) + 8:len(MAGIC) + 8 + head_len].decode('utf-8'))
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        arrays[name] = np.frombuffer(mm, dtype=dtype, count=count, offset=spec['offset']).reshape(spec['shape'])
+    return header, arrays
+
+def load_flat(path, source=None):
+    """The TriageModel in a flat artifact; ValueError if `source` is given and it was exported from other artifacts."""
+    from featurizer import TfidfFeaturizer
+    from inference import LinearScorer, TriageModel
+    header, arrays = read_flat(path)
+    exported_from = header.get('source', header['version'])  # files written before 'source' existed
+    if source is not None and exported_from != source:
+        raise ValueError(f'{path} was exported from model {exported_from}, not from the joblib artifacts {source} beside it')
+    p = header['featurizer']
+    # the term -> column dict is the one per-process structure; float64 idf and
+    # weight arrays stay on the mapped pages
+    terms = arrays['vocabulary'].tobytes().decode('utf-8').split('\n') if header['n_features'] else []
+    featurizer = TfidfFeaturizer(dict(zip(terms, range(len(terms)))), arrays['idf'] if p['use_idf'] else None,
+                                 lowercase=p['lowercase'], strip_accents=p['strip_accents'], token_pattern=p['token_pattern'],
+                                 ngram_range=p['ngram_range'], sublinear_tf=p['sublinear_tf'], norm=p['norm'])
+    # compact weights are widened to float64 once here: sparse x float32/int8
+    # products upcast the whole matrix on every call and are several times slower
+    weights = arrays['weights']
+    if 'weight_scales' in arrays:
+        weights = weights.astype(np.float64) * arrays['weight_scales']
+    scorer = LinearScorer(weights, arrays['intercept'], multilabel=header['scorer']['multilabel'])
+    labels = arrays['classes'].tobytes().decode('utf-8').split('\n')
+    return TriageModel(featurizer, scorer, labels, version=header['version'])
+
+if __name__ == '__main__':
+    from inference import TriageModel
+    parser = argparse.ArgumentParser(description='Export the joblib artifacts in a directory to a flat artifact')
+    parser.add_argument('--model-dir', type=str, default='.')
+    parser.add_argument('--out', type=str, default=None)
+    parser.add_argument('--weight-dtype', choices=WEIGHT_DTYPES, default='float64')
+    args = parser.parse_args()
+    out = args.out or os.path.join(args.model_dir, FLAT_ARTIFACT)
+    model = TriageModel.load(args.model_dir, flat=False)
+    write_flat(out, model, args.weight_dtype)
+    print({'path': out, 'bytes': os.path.getsize(out), 'version': model.version, 'weight_dtype': args.weight_dtype})
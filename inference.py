@@ -0,0 +1,144 @@
+# inference.py: fused serve-time scoring for the one-vs-rest classifier
+import hashlib, os, time, warnings
+import numpy as np
+from scipy.special import expit
+from joblib import load
+from featurizer import precompile
+from rules import triage_from_rules
+
+ARTIFACTS = ('vectorizer.joblib', 'classifier.joblib', 'mlb.joblib')
+
+class LinearScorer:
+    """Every one-vs-rest logistic estimator stacked into one weight matrix.
+
+    Scoring is a single sparse x dense product plus a vectorized sigmoid,
+    instead of one `predict_proba` call per label.
+    """
+
+    def __init__(self, weights, intercept, multilabel=True):
+        # weights are (n_features, n_labels) so `X @ weights` needs no transpose;
+        # already-contiguous float64 arrays (e.g. memory-mapped) are not copied
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64).ravel()
+        self.multilabel = multilabel
+
+    @classmethod
+    def from_classifier(cls, clf):
+        coefs, intercepts = [], []
+        for est in clf.estimators_:
+            if not hasattr(est, 'coef_') or len(getattr(est, 'classes_', ())) != 2:
+                raise TypeError(f'cannot fuse estimator of type {type(est).__name__}')
+            coefs.append(np.asarray(est.coef_, dtype=np.float64).ravel())
+            intercepts.append(float(np.ravel(est.intercept_)[0]))
+        return cls(np.vstack(coefs).T, intercepts, multilabel=bool(getattr(clf, 'multilabel_', True)))
+
+    @property
+    def n_features(self):
+        return self.weights.shape[0]
+
+    def decision_function(self, X):
+        return np.asarray(X @ self.weights) + self.intercept
+
+    def predict_proba(self, X):
+        Y = expit(self.decision_function(X))
+        if Y.shape[1] == 1:
+            Y = np.concatenate((1 - Y, Y), axis=1)
+        if not self.multilabel:
+            # same row normalisation OneVsRestClassifier applies to multiclass models
+            row_sums = Y.sum(axis=1)[:, np.newaxis]
+            np.divide(Y, row_sums, out=Y, where=row_sums != 0)
+        return Y
+
+def fuse(clf):
+    """A LinearScorer for `clf` when its estimators are linear, else `clf` unchanged."""
+    try:
+        return LinearScorer.from_classifier(clf)
+    except (AttributeError, TypeError):
+        return clf
+
+def top_k(probs, k):
+    # one argsort over the whole (n_rows, n_labels) matrix instead of one per row
+    idx = np.argsort(-probs, axis=1)[:, :k]
+    return idx, np.take_along_axis(probs, idx, axis=1)
+
+def sha256_files(paths):
+    """sha256 object fed the bytes of `paths` in order, read in 1 MB blocks."""
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h
+
+def artifact_fingerprint(paths):
+    """Short content hash identifying a set of model artifact files."""
+    return sha256_files(paths).hexdigest()[:12]
+
+class TriageModel:
+    """The serve-time scoring stack: featurizer, fused scorer and label names."""
+
+    def __init__(self, featurizer, scorer, labels, version=None):
+        self.featurizer = featurizer
+        self.scorer = scorer
+        self.labels = np.asarray(labels)
+        self.version = version
+
+    @classmethod
+    def load(cls, directory='.', flat=None):
+        """Load from `directory`, preferring the memory-mapped flat artifact when present.
+
+        A flat artifact exported from other joblib files than the ones beside it
+        is stale (e.g. left over from before retraining): it is skipped with a
+        warning, or raises ValueError with flat=True. flat=True requires the
+        flat artifact, flat=False always reads the joblib files.
+        """
+        from flat_artifact import FLAT_ARTIFACT, load_flat
+        flat_path = os.path.join(directory, FLAT_ARTIFACT)
+        paths = [os.path.join(directory, name) for name in ARTIFACTS]
+        version = artifact_fingerprint(paths) if all(map(os.path.exists, paths)) else None
+        if flat or (flat is None and os.path.exists(flat_path)):
+            try:
+                return load_flat(flat_path, source=version)
+            except ValueError as e:
+                if flat or version is None:
+                    raise
+                warnings.warn(f'{e}; loading the joblib artifacts instead')
+        vectorizer, clf, mlb = (load(path) for path in paths)
+        return cls(precompile(vectorizer), fuse(clf), mlb.classes_, version=version)
+
+    def featurize(self, texts):
+        return self.featurizer.transform(texts)
+
+    def predict_proba(self, X):
+        return self.scorer.predict_proba(X)
+
+    def predict_top(self, texts, k):
+        return top_k(self.predict_proba(self.featurize(texts)), k)
+
+STAGES = ('featurize', 'score', 'topk', 'rules')
+
+def triage_rows(model, cases, k=3):
+    """(rows, seconds per STAGES entry) for cases given as (text, age, fever_temp_c, duration_days, risk_factors).
+
+    Rows are (triage, emergency, top conditions, top probabilities) of plain
+    values, so a worker process sends back little more than the JSON response.
+    """
+    t0 = time.perf_counter()
+    X = model.featurize([c[0] for c in cases])
+    t1 = time.perf_counter()
+    probs = model.predict_proba(X)
+    t2 = time.perf_counter()
+    top_idx, top_probs = top_k(probs, k)
+    t3 = time.perf_counter()
+    decisions = [triage_from_rules(*c) for c in cases]
+    t4 = time.perf_counter()
+    labels = model.labels
+    rows = [(label, bool(red), [str(labels[i]) for i in idx], [float(p) for p in p_row])
+            for (label, red), idx, p_row in zip(decisions, top_idx, top_probs)]
+    return rows, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)
+
+def triage_cases(model, cases, k=3):
+    """Score normalised cases (see records.case_from_record) in one vectorized pass."""
+    rows, _ = triage_rows(model, [(c['symptoms_text'], c['age'], c['fever_temp_c'], c['duration_days'], c['risk_factors']) for c in cases], k)
+    return [{'triage': label, 'emergency': red, 'top_conditions': conditions, 'top_probabilities': probs}
+            for label, red, conditions, probs in rows]
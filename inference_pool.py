@@ -0,0 +1,181 @@
+# inference_pool.py: featurize, score and apply the triage rules in worker processes that each hold the model
+import asyncio, multiprocessing, os, threading, time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from inference import TriageModel, triage_rows
+
+MIN_CHUNK = 16  # smallest share of a batch worth its own round trip
+
+# --- worker process side ------------------------------------------------------
+
+_model = None
+
+def _load(directory, version):
+    global _model
+    if _model is None or _model.version != version:
+        _model = TriageModel.load(directory)  # the parent validated it before binding
+    return _model
+
+def _warm():
+    time.sleep(0.05)  # long enough that every worker takes one
+    return os.getpid()
+
+def _score(directory, version, cases, k):
+    t0 = time.perf_counter()
+    model = _load(directory, version)
+    rows, stages = triage_rows(model, cases, k)
+    return model.version, rows, stages, time.perf_counter() - t0
+
+# --- server side ----------------------------------------------------------------
+
+class InferencePool:
+    """Scores batches of cases in `workers` processes, outside the server's GIL.
+
+    Every worker loads the model once at start-up (pages of a memory-mapped flat
+    artifact are shared between them) and again only after `bind()` names a new
+    version. Callers hand over plain tuples and get back (version, rows, stage
+    seconds, dispatch seconds), where dispatch is the round trip minus the
+    worker's own time: pickling, pipes and waiting for a free worker.
+    A pool broken by a crashed worker is replaced, and calls it failed are retried once.
+    """
+
+    def __init__(self, workers, directory, version, k):
+        self.workers, self.k = max(1, int(workers)), k
+        self.target = (directory, version)
+        self._lock, self._restart_lock = threading.Lock(), threading.Lock()
+        self._counts = {'batches': 0, 'cases': 0, 'errors': 0, 'restarts': 0, 'in_flight': 0}
+        self._pending = []  # (case, future) queued by score_one in the current loop pass
+        self._tasks = set()  # chunks in flight, referenced so the loop cannot drop them
+        self._pids = []
+        self._executor = self._start()
+
+    def _start(self):
+        # spawn, not fork: the server process already runs threads (audit writer, reload watcher)
+        executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_load, initargs=self.target)
+        # one task per worker starts them all now, so the first requests skip process start-up and model load
+        self._pids = sorted({f.result() for f in wait([executor.submit(_warm) for _ in range(self.workers)]).done})
+        return executor
+
+    def bind(self, directory, version):
+        """Score with this model from now on; each worker loads it on its next batch."""
+        self.target = (directory, version)
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, n in deltas.items():
+                self._counts[key] += n
+
+    def _done(self, fut):
+        self._count(in_flight=-1, errors=int(fut.cancelled() or fut.exception() is not None))
+
+    def _restart(self, broken):
+        """Replace `broken` with a fresh pool, unless another caller already did."""
+        with self._restart_lock:
+            if self._executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._start()
+                self._count(restarts=1)
+
+    def submit(self, cases, target=None):
+        """Queue one batch; raises BrokenProcessPool (with .executor set) if the pool is broken.
+
+        Never restarts the pool itself, since that blocks for process start-up
+        and model load: score() does so inline, score_async() off the loop.
+        """
+        directory, version = target or self.target
+        executor = self._executor
+        try:
+            fut = executor.submit(_score, directory, version, cases, self.k)
+        except BrokenProcessPool as e:
+            e.executor = executor
+            raise
+        self._count(batches=1, cases=len(cases), in_flight=1)
+        fut.add_done_callback(self._done)
+        fut.executor = executor
+        return fut
+
+    @staticmethod
+    def _result(t0, out):
+        version, rows, stages, busy = out
+        return version, rows, stages, time.perf_counter() - t0 - busy
+
+    def score(self, cases):
+        """Blocking; for request threads and the micro-batcher.
+
+        Batches of at least 2 * MIN_CHUNK cases are split over the workers and
+        reassembled in order; stage seconds are then summed over the chunks.
+        """
+        t0, target = time.perf_counter(), self.target
+        n = max(1, min(self.workers, len(cases) // MIN_CHUNK))
+        size = -(-len(cases) // n)
+        chunks = [cases[i:i + size] for i in range(0, len(cases), size)] or [cases]
+        try:
+            futs = [self.submit(chunk, target) for chunk in chunks]
+        except BrokenProcessPool as e:  # broken by an earlier call: replace it and queue again
+            self._restart(e.executor)
+            futs = [self.submit(chunk, target) for chunk in chunks]
+        outs = []
+        for chunk, fut in zip(chunks, futs):
+            try:
+                outs.append(fut.result())
+            except BrokenProcessPool:  # a worker died under this call: retry once on a fresh pool
+                self._restart(fut.executor)
+                outs.append(self.submit(chunk, target).result())
+        rows = [row for out in outs for row in out[1]]
+        stages = tuple(map(sum, zip(*(out[2] for out in outs))))
+        return outs[0][0], rows, stages, time.perf_counter() - t0 - max(out[3] for out in outs)
+
+    async def score_async(self, cases):
+        """For the event loop: no thread waits while a worker computes."""
+        t0 = time.perf_counter()
+        try:
+            return self._result(t0, await asyncio.wrap_future(self.submit(cases)))
+        except BrokenProcessPool as e:
+            # broken before or during this call; starting a pool blocks for
+            # process start-up and model load, so not on the loop
+            broken = getattr(e, 'executor', None) or self._executor
+            await asyncio.get_running_loop().run_in_executor(None, self._restart, broken)
+            return self._result(t0, await asyncio.wrap_future(self.submit(cases)))
+
+    async def score_one(self, case):
+        """One case from the event loop, sent together with the others queued in the same loop pass.
+
+        Cases arriving while the loop is busy are split into at most one chunk
+        per worker, so a burst costs a few round trips instead of one each,
+        without waiting for a window to fill. Only the first case of a chunk
+        carries its stage seconds (None for the rest).
+        """
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((case, fut))
+        if len(self._pending) == 1:
+            asyncio.get_running_loop().call_soon(self._flush)
+        return await fut
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        size = -(-len(pending) // self.workers)
+        for i in range(0, len(pending), size):
+            task = asyncio.ensure_future(self._score_chunk(pending[i:i + size]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _score_chunk(self, chunk):
+        try:
+            version, rows, stages, dispatch = await self.score_async([case for case, _ in chunk])
+        except Exception as e:
+            for _, fut in chunk:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for j, ((_, fut), row) in enumerate(zip(chunk, rows)):
+            if not fut.done():  # the request may have been cancelled meanwhile
+                fut.set_result((version, [row], stages if j == 0 else None, dispatch if j == 0 else None))
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        return {**counts, 'workers': self.workers, 'version': self.target[1], 'pids': self._pids}
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -1,9 +1,10 @@
 # make_dataset.py: regenerate synthetic dataset with ~5k rows
-import os, json, random
+import os, json, random, math
 from datetime import datetime
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
+from rules import RuleSet, triage_from_rules
 
 CONDITIONS = ["Common Cold", "Influenza", "Strep Throat", "Viral Pharyngitis", "Tonsillitis", "Acute Sinusitis", "Community-Acquired Pneumonia", "COVID-like Illness", "Otitis Media", "Acute Otitis Externa", "Bronchiolitis", "Gastroenteritis", "Food Poisoning", "Urinary Tract Infection", "Conjunctivitis", "Impetigo", "Cellulitis", "Skin Abscess", "Scabies", "Hand-Foot-and-Mouth Disease", "Chickenpox (Varicella)", "Measles-like Illness", "Dengue-like Illness", "Typhoid-like Illness", "Malaria-like Illness"]
 SYMPTOM_BANK = {"Common Cold": ["runny nose", "sneezing", "sore throat", "mild cough", "congestion", "low-grade fever", "fatigue"], "Influenza": ["high fever", "body aches", "severe fatigue", "dry cough", "headache", "chills"], "Strep Throat": ["sore throat", "fever", "painful swallowing", "swollen tonsils", "no cough"], "Viral Pharyngitis": ["sore throat", "cough", "hoarseness", "runny nose", "fever"], "Tonsillitis": ["sore throat", "fever", "swollen tonsils", "difficulty swallowing", "ear pain"], "Acute Sinusitis": ["facial pain", "purulent nasal discharge", "nasal congestion", "tooth pain", "headache"], "Community-Acquired Pneumonia": ["fever", "productive cough", "shortness of breath", "chest pain", "fatigue"], "COVID-like Illness": ["fever", "dry cough", "loss of smell", "loss of taste", "fatigue", "sore throat"], "Otitis Media": ["ear pain", "fever", "irritability in child", "hearing difficulty"], "Acute Otitis Externa": ["ear pain", "itchy ear", "ear canal tenderness", "discharge from ear"], "Bronchiolitis": ["wheezing", "cough", "fast breathing", "fever", "feeding difficulty"], "Gastroenteritis": ["vomiting", "watery diarrhea", "abdominal cramps", "fever", "nausea"], "Food Poisoning": ["sudden vomiting", "diarrhea", "abdominal pain", "fever", "nausea"], "Urinary Tract Infection": ["burning urination", "frequent urination", "urgency", "lower abdominal pain", "fever"], "Conjunctivitis": ["red eye", "itchy eyes", "tearing", "discharge from eye", "gritty sensation"], "Impetigo": ["honey-colored crusts", "red sores", "itchy rash", "around nose and mouth"], "Cellulitis": ["warm red skin", "tenderness", "swelling", "fever"], "Skin Abscess": ["painful lump", "swelling", "pus", "fever", "tender to touch"], "Scabies": ["intense itching", "worse at night", "burrow lines", "rash between fingers"], "Hand-Foot-and-Mouth Disease": ["fever", "mouth ulcers", "rash on hands", "rash on feet"], "Chickenpox (Varicella)": ["itchy blistering rash", "fever", "rash in crops", "fatigue"], "Measles-like Illness": ["fever", "cough", "runny nose", "conjunctivitis", "rash"], "Dengue-like Illness": ["high fever", "severe headache", "pain behind eyes", "joint pain", "rash"], "Typhoid-like Illness": ["prolonged fever", "abdominal pain", "headache", "constipation or diarrhea"], "Malaria-like Illness": ["fever with chills", "sweats", "headache", "fatigue", "body aches"]}
@@ -59,19 +60,6 @@ def derive_exposures():
     import random
     return sorted([ex for ex in EXPOSURES if random.random()<0.2])
 
-def triage_from_rules(text, age, fever_temp, duration_days, risk_list):
-    text_low = (text or '').lower()
-    if any(flag in text_low for flag in RED_FLAGS): return 'Emergency', True
-    high_risk = any(r in (risk_list or []) for r in ['immunocompromised','pregnancy','infant<1y','elder>65','heart_disease','lung_disease','kidney_disease'])
-    urgent_score = 0
-    if (fever_temp is not None) and fever_temp>=39.0 and duration_days>=3: urgent_score += 1
-    if any(p in text_low for p in ['shortness of breath','breathless','wheezing','fast breathing']): urgent_score += 1
-    if 'urinary' in text_low and ('flank pain' in text_low or 'back pain' in text_low): urgent_score += 1
-    if age is not None and age<1.0 and (fever_temp is not None) and fever_temp>=38.0: return 'Urgent', False
-    if urgent_score>=1 and high_risk: return 'Urgent', False
-    if any(p in text_low for p in ['high fever','productive cough','persistent','purulent','severe']): return 'GP within 48h', False
-    return 'Home care', False
-
 def generate_case(case_id):
     cond = random.choice(CONDITIONS)
     age = sample_age()
@@ -106,12 +94,157 @@ def generate_case(case_id):
         'split': ''
     }
 
+# --- vectorized, chunked generation (--workers / --chunk-size) ---------------
+# Same distributions as generate_case, drawn as NumPy arrays one chunk at a time.
+# Each chunk has its own generator seeded from (seed, chunk index), so output
+# depends only on --seed and --chunk-size, never on the worker count.
+
+AGE_BUCKETS = [(0.2,(0.1,1.0)),(0.25,(1,12)),(0.25,(12,18)),(0.2,(18,65)),(0.1,(65,90))]
+LOW_FEVER = ['Common Cold','Conjunctivitis','Impetigo','Scabies','Skin Abscess']
+HIGH_FEVER = ['Influenza','Strep Throat','Community-Acquired Pneumonia','COVID-like Illness','Dengue-like Illness','Typhoid-like Illness','Malaria-like Illness','Gastroenteritis','Food Poisoning','Tonsillitis','Viral Pharyngitis','Acute Sinusitis','Otitis Media','Bronchiolitis']
+COLUMNS = ['case_id','age','sex','symptoms_text','duration_days','fever_temp_c','vitals_available','risk_factors','exposures','top_conditions','primary_condition','triage_label','red_flags_present','notes_source','split']
+
+def _sample_rows(rng, m, pool, k):
+    # k[i] distinct indices into range(pool) for each of m rows, as Python lists
+    perm = np.argsort(rng.random((m, pool)), axis=1).tolist()
+    return [row[:n] for row, n in zip(perm, np.broadcast_to(k, m).tolist())]
+
+def _set_names(flags, names):
+    # boolean (n, len(names)) -> comma-joined sorted names, via a lookup over every bitmask
+    order = np.argsort(names)
+    names = [names[i] for i in order]
+    flags = flags[:, order]
+    table = [','.join(n for b, n in enumerate(names) if mask >> b & 1) for mask in range(1 << len(names))]
+    masks = flags.astype(np.int64) @ (1 << np.arange(len(names), dtype=np.int64))
+    return [table[m] for m in masks]
+
+def stratified_split(strata, rng):
+    """70/15/15 train/val/test within every stratum, with train_test_split's rounding."""
+    split = np.empty(len(strata), dtype=object)
+    for value in np.unique(strata):
+        idx = rng.permutation(np.flatnonzero(strata == value))
+        n_temp = math.ceil(0.3 * len(idx))
+        n_test = math.ceil(0.5 * n_temp)
+        split[idx[:len(idx) - n_temp]] = 'train'
+        split[idx[len(idx) - n_temp:len(idx) - n_test]] = 'val'
+        split[idx[len(idx) - n_test:]] = 'test'
+    return split
+
+def generate_chunk(chunk_index, start_id, n, seed=42):
+    """Rows start_id .. start_id + n - 1 as a DataFrame, split assigned within the chunk."""
+    rng = np.random.default_rng([seed, chunk_index])
+    cond = rng.integers(len(CONDITIONS), size=n)
+    bucket = rng.choice(len(AGE_BUCKETS), size=n, p=[p for p, _ in AGE_BUCKETS])
+    lo = np.array([b[0] for _, b in AGE_BUCKETS])[bucket]
+    hi = np.array([b[1] for _, b in AGE_BUCKETS])[bucket]
+    age = np.round(rng.uniform(lo, hi), 1)
+    duration = np.maximum(0, np.round(rng.normal(3, 2, size=n)).astype(int)) + 1
+    names = np.array(CONDITIONS, dtype=object)[cond]
+    low_grp, high_grp = np.isin(names, LOW_FEVER), np.isin(names, HIGH_FEVER)
+    r = rng.random(n)
+    fever = np.full(n, np.nan)
+    fever[low_grp & (r < 0.7)] = np.round(rng.uniform(36.5, 38.0, size=n), 1)[low_grp & (r < 0.7)]
+    fever[high_grp & (r < 0.85)] = np.round(rng.uniform(38.0, 40.3, size=n), 1)[high_grp & (r < 0.85)]
+
+    # symptom phrases: a random subset of the condition's bank, sometimes 2 from a confusable one
+    symptoms = [None] * n
+    top_conditions = [None] * n
+    confuse, add_alt = rng.random(n) < 0.35, rng.random(n) < 0.6
+    for c, cname in enumerate(CONDITIONS):
+        rows = np.flatnonzero(cond == c)
+        if not len(rows):
+            continue
+        bank, confs = SYMPTOM_BANK[cname], CONFUSIONS.get(cname, [])
+        k = rng.integers(2, min(5, len(bank)) + 1, size=len(rows))
+        for i, pick in zip(rows.tolist(), _sample_rows(rng, len(rows), len(bank), k)):
+            symptoms[i] = [bank[b] for b in pick]
+            top_conditions[i] = cname
+        if not confs:
+            continue
+        conf_pick = rng.integers(len(confs), size=len(rows))
+        for t, target in enumerate(confs):
+            sel = rows[confuse[rows] & (conf_pick == t)]
+            cbank = SYMPTOM_BANK[target]
+            for i, pick in zip(sel.tolist(), _sample_rows(rng, len(sel), len(cbank), min(2, len(cbank)))):
+                symptoms[i] += [cbank[b] for b in pick]
+        sel = rows[add_alt[rows]]
+        n_alt = np.minimum(len(confs), rng.integers(1, 3, size=len(sel)))
+        for i, pick in zip(sel.tolist(), _sample_rows(rng, len(sel), len(confs), n_alt)):
+            top_conditions[i] = ','.join(sorted({cname, *(confs[a] for a in pick)}))
+    n_extra = rng.integers(0, 4, size=n)
+    extras = _sample_rows(rng, n, len(EXTRA_TOKENS), n_extra)
+    red_pick = np.where(rng.random(n) < 0.03, rng.integers(len(RED_FLAGS), size=n), -1).tolist()
+    texts = []
+    for words, extra, red_i, d, a, t in zip(symptoms, extras, red_pick, duration.tolist(), age.tolist(), fever.tolist()):
+        text = ', '.join(words + [EXTRA_TOKENS[e] for e in extra])
+        if red_i >= 0:
+            text += ', ' + RED_FLAGS[red_i]
+        prefix = f'{d} days | age {a}y' + ('' if t != t else f' | fever {t}C')
+        texts.append(f'{prefix} :: {text}')
+
+    rf = rng.random((n, len(RISK_FACTORS))) < 0.12
+    rf[:, RISK_FACTORS.index('infant<1y')] = (age < 1.0) & (rng.random(n) < 0.8)
+    rf[:, RISK_FACTORS.index('elder>65')] = (age >= 65) & (rng.random(n) < 0.6)
+    exposures = rng.random((n, len(EXPOSURES))) < 0.2
+    risk_factors = _set_names(rf, RISK_FACTORS)
+    # labels come from the served rules, column-wise
+    label, red = RuleSet.current().evaluate(texts, age, fever, duration, risk_factors)
+    return pd.DataFrame({
+        'case_id': [f'CASE_{i:05d}' for i in range(start_id, start_id + n)],
+        'age': age,
+        'sex': np.where(rng.random(n) < 0.5, 'M', 'F'),
+        'symptoms_text': texts,
+        'duration_days': duration,
+        'fever_temp_c': fever,
+        'vitals_available': np.where(rng.random(n) < 0.25, 'Y', 'N'),
+        'risk_factors': risk_factors,
+        'exposures': _set_names(exposures, EXPOSURES),
+        'top_conditions': top_conditions,
+        'primary_condition': names,
+        'triage_label': label,
+        'red_flags_present': np.where(red, 'Y', 'N'),
+        'notes_source': 'synthetic_v1',
+        'split': stratified_split(names, rng),
+    }, columns=COLUMNS)
+
+def _chunk_csv(chunk_index, start_id, n, seed):
+    # workers hand back CSV text, which is cheaper to pickle than a DataFrame
+    return generate_chunk(chunk_index, start_id, n, seed).to_csv(index=False, header=False)
+
+def generate_parallel(n, out, chunk_size=100_000, workers=1, seed=42):
+    """Stream n rows to `out` chunk by chunk; at most 2 x workers chunks are held in memory."""
+    from concurrent.futures import ProcessPoolExecutor
+    specs = [(i, 1 + i * chunk_size, min(chunk_size, n - i * chunk_size), seed) for i in range(-(-n // chunk_size))]
+    tmp = f'{out}.tmp'
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        f.write(','.join(COLUMNS) + '\n')
+        if workers <= 1:
+            for spec in specs:
+                f.write(_chunk_csv(*spec))
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                pending = []
+                for spec in specs:
+                    pending.append(pool.submit(_chunk_csv, *spec))
+                    if len(pending) >= 2 * workers:
+                        f.write(pending.pop(0).result())
+                for fut in pending:
+                    f.write(fut.result())
+    os.replace(tmp, out)
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--n', type=int, default=5000)
     parser.add_argument('--out', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--workers', type=int, default=None, help='use the vectorized chunked generator with this many processes')
+    parser.add_argument('--chunk-size', type=int, default=100_000, help='rows per chunk (vectorized mode; part of what the output depends on)')
+    parser.add_argument('--seed', type=int, default=42, help='vectorized mode seed')
     args = parser.parse_args()
+    if args.workers is not None:
+        generate_parallel(args.n, args.out, args.chunk_size, args.workers, args.seed)
+        print({'path': args.out, 'n': args.n, 'workers': args.workers, 'chunk_size': args.chunk_size, 'seed': args.seed})
+        return
     rows = [generate_case(i+1) for i in range(args.n)]
     df = pd.DataFrame(rows)
     train_df, temp_df = train_test_split(df, test_size=0.3, random_state=42, stratify=df['primary_condition'])
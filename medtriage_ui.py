@@ -7,11 +7,14 @@ Limitations:
 - Tkinter cannot perfectly replicate glassmorphism/gradients, but this UI approximates layout
   (sidebar + form + results), typography, and interactions (multi-selects, numeric steppers).
 - The app *attempts* to POST to http://localhost:8000/triage using urllib.request (stdlib).
-  If the endpoint isn't reachable, it falls back to a local heuristic simulator.
+  If the endpoint isn't reachable, it falls back to the real model run in-process (loaded in
+  the background at startup when numpy/scikit-learn are installed), and to a local heuristic
+  simulator until that model is ready.
 
 How to run:
     python medtriage_ui.py              # runs developer tests, then launches the GUI (if a display is available)
-    python medtriage_ui.py --no-gui     # runs only the developer tests (useful in headless environments)
+    python medtriage_ui.py --no-gui     # runs only the developer tests, including the client and embedded-model ones (useful in headless environments)
+    python medtriage_ui.py --offline    # never call the API; use the embedded model (heuristic until it has loaded)
 
 This file contains a small developer test harness validating helper functions.
 
@@ -35,16 +38,20 @@ const App = () => {
 """
 from __future__ import annotations
 
+import http.client
 import json
 import math
+import os
 import sys
 import threading
 import time
 import urllib.request
 import urllib.error
+import urllib.parse
 import re
+from collections import deque
 from dataclasses import dataclass, field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional
 
 # Tkinter imports (std lib)
 try:
@@ -152,15 +159,257 @@ def simulate_triage(payload: Dict[str, Any]) -> Dict[str, Any]:
         "reasons": reasons,
     }
 
+# ---------------------- API Client ----------------------
+
+API_BASE_URL = "http://localhost:8000"
+
+def normalize_api_response(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map the FastAPI /triage response (parallel top_conditions / top_probabilities lists)
+    onto the shape the UI renders: top_conditions as [{"condition", "probability"}].
+    """
+    conds = data.get("top_conditions") or []
+    if conds and isinstance(conds[0], dict):
+        return data
+    probs = data.get("top_probabilities") or [0.0] * len(conds)
+    out = dict(data)
+    out["top_conditions"] = [{"condition": c, "probability": float(p)} for c, p in zip(conds, probs)]
+    out.setdefault("reasons", "Model prediction from the triage API; triage level from the safety rules. For education only.")
+    return out
+
+class RttStats:
+    """Round-trip times (ms) per mode over the most recent `window` calls."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.samples: Dict[str, deque] = {}
+        self.counts: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def add(self, mode: str, ms: float):
+        with self.lock:
+            self.samples.setdefault(mode, deque(maxlen=self.window)).append(ms)
+            self.counts[mode] = self.counts.get(mode, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            out = {}
+            for mode, d in self.samples.items():
+                xs = sorted(d)
+                out[mode] = {"count": self.counts[mode], "last_ms": round(d[-1], 2), "mean_ms": round(sum(xs) / len(xs), 2),
+                             "p50_ms": round(xs[len(xs) // 2], 2), "p95_ms": round(xs[min(len(xs) - 1, int(len(xs) * 0.95))], 2),
+                             "max_ms": round(xs[-1], 2)}
+            return out
+
+class TriageClient:
+    """
+    Keep-alive client for the triage API with a health-probe thread and a circuit breaker.
+
+    - One persistent HTTP/1.1 connection is reused across submits.
+    - A daemon thread GETs /health every `probe_interval` seconds on its own connection.
+    - Any failed request or probe opens the breaker: calls then go straight to the
+      local fallback without touching the network. The next successful probe closes it.
+    """
+
+    CLOSED, OPEN = "closed", "open"
+
+    def __init__(self, base_url: str = API_BASE_URL, timeout: float = 3.0, probe_interval: float = 2.0,
+                 probe_timeout: float = 1.0, fallback: Callable[[Dict[str, Any]], Dict[str, Any]] = None, start_probe: bool = True):
+        u = urllib.parse.urlsplit(base_url)
+        self.host, self.port = u.hostname or "localhost", u.port or 80
+        self.timeout, self.probe_interval, self.probe_timeout = timeout, probe_interval, probe_timeout
+        self.fallback = fallback or simulate_triage
+        self.state = self.CLOSED
+        self.rtt = RttStats()
+        self.last_error: Optional[str] = None
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._probe_thread = None
+        if start_probe:
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="triage-health-probe", daemon=True)
+            self._probe_thread.start()
+
+    # -- breaker --
+    def _trip(self, err: Exception):
+        self.state = self.OPEN
+        self.last_error = f"{type(err).__name__}: {err}"
+
+    def probe(self) -> bool:
+        t0 = time.perf_counter()
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.probe_timeout)
+        try:
+            conn.request("GET", "/health")
+            resp = conn.getresponse()
+            resp.read()
+            ok = resp.status == 200
+        except Exception as e:
+            self._trip(e)
+            return False
+        finally:
+            conn.close()
+        self.rtt.add("probe", (time.perf_counter() - t0) * 1000.0)
+        if ok:
+            self.state = self.CLOSED
+        else:
+            self._trip(RuntimeError(f"/health returned {resp.status}"))
+        return ok
+
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.probe_interval)
+
+    # -- requests --
+    def _post(self, path: str, body: bytes) -> Dict[str, Any]:
+        # a kept-alive socket may have been closed by the server while idle: retry once on a fresh one
+        for attempt in (0, 1):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+                resp = self._conn.getresponse()
+                raw = resp.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self._conn.close()
+                self._conn = None
+                raise
+            if resp.status != 200:
+                raise RuntimeError(f"{path} returned {resp.status}")
+            return json.loads(raw.decode("utf-8"))
+
+    def triage(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Result dict in UI shape, plus "_mode" ("api", "embedded" or "fallback") and "_rtt_ms"."""
+        t0 = time.perf_counter()
+        if self.state == self.CLOSED:
+            try:
+                with self._lock:
+                    data = normalize_api_response(self._post("/triage", json.dumps(payload).encode("utf-8")))
+                ms = (time.perf_counter() - t0) * 1000.0
+                self.rtt.add("api", ms)
+                return {**data, "_mode": "api", "_rtt_ms": ms}
+            except Exception as e:
+                self._trip(e)
+        t1 = time.perf_counter()
+        data = self.fallback(payload)
+        mode = data.get("_mode", "fallback")  # local fallbacks may say which path answered
+        self.rtt.add(mode, (time.perf_counter() - t1) * 1000.0)
+        return {**data, "_mode": mode, "_rtt_ms": (time.perf_counter() - t0) * 1000.0}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "last_error": self.last_error, "rtt": self.rtt.summary()}
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# ---------------------- Embedded Model ----------------------
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class EmbeddedModel:
+    """
+    The real triage model, run in-process for offline use.
+
+    `start()` loads the artifacts in a background thread so the window opens at once;
+    until `ready` is set (or if numpy/scikit-learn or the artifacts are missing),
+    `local_triage` keeps answering with the heuristic simulator. `done` is set
+    once loading has finished either way.
+    """
+
+    def __init__(self, model_dir: str = MODEL_DIR, top_k: int = 3):
+        self.model_dir = model_dir
+        self.top_k = top_k
+        self.model = None
+        self.status = "not started"  # not started | loading | ready | unavailable
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.timings = RttStats()
+
+    def start(self):
+        if self.status == "not started":
+            self.status = "loading"
+            threading.Thread(target=self._load, name="embedded-model-load", daemon=True).start()
+        return self
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            if self.model_dir not in sys.path:
+                sys.path.insert(0, self.model_dir)
+            from inference import TriageModel  # heavy imports (numpy, scipy, sklearn) happen here, off the UI thread
+            from rules import triage_from_rules
+            self.model = TriageModel.load(self.model_dir)
+            self._rules = triage_from_rules
+            self.model.predict_top([""], self.top_k)  # warm-up so the first submit is not the slow one
+        except Exception as e:
+            self.status, self.error = "unavailable", f"{type(e).__name__}: {e}"
+        finally:
+            self.load_ms = (time.perf_counter() - t0) * 1000.0
+        if self.error is None:
+            self.status = "ready"
+            self.ready.set()
+        self.done.set()  # on both paths, so waiters never sit out a timeout
+
+    def triage(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        text = payload.get("symptoms_text") or ""
+        fever = payload.get("fever_temp_c")
+        top_idx, top_probs = self.model.predict_top([text], self.top_k)
+        triage, redflag = self._rules(text, float(payload.get("age", 25.0) or 0.0), None if fever in (None, "") else float(fever),
+                                      int(payload.get("duration_days", 3) or 0), payload.get("risk_factors") or [])
+        ms = (time.perf_counter() - t0) * 1000.0
+        self.timings.add("inference", ms)
+        return {
+            "triage": triage,
+            "emergency": bool(redflag),
+            "top_conditions": [{"condition": str(self.model.labels[i]), "probability": float(p)} for i, p in zip(top_idx[0], top_probs[0])],
+            "reasons": "Offline result from the embedded model; triage level from the safety rules. For education only.",
+            "_mode": "embedded",
+            "_inference_ms": ms,
+        }
+
+_embedded: Optional[EmbeddedModel] = None
+
+def get_embedded() -> EmbeddedModel:
+    global _embedded
+    if _embedded is None:
+        _embedded = EmbeddedModel()
+    return _embedded
+
+def local_triage(payload: Dict[str, Any], embedded: Optional[EmbeddedModel] = None) -> Dict[str, Any]:
+    """Embedded model (the shared one by default) when loaded, heuristic simulator until then."""
+    embedded = embedded or get_embedded()
+    if embedded.ready.is_set():
+        return embedded.triage(payload)
+    return simulate_triage(payload)
+
+_client: Optional[TriageClient] = None
+OFFLINE = False  # --offline: never call the API, answer locally
+
+def get_client() -> TriageClient:
+    global _client
+    if _client is None:
+        _client = TriageClient(fallback=local_triage)
+    return _client
+
 def call_api_or_simulate(payload: Dict[str, Any]) -> Dict[str, Any]:
-    url = "http://localhost:8000/triage"
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
-    try:
-        with urllib.request.urlopen(req, timeout=3) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except Exception:
-        return simulate_triage(payload)
+    if OFFLINE:
+        t0 = time.perf_counter()
+        data = local_triage(payload)
+        return {**data, "_mode": data.get("_mode", "fallback"), "_rtt_ms": (time.perf_counter() - t0) * 1000.0}
+    return get_client().triage(payload)
 
 # ---------------------- GUI ----------------------
 
@@ -282,6 +531,9 @@ class MedTriageApp:
         self.rationale_label = tk.Label(self.result_frame, text="", wraplength=560, justify="left", bg="#f8fafc")
         self.rationale_label.pack(fill="x", padx=12, pady=(6, 10))
 
+        self.status_label = tk.Label(self.result_frame, text="", font=("SF Pro Text", 9), fg="#6b7280", bg="#f8fafc", anchor="w")
+        self.status_label.pack(fill="x", padx=12, pady=(0, 6))
+
     def _collect_payload(self) -> Dict[str, Any]:
         symptoms_text = self.symptoms.get("1.0", "end").strip()
         age = int(self.age_var.get())
@@ -321,6 +573,24 @@ class MedTriageApp:
             tk.Label(row, text=name, bg="#f8fafc").pack(side="left")
             tk.Label(row, text=f"{prob:.1f}%", bg="#f8fafc").pack(side="right")
 
+    def _status_text(self, data: Dict[str, Any]) -> str:
+        mode = {"api": "API", "embedded": "Embedded model", "fallback": "Offline heuristic"}.get(data.get("_mode"), "?")
+        text = f"{mode} · {data.get('_rtt_ms', 0.0):.1f} ms"
+        rtt = {} if OFFLINE else get_client().stats()["rtt"]
+        for m in ("api", "embedded", "fallback"):
+            if m in rtt:
+                text += f"  |  {m}: p50 {rtt[m]['p50_ms']:.1f} ms, p95 {rtt[m]['p95_ms']:.1f} ms (n={rtt[m]['count']})"
+        emb = get_embedded()
+        if emb.status == "ready":
+            text += f"  |  embedded model cold load {emb.load_ms:.0f} ms"
+        elif emb.status == "loading":
+            text += "  |  embedded model loading..."
+        elif emb.status == "unavailable":
+            text += f"  |  embedded model unavailable ({emb.error})"
+        if not OFFLINE and get_client().state == TriageClient.OPEN:
+            text += "  |  server unreachable, retrying in background"
+        return text
+
     def on_submit(self):
         payload = self._collect_payload()
         self.submit_btn.configure(state="disabled", text="Analyzing...")
@@ -333,6 +603,7 @@ class MedTriageApp:
                 self._set_triage_chip(data.get("triage","Self-care"))
                 self._render_conditions(data.get("top_conditions", []))
                 self.rationale_label.configure(text=data.get("reasons",""))
+                self.status_label.configure(text=self._status_text(data))
                 self.submit_btn.configure(state="normal", text="Get Triage & Conditions")
             try:
                 self.root.after(0, ui)
@@ -342,7 +613,8 @@ class MedTriageApp:
 
 # ---------------------- Developer Tests ----------------------
 
-def run_dev_tests() -> list[tuple[str, bool]]:
+def run_dev_tests(integration: bool = False) -> list[tuple[str, bool]]:
+    """Quick checks; `integration` (--no-gui) adds the stub-server and model-loading ones, so GUI startup stays fast."""
     tests = []
     def t(name, fn):
         try:
@@ -367,8 +639,98 @@ def run_dev_tests() -> list[tuple[str, bool]]:
     sample = simulate_triage({"age": 12, "fever_temp_c": 38.5, "duration_days": 3, "symptoms_text": "fever cough sore throat", "risk_factors": [], "exposures": []})
     t("simulate keys", lambda: all(k in sample for k in ("triage", "top_conditions", "reasons")))
 
+    # API response normalisation
+    norm = normalize_api_response({"triage": "Urgent", "emergency": False, "top_conditions": ["Influenza", "Common Cold"], "top_probabilities": [0.9, 0.2]})
+    t("normalize api shape", lambda: norm["top_conditions"] == [{"condition": "Influenza", "probability": 0.9}, {"condition": "Common Cold", "probability": 0.2}] and "reasons" in norm)
+    t("normalize passthrough", lambda: normalize_api_response(sample) is sample)
+
+    if integration:
+        # pooled client + breaker against a local stub server, then the embedded model
+        _client_tests(t)
+        _embedded_tests(t)
+
     return tests
 
+def _embedded_tests(t):
+    # embedded model: heuristic until loaded, then the real classes
+    emb = EmbeddedModel()
+    t("embedded not ready -> heuristic", lambda: not emb.ready.is_set() and local_triage({"symptoms_text": "cough"}, emb).get("_mode") is None)
+    emb.start()
+    emb.done.wait(60)
+    if emb.status == "ready":
+        res = emb.triage({"symptoms_text": "fever 39C, productive cough, short of breath", "age": 54, "fever_temp_c": 39.0, "duration_days": 4})
+        t("embedded uses model classes", lambda: res["top_conditions"][0]["condition"] in {str(x) for x in emb.model.labels} and len(res["top_conditions"]) == 3)
+        t("embedded rules triage", lambda: res["triage"] in ("Emergency", "Urgent", "GP within 48h", "Home care"))
+        t("embedded timings", lambda: emb.load_ms > 0 and emb.timings.summary()["inference"]["count"] == 1)
+        t("embedded ready -> model", lambda: local_triage({"symptoms_text": "cough"}, emb).get("_mode") == "embedded")
+    else:
+        # numpy/scikit-learn or the artifacts are not available here: the heuristic must keep answering
+        t("embedded unavailable -> heuristic", lambda: emb.status == "unavailable" and "triage" in simulate_triage({}))
+
+def _client_tests(t):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Stub(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        connections = set()
+        alive = True
+
+        def _send(self, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._send({"status": "ok"})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not Stub.alive:  # a dead server also drops connections it had kept alive
+                self.close_connection = True
+                return
+            if self.path == "/triage":
+                Stub.connections.add(self.client_address)
+            self._send({"triage": "Home care", "emergency": False, "top_conditions": ["Common Cold"], "top_probabilities": [0.8]})
+
+        def log_message(self, *args):
+            pass
+
+    def serve(port=0):
+        Stub.alive = True
+        srv = ThreadingHTTPServer(("127.0.0.1", port), Stub)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        return srv
+
+    srv = serve()
+    port = srv.server_address[1]
+    client = TriageClient(f"http://127.0.0.1:{port}", timeout=1.0, probe_interval=0.05, probe_timeout=0.2)
+    try:
+        payload = {"symptoms_text": "runny nose", "age": 30}
+        first = [client.triage(payload) for _ in range(5)]
+        t("client api mode", lambda: all(r["_mode"] == "api" and r["top_conditions"][0]["condition"] == "Common Cold" for r in first))
+        t("client keep-alive reuse", lambda: len(Stub.connections) == 1)
+        Stub.alive = False
+        srv.shutdown(); srv.server_close()
+        down = client.triage(payload)
+        t("client falls back when down", lambda: down["_mode"] == "fallback" and client.state == TriageClient.OPEN)
+        t0 = time.perf_counter()
+        fast = client.triage(payload)
+        t("open breaker skips network", lambda: fast["_mode"] == "fallback" and (time.perf_counter() - t0) < 0.05)
+        srv = serve(port)
+        deadline = time.time() + 2.0
+        while client.state != TriageClient.CLOSED and time.time() < deadline:
+            time.sleep(0.02)
+        back = client.triage(payload)
+        t("client reconnects after recovery", lambda: back["_mode"] == "api")
+        rtt = client.stats()["rtt"]
+        t("rtt stats per mode", lambda: {"api", "fallback", "probe"} <= set(rtt) and rtt["api"]["count"] == 6)
+    finally:
+        client.close()
+        srv.shutdown(); srv.server_close()
+
 def _print_test_summary(tests):
     passed = sum(1 for _, ok in tests if ok)
     total = len(tests)
@@ -392,13 +754,17 @@ def _can_launch_gui() -> bool:
 
 def main(argv=None):
     argv = argv or sys.argv[1:]
-    tests = run_dev_tests()
+    headless_only = "--no-gui" in argv or "-q" in argv
+    tests = run_dev_tests(integration=headless_only)
     _print_test_summary(tests)
 
-    headless_only = "--no-gui" in argv or "-q" in argv
     if headless_only:
         return 0
 
+    global OFFLINE
+    OFFLINE = "--offline" in argv
+    get_embedded().start()  # loads in the background; the window does not wait for it
+
     if not _can_launch_gui():
         print("[Info] GUI not launched (likely headless environment). Run without --no-gui on a desktop to see the UI.")
         return 0
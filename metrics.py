@@ -0,0 +1,158 @@
+# metrics.py: low-overhead counters, gauges and latency histograms in Prometheus text format
+import bisect, threading, time
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUANTILES = (0.5, 0.9, 0.99)
+
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs) + '}'
+
+def _fmt_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Registry:
+    def __init__(self):
+        self.enabled = True
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        """fn() -> iterable of (name, type, help, [(labels_dict, value), ...]) rendered at scrape time."""
+        self.collectors.append(fn)
+
+    def render(self):
+        lines = []
+        for m in self.metrics:
+            lines += m.render()
+        for fn in self.collectors:
+            for name, kind, help_, samples in fn():
+                lines += [f'# HELP {name} {help_}', f'# TYPE {name} {kind}']
+                lines += [f'{name}{_fmt_labels(list(lbl), list(lbl.values()))} {_fmt_value(v)}' for lbl, v in samples]
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_, labelnames=(), registry=REGISTRY):
+        self.name, self.help, self.labelnames = name, help_, tuple(labelnames)
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f'{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}' for k, v in items]
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+class _HistogramChild:
+    __slots__ = ('counts', 'sum', 'slots', 'slot_ids')
+
+    def __init__(self, n_buckets, n_slots):
+        self.counts = [0] * (n_buckets + 1)
+        self.sum = 0.0
+        self.slots = [[0] * (n_buckets + 1) for _ in range(n_slots)]
+        self.slot_ids = [-1] * n_slots
+
+class Histogram(_Metric):
+    """Cumulative Prometheus histogram plus a rolling window for recent quantiles.
+
+    The window is a ring of `window_s / n_slots`-second slots of bucket counts;
+    `quantile()` merges the slots still inside the window, so it reflects only
+    the last `window_s` seconds and is exported as `<name>_rolling{quantile=...}`.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_, labelnames=(), buckets=LATENCY_BUCKETS, window_s=60.0, n_slots=6, registry=REGISTRY):
+        super().__init__(name, help_, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        self.n_slots = n_slots
+        self.slot_s = window_s / n_slots
+
+    def observe(self, value, *labelvalues):
+        self.observe_many(((value, labelvalues),))
+
+    def observe_many(self, observations):
+        """Record several (value, labelvalues) pairs under one lock and clock read."""
+        if not self.registry.enabled:
+            return
+        sid = int(time.monotonic() / self.slot_s)
+        j = sid % self.n_slots
+        with self._lock:
+            for value, labelvalues in observations:
+                i = bisect.bisect_left(self.buckets, value)
+                child = self._values.get(labelvalues)
+                if child is None:
+                    child = self._values[labelvalues] = _HistogramChild(len(self.buckets), self.n_slots)
+                child.counts[i] += 1
+                child.sum += value
+                if child.slot_ids[j] != sid:
+                    child.slots[j] = [0] * (len(self.buckets) + 1)
+                    child.slot_ids[j] = sid
+                child.slots[j][i] += 1
+
+    def quantile(self, q, *labelvalues):
+        """Upper bound of the bucket holding the q-quantile over the rolling window (None if empty)."""
+        now = int(time.monotonic() / self.slot_s)
+        with self._lock:
+            child = self._values.get(labelvalues)
+            if child is None:
+                return None
+            merged = [sum(col) for col in zip(*[s for s, sid in zip(child.slots, child.slot_ids) if now - sid < self.n_slots])]
+        total = sum(merged)
+        if not total:
+            return None
+        seen = 0
+        for bound, c in zip(self.buckets + (float('inf'),), merged):
+            seen += c
+            if seen >= q * total:
+                return bound
+        return float('inf')
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted((k, list(c.counts), c.sum) for k, c in self._values.items())
+        for key, counts, total in items:
+            cum = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cum += c
+                lines.append(f'{self.name}_bucket{_fmt_labels(self.labelnames, key, [("le", _fmt_value(bound))])} {cum}')
+            lines.append(f'{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}')
+            lines.append(f'{self.name}_count{_fmt_labels(self.labelnames, key)} {cum}')
+        rolling = [(key, q, self.quantile(q, *key)) for key, _, _ in items for q in QUANTILES]
+        if rolling:
+            lines += [f'# HELP {self.name}_rolling {self.help} (bucket upper bound, last {self.slot_s * self.n_slots:g}s)',
+                      f'# TYPE {self.name}_rolling gauge']
+            lines += [f'{self.name}_rolling{_fmt_labels(self.labelnames, key, [("quantile", q)])} {_fmt_value(v)}'
+                      for key, q, v in rolling if v is not None]
+        return lines
@@ -0,0 +1,128 @@
+# microbatch.py: coalesce concurrent single-case requests into one scoring call
+import threading, time, queue
+from concurrent.futures import Future
+
+# upper bounds of the batch-size and queue-wait histogram buckets
+SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+WAIT_BUCKETS_MS = [0.25, 0.5, 1, 2, 5, 10, 25, 50, 100]
+
+def _bucket(buckets, value):
+    for b in buckets:
+        if value <= b:
+            return str(b)
+    return '+Inf'
+
+class MicroBatcher:
+    """Collects items submitted from many threads and scores them together.
+
+    A batch is closed when it reaches `max_batch` items or when `window_ms` has
+    passed since its first item was queued, whichever comes first. `score_fn`
+    receives a list of items and must return one result per item, in order;
+    when it raises or returns a different number of results, the items are
+    scored one at a time instead. `submit` raises RuntimeError after `close`.
+    """
+
+    def __init__(self, score_fn, max_batch=32, window_ms=2.0):
+        self.score_fn = score_fn
+        self.max_batch = max(1, int(max_batch))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._reset_stats()
+        self._thread = threading.Thread(target=self._run, name='microbatcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        fut = Future()
+        with self._lock:  # so nothing is queued behind the stop marker, where no thread would take it
+            if self._closed:
+                raise RuntimeError('MicroBatcher is closed')
+            self._queue.put((item, fut, time.perf_counter()))
+        return fut.result()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first[2] + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                nxt = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                self._queue.put(None)  # let the outer loop see the stop marker
+                break
+            batch.append(nxt)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            started = time.perf_counter()
+            self._record(len(batch), [started - enq for _, _, enq in batch])
+            items = [item for item, _, _ in batch]
+            try:
+                results = list(self.score_fn(items))
+            except Exception:
+                results = None
+            if results is not None and len(results) == len(batch):
+                for (_, fut, _), res in zip(batch, results):
+                    fut.set_result(res)
+                continue
+            # score one by one so a single bad item does not fail its neighbours
+            for item, fut, _ in batch:
+                try:
+                    fut.set_result(self.score_fn([item])[0])
+                except Exception as e:
+                    fut.set_exception(e)
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._max_size = 0
+        self._wait_sum = 0.0
+        self._wait_max = 0.0
+        self._size_hist = {str(b): 0 for b in SIZE_BUCKETS + ['+Inf']}
+        self._wait_hist = {str(b): 0 for b in WAIT_BUCKETS_MS + ['+Inf']}
+
+    def _record(self, size, waits):
+        with self._lock:
+            self._batches += 1
+            self._items += size
+            self._max_size = max(self._max_size, size)
+            self._size_hist[_bucket(SIZE_BUCKETS, size)] += 1
+            for w in waits:
+                self._wait_sum += w
+                self._wait_max = max(self._wait_max, w)
+                self._wait_hist[_bucket(WAIT_BUCKETS_MS, w * 1000.0)] += 1
+
+    def stats(self, reset=False):
+        with self._lock:
+            out = {
+                'max_batch': self.max_batch,
+                'window_ms': self.window * 1000.0,
+                'batches': self._batches,
+                'items': self._items,
+                'mean_batch_size': round(self._items / self._batches, 3) if self._batches else 0.0,
+                'max_batch_size': self._max_size,
+                'batch_size_hist': dict(self._size_hist),
+                'mean_wait_ms': round(self._wait_sum / self._items * 1000.0, 4) if self._items else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000.0, 4),
+                'wait_ms_hist': dict(self._wait_hist),
+                'pending': self._queue.qsize(),
+            }
+            if reset:
+                self._reset_stats()
+        return out
@@ -0,0 +1,161 @@
+# model_registry.py: versioned model directories, smoke validation and atomic hot swap
+import argparse, os, shutil, threading, time
+import numpy as np
+from inference import ARTIFACTS, TriageModel
+from flat_artifact import FLAT_ARTIFACT
+
+# Layout: <root>/<version>/ holds one model's artifact files; <root>/CURRENT
+# names the version to serve. Without a CURRENT file the artifacts in the
+# working directory are served, as before versioned directories existed.
+CURRENT = 'CURRENT'
+SMOKE_MIN_RECALL = 0.75
+
+def read_current(root):
+    try:
+        with open(os.path.join(root, CURRENT), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def set_current(root, version):
+    if not os.path.isdir(os.path.join(root, version)):
+        raise FileNotFoundError(f'no model version {version!r} under {root}')
+    tmp = os.path.join(root, f'.{CURRENT}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(tmp, os.path.join(root, CURRENT))  # watchers never read a half-written pointer
+
+def model_dir(root, version=None):
+    version = version or read_current(root)
+    return ('.', None) if version is None else (os.path.join(root, version), version)
+
+def publish(src, root, version=None, activate=False):
+    """Copy the artifacts in `src` to <root>/<version> (default: the model's artifact hash)."""
+    files = [name for name in ARTIFACTS + (FLAT_ARTIFACT,) if os.path.exists(os.path.join(src, name))]
+    if not all(name in files for name in ARTIFACTS) and FLAT_ARTIFACT not in files:
+        raise FileNotFoundError(f'{src} has neither the joblib artifacts nor {FLAT_ARTIFACT}')
+    version = version or TriageModel.load(src).version
+    dest = os.path.join(root, version)
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, f'.{version}.tmp')
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in files:
+        shutil.copy2(os.path.join(src, name), os.path.join(tmp, name))
+    if os.path.exists(dest):
+        shutil.rmtree(tmp)
+    else:
+        os.replace(tmp, dest)
+    if activate:
+        set_current(root, version)
+    return version
+
+def smoke_cases():
+    from demo_cases import DEMO_CASES
+    return [(', '.join(c['trigger_keywords'][:4]), c['conditions'][0][0]) for c in DEMO_CASES]
+
+def validate(model, cases=None, min_recall=SMOKE_MIN_RECALL):
+    """Problems found scoring the smoke set (empty list = fit to serve)."""
+    cases = smoke_cases() if cases is None else cases
+    try:
+        probs = model.predict_proba(model.featurize([text for text, _ in cases]))
+    except Exception as e:
+        return [f'scoring failed: {type(e).__name__}: {e}']
+    problems = []
+    if probs.shape != (len(cases), len(model.labels)):
+        problems.append(f'probability matrix has shape {probs.shape}, expected {(len(cases), len(model.labels))}')
+        return problems
+    if not np.isfinite(probs).all() or probs.min() < 0 or probs.max() > 1:
+        problems.append('probabilities are not finite values in [0, 1]')
+    labels = [str(x) for x in model.labels]
+    known = [(i, expected) for i, (_, expected) in enumerate(cases) if expected in labels]
+    if known:
+        top3 = np.argsort(-probs, axis=1)[:, :3]
+        hits = sum(labels.index(expected) in top3[i] for i, expected in known)
+        if hits / len(known) < min_recall:
+            problems.append(f'smoke recall@3 {hits}/{len(known)} below {min_recall:.0%}')
+    return problems
+
+class ModelManager:
+    """Holds the serving TriageModel and replaces it without blocking requests.
+
+    Readers take `manager.current` once per scoring call, so a call uses one
+    model object (featurizer, weights and labels together) even if a swap lands
+    mid-request. Loading and validation run off the request path; the swap
+    itself is a single reference assignment.
+    """
+
+    def __init__(self, root='models', min_recall=SMOKE_MIN_RECALL):
+        self.root = root
+        self.min_recall = min_recall
+        self.listeners = []
+        self._lock = threading.Lock()  # one load at a time
+        self._watcher = None
+        directory, self.dir_version = model_dir(root)
+        self.current, self.current_dir = TriageModel.load(directory), directory
+        self.last_reload = {'status': 'initial', 'version': self.current.version, 'dir': directory}
+
+    def on_swap(self, fn):
+        self.listeners.append(fn)
+
+    def reload(self, version=None):
+        """Load `version` (default: CURRENT), validate it and swap it in; returns a status dict."""
+        with self._lock:
+            t0 = time.perf_counter()
+            directory, dir_version = model_dir(self.root, version)
+            status = {'dir': directory, 'requested': version or dir_version}
+            try:
+                candidate = TriageModel.load(directory)
+            except Exception as e:
+                status.update(status='failed', problems=[f'load failed: {type(e).__name__}: {e}'])
+            else:
+                problems = validate(candidate, min_recall=self.min_recall)
+                if problems:
+                    status.update(status='rejected', version=candidate.version, problems=problems)
+                elif candidate.version == self.current.version:
+                    status.update(status='unchanged', version=candidate.version)
+                else:
+                    previous, self.current, self.current_dir = self.current.version, candidate, directory
+                    for fn in self.listeners:
+                        fn(candidate)
+                    status.update(status='swapped', version=candidate.version, previous=previous)
+            self.dir_version = dir_version
+            status['seconds'] = round(time.perf_counter() - t0, 3)
+            self.last_reload = status
+            return status
+
+    def reload_async(self, version=None):
+        thread = threading.Thread(target=self.reload, args=(version,), name='model-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def watch(self, interval_s):
+        """Poll <root>/CURRENT every interval_s seconds and reload when the pointer changes.
+
+        Only pointer changes trigger a reload, so a version picked explicitly via
+        reload(version) stays in place until CURRENT is moved again.
+        """
+        def loop():
+            seen = read_current(self.root)
+            while True:
+                time.sleep(interval_s)
+                version = read_current(self.root)
+                if version is not None and version != seen:
+                    seen = version
+                    self.reload(version)
+        self._watcher = threading.Thread(target=loop, name='model-watch', daemon=True)
+        self._watcher.start()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Publish model artifacts as a versioned directory')
+    parser.add_argument('--src', type=str, default='.', help='directory holding the artifacts to publish')
+    parser.add_argument('--root', type=str, default=os.environ.get('MEDTRIAGE_MODEL_ROOT', 'models'))
+    parser.add_argument('--version', type=str, default=None, help='version name (default: artifact content hash)')
+    parser.add_argument('--activate', action='store_true', help='point CURRENT at it (running servers that watch will swap)')
+    args = parser.parse_args()
+    model = TriageModel.load(args.src)
+    problems = validate(model)
+    if problems:
+        raise SystemExit(f'not publishing: {problems}')
+    version = publish(args.src, args.root, args.version or model.version, args.activate)
+    print({'version': version, 'dir': os.path.join(args.root, version), 'active': read_current(args.root)})
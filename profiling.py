@@ -0,0 +1,319 @@
+# profiling.py: on-demand sampling CPU profiles, tracemalloc snapshots and size reports for a live server
+import argparse, collections, json, multiprocessing, os, signal, stat, sys, tempfile, threading, time, tracemalloc, urllib.error, urllib.request, uuid
+
+# Nothing here runs until an admin endpoint asks for it: the sampler is a thread
+# started per profile and tracemalloc is only on between memory start/stop.
+
+IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py', 'connection.py')
+
+def _frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+def _is_idle(frame):
+    return os.path.basename(frame.f_code.co_filename) in IDLE_FILES or frame.f_code.co_name in ('select', 'poll', 'accept')
+
+class SamplingProfiler:
+    """Samples every thread's Python stack at a fixed interval from a separate thread.
+
+    Results are collapsed stacks ("root;...;leaf count", the flame graph input
+    format) plus a pstats-like table of self and total samples per function.
+    """
+
+    def __init__(self, interval_s=0.005, include_idle=False):
+        self.interval_s, self.include_idle = interval_s, include_idle
+        self.stacks = collections.Counter()
+        self.samples = 0
+
+    def run(self, seconds):
+        skip = {threading.get_ident()}  # the caller only sleeps here
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident in skip or (not self.include_idle and _is_idle(frame)):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval_s)
+        return self
+
+    def collapsed(self):
+        return ''.join(f'{stack} {n}\n' for stack, n in self.stacks.most_common())
+
+    def top(self, limit=30):
+        own, total = collections.Counter(), collections.Counter()
+        for stack, n in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += n
+            for f in set(frames):
+                total[f] += n
+        n_stacks = sum(self.stacks.values()) or 1
+        return [{'function': f, 'self': own[f], 'total': total[f], 'self_pct': round(100 * own[f] / n_stacks, 1),
+                 'total_pct': round(100 * total[f] / n_stacks, 1)} for f, _ in total.most_common(limit)]
+
+_profile_lock = threading.Lock()
+
+def cpu_profile(seconds, interval_s=0.005, include_idle=False):
+    """Profile for `seconds`; one profile at a time per process."""
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError('a CPU profile is already running in this process')
+    try:
+        return SamplingProfiler(interval_s, include_idle).run(seconds)
+    finally:
+        _profile_lock.release()
+
+class MemoryTracker:
+    """tracemalloc snapshots kept by id, diffed against each other on request."""
+
+    def __init__(self, keep=5):
+        self.keep = keep
+        self.snapshots = collections.OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def start(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return self.status()
+
+    def stop(self):
+        with self._lock:
+            self.snapshots.clear()
+        tracemalloc.stop()
+        return self.status()
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {'tracing': tracemalloc.is_tracing(), 'traced_bytes': current, 'peak_traced_bytes': peak, 'snapshots': list(self.snapshots)}
+
+    def snapshot(self, compare_to=None, limit=25, key_type='lineno'):
+        """Take a snapshot; report its top allocations and the diff against `compare_to` (default: the previous one)."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError('tracemalloc is not running; start it first')
+        snap = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        with self._lock:
+            base_id = compare_to if compare_to is not None else next(reversed(self.snapshots), None)
+            if base_id is not None and base_id not in self.snapshots:
+                raise KeyError(f'no snapshot {base_id}; have {list(self.snapshots)}')
+            base = self.snapshots.get(base_id)
+            snap_id = self._next_id
+            self._next_id += 1
+            self.snapshots[snap_id] = snap
+            while len(self.snapshots) > self.keep:
+                self.snapshots.popitem(last=False)
+        out = {'id': snap_id, 'traced_bytes': sum(s.size for s in snap.statistics('filename')),
+               'top': [{'where': str(s.traceback), 'bytes': s.size, 'count': s.count} for s in snap.statistics(key_type)[:limit]]}
+        if base is not None:
+            out['compared_to'] = base_id
+            out['diff'] = [{'where': str(s.traceback), 'bytes_diff': s.size_diff, 'bytes': s.size, 'count_diff': s.count_diff}
+                           for s in snap.compare_to(base, key_type)[:limit]]
+        return out
+
+def deep_sizeof(obj, seen=None):
+    """Bytes held by `obj` and what it references through containers, arrays and plain attributes."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        # numpy arrays: data only counts when owned, not when it views a mapped file
+        base = getattr(obj, 'base', None)
+        return sys.getsizeof(obj) if base is not None else max(nbytes, sys.getsizeof(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+def process_memory():
+    out = {'pid': os.getpid()}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    out[line.split(':')[0].lower() + '_mb'] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return out
+
+# --- multiple workers ------------------------------------------------------------
+# Under `uvicorn --workers N` a request lands on whichever worker accepts it. A
+# job for another worker is written to <directory>/jobs and that worker is sent
+# SIGUSR1; its handler runs the job on a short-lived thread and writes the result
+# next to it, which the receiving worker returns. Idle workers do nothing: no
+# polling thread, only a registration file and a signal handler. Jobs run
+# without a token check, so the directory must be private to the server's user.
+
+def default_mailbox_dir():
+    # uvicorn starts its workers with multiprocessing, so they share the
+    # supervisor's pid; a single-process server keys the directory on its own
+    parent = multiprocessing.parent_process()
+    server = parent.pid if parent is not None else os.getpid()
+    return os.path.join(tempfile.gettempdir(), f'medtriage-admin-{os.getuid()}-{server}')
+
+def _private_dir(path):
+    """Create `path` with mode 0700, or check an existing one is a directory only we can use."""
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f'{path} must be a directory owned by uid {os.getuid()} with mode 0700')
+
+class WorkerMailbox:
+    def __init__(self, directory, handler, signum=getattr(signal, 'SIGUSR1', None)):
+        self.directory, self.handler, self.signum = directory, handler, signum
+        self.enabled = False
+        self._previous = None
+        os.makedirs(os.path.dirname(os.path.abspath(directory)), exist_ok=True)
+        for path in (directory, os.path.join(directory, 'workers'), os.path.join(directory, 'jobs')):
+            _private_dir(path)
+        self._registration = os.path.join(directory, 'workers', str(os.getpid()))
+        if signum is not None and threading.current_thread() is threading.main_thread():
+            self._previous = signal.signal(signum, self._on_signal)
+            open(self._registration, 'w').close()
+            self.enabled = True
+
+    def close(self):
+        """Unregister this worker and restore the previous signal handler; the last one out removes the directory."""
+        if self.enabled:
+            self.enabled = False
+            _remove(self._registration)
+            signal.signal(self.signum, self._previous if self._previous is not None else signal.SIG_DFL)
+            for path in (os.path.join(self.directory, 'workers'), os.path.join(self.directory, 'jobs'), self.directory):
+                try:
+                    os.rmdir(path)  # fails while other workers are registered or jobs are pending
+                except OSError:
+                    break
+
+    def workers(self):
+        """Live pids registered in the mailbox; stale registrations are removed."""
+        pids = []
+        for name in os.listdir(os.path.join(self.directory, 'workers')):
+            try:
+                os.kill(int(name), 0)
+                pids.append(int(name))
+            except (ValueError, ProcessLookupError):
+                _remove(os.path.join(self.directory, 'workers', name))
+            except PermissionError:
+                pids.append(int(name))
+        return sorted(pids)
+
+    def forward(self, pid, job, timeout):
+        if pid not in self.workers():
+            raise LookupError(f'no worker with pid {pid}; workers: {self.workers()}')
+        job_id = f'{pid}-{uuid.uuid4().hex}'
+        path = os.path.join(self.directory, 'jobs', job_id)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path + '.job')
+        os.kill(pid, self.signum)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(path + '.result'):
+                with open(path + '.result') as f:
+                    out = json.load(f)
+                _remove(path + '.result')
+                return out
+            time.sleep(0.05)
+        if not _remove(path + '.job'):
+            # the worker claimed the job: mark it abandoned so its result is not
+            # left behind; whichever side comes second removes both files
+            open(path + '.abandoned', 'w').close()
+            if os.path.exists(path + '.result'):
+                _remove(path + '.result')
+                _remove(path + '.abandoned')
+        raise TimeoutError(f'worker {pid} did not answer within {timeout:.0f}s')
+
+    def _on_signal(self, signum, frame):
+        threading.Thread(target=self._serve_jobs, name='admin-job', daemon=True).start()
+
+    def _serve_jobs(self):
+        jobs = os.path.join(self.directory, 'jobs')
+        for name in os.listdir(jobs):
+            if not (name.startswith(f'{os.getpid()}-') and name.endswith('.job')):
+                continue
+            path = os.path.join(jobs, name[:-4])
+            try:
+                os.rename(path + '.job', path + '.run')  # claim it; a second signal may race us
+            except OSError:
+                continue
+            with open(path + '.run') as f:
+                job = json.load(f)
+            try:
+                out = {'ok': True, 'result': self.handler(job)}
+            except Exception as e:
+                out = {'ok': False, 'type': type(e).__name__, 'error': f'{type(e).__name__}: {e}'}
+            with open(path + '.tmp', 'w') as f:
+                json.dump(out, f)
+            os.replace(path + '.tmp', path + '.result')
+            _remove(path + '.run')
+            if os.path.exists(path + '.abandoned'):  # the caller timed out
+                _remove(path + '.result')
+                _remove(path + '.abandoned')
+
+def _remove(path):
+    """Remove `path`; False if it was not there (or could not be removed)."""
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+# --- client --------------------------------------------------------------------
+
+def admin_call(url, token, method='GET', pid=None, timeout=120):
+    if pid is not None:
+        url += ('&' if '?' in url else '?') + f'pid={pid}'
+    req = urllib.request.Request(url, method=method, headers={'X-Admin-Token': token})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.headers.get('Content-Type', ''), resp.read()
+    except urllib.error.HTTPError as e:
+        raise SystemExit(f'{e.code}: {e.read().decode(errors="replace")}')
+
+def main(args):
+    base = args.url.rstrip('/')
+    if args.command == 'cpu':
+        path = f'/admin/profile/cpu?seconds={args.seconds}&interval_ms={args.interval_ms}&format={args.format}'
+        _, body = admin_call(base + path, args.token, 'POST', args.pid, timeout=args.seconds + 30)
+    elif args.command == 'memory':
+        path = f'/admin/memory/{args.action}' + (f'?compare_to={args.compare_to}' if args.compare_to else '')
+        _, body = admin_call(base + path, args.token, 'GET' if args.action == 'status' else 'POST', args.pid)
+    elif args.command == 'workers':
+        _, body = admin_call(base + '/admin/workers', args.token)
+    else:
+        _, body = admin_call(base + '/admin/memory/sizes', args.token, 'GET', args.pid)
+    if args.out:
+        with open(args.out, 'wb') as f:
+            f.write(body)
+        print({'out': args.out, 'bytes': len(body)})
+    else:
+        sys.stdout.write(body.decode('utf-8') + '\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile a running serve.py worker through its admin endpoints')
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8000')
+    parser.add_argument('--token', type=str, default=os.environ.get('MEDTRIAGE_ADMIN_TOKEN', ''))
+    parser.add_argument('--pid', type=int, default=None, help='worker to target (see the workers command); default: whichever answers')
+    parser.add_argument('--out', type=str, default=None)
+    sub = parser.add_subparsers(dest='command', required=True)
+    cpu = sub.add_parser('cpu', help='sampling CPU profile')
+    cpu.add_argument('--seconds', type=float, default=10)
+    cpu.add_argument('--interval-ms', type=float, default=5)
+    cpu.add_argument('--format', choices=['collapsed', 'json'], default='collapsed')
+    mem = sub.add_parser('memory', help='tracemalloc control and snapshots')
+    mem.add_argument('action', choices=['start', 'snapshot', 'stop', 'status'])
+    mem.add_argument('--compare-to', type=int, default=None)
+    sub.add_parser('sizes', help='artifact, cache and process memory sizes')
+    sub.add_parser('workers', help='pids of the server workers')
+    args = parser.parse_args()
+    main(args)
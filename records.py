@@ -0,0 +1,60 @@
+# records.py: stream intake records from dataset CSVs and JSONL request logs
+import csv, json, math
+from itertools import islice
+
+CASE_FIELDS = ('symptoms_text', 'age', 'fever_temp_c', 'duration_days', 'risk_factors')
+
+def _split_list(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return []
+    if isinstance(value, str):
+        return [x.strip() for x in value.split(',') if x.strip()]
+    return [str(x) for x in value]
+
+def _opt_float(value):
+    if value is None or value == '':
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+def case_from_record(rec):
+    """Normalise one CSV row or JSONL object into the fields the model and rules use.
+
+    Accepts the dataset layout (comma-joined risk factors, empty fever) as well
+    as /triage request bodies; missing fields take the TriageRequest defaults.
+    """
+    text = rec.get('symptoms_text')
+    age = _opt_float(rec.get('age'))
+    duration = _opt_float(rec.get('duration_days'))
+    return {
+        'symptoms_text': '' if text is None or (isinstance(text, float) and math.isnan(text)) else str(text),
+        'age': 25.0 if age is None else age,
+        'fever_temp_c': _opt_float(rec.get('fever_temp_c')),
+        'duration_days': 3 if duration is None else int(duration),
+        'risk_factors': _split_list(rec.get('risk_factors')),
+    }
+
+def iter_records(path, fmt=None):
+    """Yield raw records (dicts) one at a time from a .csv or .jsonl file."""
+    fmt = fmt or ('csv' if str(path).lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='' if fmt == 'csv' else None, encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError as e:
+                rec = {'_error': f'invalid JSON: {e}'}
+            yield rec if isinstance(rec, dict) else {'_error': 'expected a JSON object'}
+
+def iter_chunks(records, size):
+    it = iter(records)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
@@ -1,29 +1,235 @@
 # rules.py: safety guardrails and triage logic
+import re
+
 RED_FLAGS = [
     "severe difficulty breathing", "struggling to breathe", "cannot breathe", "blue lips",
     "chest pain", "severe chest pain", "confusion", "unresponsive", "seizure", "seizures",
     "stiff neck with fever", "neck stiffness and fever", "severe dehydration", "no urine for 12 hours",
     "sunken eyes", "vomiting blood", "black stools", "severe abdominal pain", "fainting", "weak pulse", "severe bleeding"
 ]
+URGENT_PHRASES = ['shortness of breath', 'breathless', 'wheezing', 'fast breathing']
+URINARY_PHRASES = ['urinary']
+URINARY_PAIN_PHRASES = ['flank pain', 'back pain']
+GP_PHRASES = ['high fever', 'productive cough', 'persistent', 'purulent', 'severe']
+HIGH_RISK_FACTORS = ['immunocompromised', 'pregnancy', 'infant<1y', 'elder>65', 'heart_disease', 'lung_disease', 'kidney_disease']
+
+def _trie_pattern(phrases) -> str:
+    # Alternation nested by shared prefix: siblings always start with different
+    # characters, so at most one branch can continue at any point and greedy
+    # optional groups make the match the longest phrase starting there.
+    trie: dict = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+    def build(node) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ''
+        body = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+    return build(trie)
+
+class PhraseMatcher:
+    """Finds every phrase occurring in a text with one scan of a combined regex.
+
+    `phrases` maps a category name to its phrase list; a phrase may appear in
+    several categories. Matching is plain substring matching, the same as
+    `phrase in text`, so callers lowercase the text first.
+    """
+
+    def __init__(self, phrases: dict[str, list[str]]):
+        by_phrase: dict[str, list[tuple[str, str]]] = {}
+        for category, plist in phrases.items():
+            for phrase in plist:
+                phrase = phrase.lower()
+                if not phrase:
+                    raise ValueError(f'empty phrase in category {category!r}')
+                if (phrase, category) not in by_phrase.setdefault(phrase, []):
+                    by_phrase[phrase].append((phrase, category))
+        self.n_phrases = sum(len(v) for v in by_phrase.values())
+        # A zero-width lookahead tries the pattern at every position, yielding the
+        # longest phrase starting there; the shorter phrases starting at the same
+        # position are exactly its prefixes, which are expanded from a table.
+        self._pattern = re.compile('(?=(' + _trie_pattern(by_phrase) + '))') if by_phrase else None
+        self._hits = {p: tuple(m for i in range(1, len(p) + 1) for m in by_phrase.get(p[:i], ())) for p in by_phrase}
+        self._hit_cats = {p: frozenset(c for _, c in hits) for p, hits in self._hits.items()}
+
+    def matches(self, text: str) -> list[tuple[str, str]]:
+        """Every distinct (phrase, category) found in `text`, in order of first match start."""
+        if self._pattern is None:
+            return []
+        found: dict[tuple[str, str], None] = {}
+        for p in self._pattern.findall(text):
+            found.update(dict.fromkeys(self._hits[p]))
+        return list(found)
+
+    def categories(self, text: str) -> set[str]:
+        if self._pattern is None:
+            return set()
+        return set().union(*[self._hit_cats[p] for p in set(self._pattern.findall(text))])
+
+def compile_rules() -> PhraseMatcher:
+    """(Re)build the serving rules from the phrase lists above, e.g. after editing RED_FLAGS."""
+    global _CURRENT, _MATCHER
+    _CURRENT = RuleSet.current()
+    _MATCHER = _CURRENT.matcher
+    return _MATCHER
+
+def match_phrases(text: str) -> list[tuple[str, str]]:
+    return _MATCHER.matches((text or '').lower())
 
 def triage_from_rules(text: str, age: float | None, fever_temp: float | None, duration_days: int | None, risk_list: list[str] | None):
-    txt = (text or '').lower()
-    if any(flag in txt for flag in RED_FLAGS):
-        return 'Emergency', True
-    high_risk = any(r in (risk_list or []) for r in ['immunocompromised','pregnancy','infant<1y','elder>65','heart_disease','lung_disease','kidney_disease'])
-    urgent_score = 0
-    if fever_temp is not None and duration_days is not None and fever_temp >= 39.0 and duration_days >= 3:
-        urgent_score += 1
-    if any(p in txt for p in ['shortness of breath','breathless','wheezing','fast breathing']):
-        urgent_score += 1
-    if 'urinary' in txt and ('flank pain' in txt or 'back pain' in txt):
-        urgent_score += 1
-    if age is not None and age < 1.0 and fever_temp is not None and fever_temp >= 38.0:
-        return 'Urgent', False
-    if urgent_score >= 1 and high_risk:
-        return 'Urgent', False
-    if any(p in txt for p in ['high fever','productive cough','persistent','purulent','severe']):
-        return 'GP within 48h', False
-    return 'Home care', False
+    return _CURRENT.triage(text, age, fever_temp, duration_days, risk_list)
+
+# --- Decision list ----------------------------------------------------------
+# The first condition that holds gives the label, 'Home care' when none does.
+# RuleSet.conditions computes the conditions for one case (triage) and for
+# whole columns (evaluate) with the same expressions, so the two cannot drift.
+
+DECISIONS = [('red_flag', 'Emergency'), ('infant_fever', 'Urgent'), ('urgent_high_risk', 'Urgent'), ('gp', 'GP within 48h')]
+DEFAULT_LABEL = 'Home care'
+TRIAGE_LABELS = ['Emergency', 'Urgent', 'GP within 48h', 'Home care']
+
+# RuleSet phrase-list fields and the matcher category each is found as
+PHRASE_FIELDS = {'red_flags': 'red_flag', 'urgent_phrases': 'urgent', 'urinary_phrases': 'urinary',
+                 'urinary_pain_phrases': 'urinary_pain', 'gp_phrases': 'gp'}
+
+def _num(x):
+    return float('nan') if x is None else float(x)
+
+# --- Batch evaluation -------------------------------------------------------
+# Distinct texts are joined with '\n' (no phrase contains one) and each phrase
+# list is scanned over the joined string once; match offsets map back to rows
+# with a binary search, so the per-row Python work disappears.
+
+class TextColumn:
+    """A column of texts prepared for phrase lookups; results are cached per phrase list.
+
+    Pass the same TextColumn to several RuleSet.evaluate calls to scan only the
+    phrase lists that differ between rule sets.
+    """
+
+    def __init__(self, values, transform=str, wrap=''):
+        import numpy as np
+        import pandas as pd
+        # repeated texts (request logs, templated notes) are scanned once
+        self.codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna(''), sort=False)
+        parts = [f'{wrap}{transform(u)}{wrap}' for u in uniques]
+        lengths = np.fromiter((len(p) + 1 for p in parts), dtype=np.int64, count=len(parts))
+        self.starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        self.joined = '\n'.join(parts)
+        self.n_unique = len(parts)
+        self._hits = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def has(self, phrases):
+        """Bool mask of rows containing any of `phrases` (plain substring match)."""
+        import numpy as np
+        key = frozenset(p for p in phrases if p)
+        if key not in self._hits:
+            hit = np.zeros(self.n_unique, dtype=bool)
+            if key and self.n_unique:
+                # Non-overlapping matches suffice: a match that swallows another
+                # occurrence lies in the same row, as no phrase spans a newline.
+                pattern = re.compile(_trie_pattern(sorted(key)))
+                offsets = np.fromiter((m.start() for m in pattern.finditer(self.joined)), dtype=np.int64)
+                hit[np.searchsorted(self.starts, offsets, side='right') - 1] = True
+            self._hits[key] = hit
+        return self._hits[key][self.codes]
+
+def symptom_column(texts):
+    return texts if isinstance(texts, TextColumn) else TextColumn(texts, str.lower)
+
+def risk_column(risk_lists):
+    """Risk factors as ',a,b,' strings so `,factor,` matches exactly one list item."""
+    if isinstance(risk_lists, TextColumn):
+        return risk_lists
+    return TextColumn([r if isinstance(r, str) else ','.join(r or ()) for r in risk_lists], lambda r: r.replace(' ', ''), wrap=',')
+
+class RuleSet:
+    """Phrase lists and thresholds of the triage rules; `current()` is what serves today."""
+
+    FIELDS = ('red_flags', 'urgent_phrases', 'urinary_phrases', 'urinary_pain_phrases', 'gp_phrases', 'high_risk_factors',
+              'urgent_fever_c', 'urgent_min_days', 'infant_max_age', 'infant_fever_c')
+
+    def __init__(self, red_flags, urgent_phrases, urinary_phrases, urinary_pain_phrases, gp_phrases, high_risk_factors,
+                 urgent_fever_c=39.0, urgent_min_days=3, infant_max_age=1.0, infant_fever_c=38.0):
+        # phrases are matched against lowercased text, by the PhraseMatcher and the column scans alike
+        low = lambda phrases: [p.lower() for p in phrases]
+        self.red_flags, self.urgent_phrases, self.gp_phrases = low(red_flags), low(urgent_phrases), low(gp_phrases)
+        self.urinary_phrases, self.urinary_pain_phrases = low(urinary_phrases), low(urinary_pain_phrases)
+        self.high_risk_factors = list(high_risk_factors)
+        self.urgent_fever_c, self.urgent_min_days = float(urgent_fever_c), int(urgent_min_days)
+        self.infant_max_age, self.infant_fever_c = float(infant_max_age), float(infant_fever_c)
+        self._matcher = None
+
+    @classmethod
+    def current(cls):
+        return cls(RED_FLAGS, URGENT_PHRASES, URINARY_PHRASES, URINARY_PAIN_PHRASES, GP_PHRASES, HIGH_RISK_FACTORS)
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+    def updated(self, changes: dict):
+        """A copy with fields replaced, or list fields edited via {"add": {...}, "remove": {...}}."""
+        d = self.to_dict()
+        for key, value in changes.items():
+            if key in ('add', 'remove'):
+                for field, phrases in value.items():
+                    if not isinstance(d.get(field), list):
+                        raise ValueError(f'cannot {key} items of {field!r}')
+                    d[field] = d[field] + [p for p in phrases if p not in d[field]] if key == 'add' else [p for p in d[field] if p not in phrases]
+            elif key in d:
+                d[key] = value
+            else:
+                raise ValueError(f'unknown rule field {key!r}')
+        return RuleSet(**d)
+
+    @property
+    def matcher(self) -> PhraseMatcher:
+        """All phrase lists in one PhraseMatcher, categories named as in PHRASE_FIELDS."""
+        if self._matcher is None:
+            self._matcher = PhraseMatcher({cat: getattr(self, field) for field, cat in PHRASE_FIELDS.items()})
+        return self._matcher
+
+    def conditions(self, has, ages, fevers, durations, high_risk):
+        """Each DECISIONS condition, given `has(category)` phrase lookups and the numeric fields.
+
+        Only & and | combine the terms, so the same expressions work on one
+        case (bools, floats with NaN for missing) and on columns (numpy arrays).
+        """
+        urgent = (((fevers >= self.urgent_fever_c) & (durations >= self.urgent_min_days))
+                  | has('urgent') | (has('urinary') & has('urinary_pain')))
+        return {'red_flag': has('red_flag'), 'infant_fever': (ages < self.infant_max_age) & (fevers >= self.infant_fever_c),
+                'urgent_high_risk': urgent & high_risk, 'gp': has('gp')}
+
+    def triage(self, text, age, fever_temp, duration_days, risk_list):
+        """(label, red flag) for one case; None means missing."""
+        cats = self.matcher.categories((text or '').lower())
+        risks = risk_list or []
+        c = self.conditions(cats.__contains__, _num(age), _num(fever_temp), _num(duration_days),
+                            any(r in risks for r in self.high_risk_factors))
+        return next((label for name, label in DECISIONS if c[name]), DEFAULT_LABEL), bool(c['red_flag'])
+
+    def evaluate(self, texts, ages, fevers, durations, risk_lists):
+        """Labels (object array) and red-flag flags (bool array) for whole columns.
 
+        ages/fevers/durations may hold NaN for missing values; risk_lists holds
+        lists of risk factors or comma-joined strings as in the dataset CSV.
+        texts and risk_lists may also be TextColumns shared between calls.
+        """
+        import numpy as np
+        texts, risks = symptom_column(texts), risk_column(risk_lists)
+        fields = {cat: field for field, cat in PHRASE_FIELDS.items()}
+        with np.errstate(invalid='ignore'):
+            c = self.conditions(lambda cat: texts.has(getattr(self, fields[cat])),
+                                *(np.asarray(a, dtype=float) for a in (ages, fevers, durations)),
+                                risks.has([f',{r},' for r in self.high_risk_factors]))
+        labels = np.select([c[name] for name, _ in DECISIONS], [label for _, label in DECISIONS], DEFAULT_LABEL)
+        return labels.astype(object), c['red_flag']
 
+_MATCHER = compile_rules()
@@ -0,0 +1,112 @@
+# score_bulk.py: re-score intake logs (JSONL requests or dataset CSVs) with a process pool
+import argparse, csv, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from records import case_from_record, iter_records, iter_chunks
+from inference import TriageModel, triage_cases
+
+ID_FIELDS = ('case_id', 'request_id', 'id')
+CSV_COLUMNS = ['row', 'id', 'triage', 'emergency', 'top_conditions', 'top_probabilities', 'error']
+
+_model = None
+
+def _init_worker(model_dir):
+    # each worker loads the artifacts once and keeps them for every chunk it scores
+    global _model
+    _model = TriageModel.load(model_dir)
+
+def score_chunk(start, records, top_k):
+    out, cases, positions = [], [], []
+    for offset, rec in enumerate(records):
+        row = {'row': start + offset, 'id': next((rec[f] for f in ID_FIELDS if rec.get(f) not in (None, '')), None)}
+        try:
+            if '_error' in rec:
+                raise ValueError(rec['_error'])
+            cases.append(case_from_record(rec))
+            positions.append(len(out))
+        except (TypeError, ValueError) as e:
+            row['error'] = str(e)
+        out.append(row)
+    if cases:
+        for pos, res in zip(positions, triage_cases(_model, cases, top_k)):
+            out[pos].update(res)
+    return out
+
+class ResultWriter:
+    def __init__(self, path, fmt):
+        self.fmt = fmt
+        self.f = sys.stdout if path == '-' else open(path, 'w', newline='' if fmt == 'csv' else None, encoding='utf-8')
+        self.csv = csv.DictWriter(self.f, fieldnames=CSV_COLUMNS) if fmt == 'csv' else None
+        if self.csv:
+            self.csv.writeheader()
+
+    def write(self, rows):
+        if self.csv:
+            for r in rows:
+                self.csv.writerow({**r, 'top_conditions': ','.join(r.get('top_conditions', [])),
+                                   'top_probabilities': ','.join(f'{p:.6f}' for p in r.get('top_probabilities', []))})
+        else:
+            self.f.write(''.join(json.dumps(r) + '\n' for r in rows))
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+def _report(done, errors, t0, final=False):
+    elapsed = time.perf_counter() - t0
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f'\r[score_bulk] {done} rows  {errors} errors  {rate:,.0f} rows/s  {elapsed:.1f}s', end='\n' if final else '', file=sys.stderr, flush=True)
+
+def main(args):
+    out_fmt = args.format or ('csv' if args.out.lower().endswith('.csv') else 'jsonl')
+    writer = ResultWriter(args.out, out_fmt)
+    chunks = iter_chunks(iter_records(args.input, args.input_format), args.chunk_size)
+    done = errors = 0
+    t0 = time.perf_counter()
+
+    def emit(rows):
+        nonlocal done, errors
+        writer.write(rows)
+        done += len(rows)
+        errors += sum('error' in r for r in rows)
+        _report(done, errors, t0)
+
+    try:
+        if args.workers <= 0:
+            _init_worker(args.model_dir)
+            start = 0
+            for chunk in chunks:
+                emit(score_chunk(start, chunk, args.top_k))
+                start += len(chunk)
+        else:
+            # Keep at most `max_pending` chunks in flight and write results in input
+            # order, so memory is bounded by chunk size x pending, not input size.
+            max_pending = args.workers * 2
+            with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(args.model_dir,)) as pool:
+                pending, start = [], 0
+                for chunk in chunks:
+                    pending.append(pool.submit(score_chunk, start, chunk, args.top_k))
+                    start += len(chunk)
+                    if len(pending) >= max_pending:
+                        emit(pending.pop(0).result())
+                for fut in pending:
+                    emit(fut.result())
+    finally:
+        writer.close()
+    _report(done, errors, t0, final=True)
+    elapsed = time.perf_counter() - t0
+    print({'input': args.input, 'out': args.out, 'rows': done, 'errors': errors,
+           'seconds': round(elapsed, 2), 'rows_per_s': round(done / elapsed, 1) if elapsed else None}, file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-score intake records with the current model')
+    parser.add_argument('input', type=str, help='.csv (dataset layout) or .jsonl (one /triage request per line)')
+    parser.add_argument('--out', type=str, default='-', help="output path, '-' for stdout")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None, help='output format (default: from --out extension)')
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'], default=None)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='scoring processes; 0 scores in-process')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--model-dir', type=str, default='.')
+    args = parser.parse_args()
+    main(args)
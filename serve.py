@@ -1,15 +1,47 @@
 # serve.py: FastAPI microservice
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from joblib import load
-import numpy as np
-from rules import triage_from_rules
-
-app = FastAPI(title='AI Symptom Triage (Demo)', version='0.1.0')
-vectorizer = load('vectorizer.joblib')
-clf = load('classifier.joblib')
-mlb = load('mlb.joblib')
+from fastapi import FastAPI, Body, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, List, Optional
+import hmac, os, time, contextlib, contextvars
+import audit, profiling
+from microbatch import MicroBatcher
+from cache import ResponseCache, request_key
+from inference import STAGES, triage_rows
+from inference_pool import InferencePool
+from model_registry import ModelManager
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global inference_pool, mailbox, mailbox_error
+    if ADMIN_TOKEN:
+        try:
+            mailbox = profiling.WorkerMailbox(os.environ.get('MEDTRIAGE_ADMIN_DIR') or profiling.default_mailbox_dir(), run_admin_job)
+        except OSError as e:  # e.g. the directory belongs to another user
+            mailbox_error = f'{type(e).__name__}: {e}'
+    if BACKEND == 'process':
+        # started with the server, not on import: spawned workers re-import the
+        # parent's __main__, which must not build pools of its own
+        inference_pool = InferencePool(int(os.environ.get('MEDTRIAGE_PROCESS_WORKERS', '0')) or os.cpu_count() or 1,
+                                       models.current_dir, models.current.version, TOP_K)
+    yield
+    if mailbox is not None:
+        mailbox.close()
+    if inference_pool is not None:
+        inference_pool.close()
+    if audit_log is not None:
+        audit_log.close()  # write out queued audit records before the process exits
+
+app = FastAPI(title='AI Symptom Triage (Demo)', version='0.1.0', lifespan=lifespan)
+# Serves <MEDTRIAGE_MODEL_ROOT>/<CURRENT> when that pointer exists, else the
+# artifacts in the working directory. New versions are swapped in by
+# POST /admin/reload or, with MEDTRIAGE_MODEL_WATCH_S > 0, by polling CURRENT.
+models = ModelManager(os.environ.get('MEDTRIAGE_MODEL_ROOT', 'models'))
+
+TOP_K = 3
 
 class TriageRequest(BaseModel):
     symptoms_text: str = Field('', description='Free-text symptom description')
@@ -25,24 +57,484 @@ class TriageResponse(BaseModel):
     emergency: bool
     top_conditions: List[str]
     top_probabilities: List[float]
+    model_version: Optional[str] = None
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    result: Optional[TriageResponse] = None
+    error: Optional[str] = None
+
+# Per-stage latency, outcome counts and in-flight gauges, scraped from /metrics.
+# MEDTRIAGE_METRICS=0 turns every observation into a no-op.
+REGISTRY.enabled = os.environ.get('MEDTRIAGE_METRICS', '1').lower() not in ('0', 'false', 'no')
+STAGE_SECONDS = Histogram('medtriage_stage_seconds', 'Time spent per triage stage (one observation per scoring call)', ['stage'])
+HTTP_SECONDS = Histogram('medtriage_http_request_seconds', 'End-to-end HTTP request latency', ['path'])
+HTTP_REQUESTS = Counter('medtriage_http_requests_total', 'HTTP requests by path and status code', ['path', 'status'])
+IN_FLIGHT = Gauge('medtriage_requests_in_flight', 'Requests currently being handled', ['path'])
+TRIAGE_OUTCOMES = Counter('medtriage_triage_outcomes_total', 'Triage decisions returned, by label', ['triage'])
+_request_timing = contextvars.ContextVar('request_timing', default=None)
+
+def case_tuple(r: TriageRequest):
+    return (r.symptoms_text or '', r.age, r.fever_temp_c, r.duration_days, r.risk_factors)
+
+def responses(version, rows, stages, dispatch=None) -> List[TriageResponse]:
+    t0 = time.perf_counter()
+    out = [TriageResponse(triage=triage_label, emergency=redflag, top_conditions=conditions, top_probabilities=probs, model_version=version)
+           for triage_label, redflag, conditions, probs in rows]
+    if stages is not None:  # None: a coalesced call whose stages another request reported
+        observations = list(zip(stages, ((s,) for s in STAGES))) + [(time.perf_counter() - t0, ('respond',))]
+        if dispatch is not None:
+            observations.append((dispatch, ('dispatch',)))
+        STAGE_SECONDS.observe_many(observations)
+    return out
+
+def score_requests(reqs: List[TriageRequest]) -> List[TriageResponse]:
+    cases = [case_tuple(r) for r in reqs]
+    if inference_pool is not None:
+        return responses(*inference_pool.score(cases))
+    model = models.current  # one model for the whole call, even if a swap lands meanwhile
+    return responses(model.version, *triage_rows(model, cases, TOP_K))
+
+# MEDTRIAGE_BACKEND=process moves featurizing, scoring and the rules out of the
+# server process into MEDTRIAGE_PROCESS_WORKERS worker processes (default: one
+# per core), each with the model loaded, so inference is not serialized by this
+# process's GIL. Requests cross as tuples of plain values; /triage awaits the
+# worker without holding a thread, and /triage calls that arrive together share
+# a round trip. The default, thread, scores in the threadpool.
+# The pool starts with the app (lifespan); until then scoring stays in-process.
+BACKEND = os.environ.get('MEDTRIAGE_BACKEND', 'thread')
+if BACKEND not in ('thread', 'process'):
+    raise ValueError('MEDTRIAGE_BACKEND must be thread or process')
+inference_pool = None
+
+def bind_pool(new_model):
+    if inference_pool is not None:
+        inference_pool.bind(models.current_dir, new_model.version)
+
+models.on_swap(bind_pool)
+
+# Opt-in micro-batching: concurrent /triage calls are held for up to
+# MEDTRIAGE_MICROBATCH_WINDOW_MS (or until MEDTRIAGE_MICROBATCH_MAX are queued)
+# and scored as one matrix.
+batcher = None
+if os.environ.get('MEDTRIAGE_MICROBATCH', '0').lower() in ('1', 'true', 'yes'):
+    batcher = MicroBatcher(score_requests,
+                           max_batch=int(os.environ.get('MEDTRIAGE_MICROBATCH_MAX', '32')),
+                           window_ms=float(os.environ.get('MEDTRIAGE_MICROBATCH_WINDOW_MS', '2')))
+
+# Repeated cases are answered from an LRU cache keyed on the normalised request
+# (MEDTRIAGE_CACHE_SIZE entries, 0 disables; optional MEDTRIAGE_CACHE_TTL seconds).
+# The cache is bound to the loaded model version and empties when it changes.
+response_cache = ResponseCache(maxsize=int(os.environ.get('MEDTRIAGE_CACHE_SIZE', '4096')),
+                               ttl=float(os.environ.get('MEDTRIAGE_CACHE_TTL', '0')))
+response_cache.bind(models.current.version)
+models.on_swap(lambda new_model: response_cache.bind(new_model.version))
+if float(os.environ.get('MEDTRIAGE_MODEL_WATCH_S', '0')) > 0:
+    models.watch(float(os.environ['MEDTRIAGE_MODEL_WATCH_S']))
+
+# Every decision is queued for the audit log when MEDTRIAGE_AUDIT_DIR is set; a
+# background thread writes rotating JSONL files (see audit.py for the knobs).
+audit_log = audit.from_env()
+
+def record_outcome(req: TriageRequest, res: TriageResponse):
+    TRIAGE_OUTCOMES.inc(res.triage)
+    if audit_log is not None:
+        audit_log.record(req, res)
+
+async def record_outcome_async(req: TriageRequest, res: TriageResponse):
+    # on the event loop: a full queue under the 'block' policy waits in the threadpool instead
+    TRIAGE_OUTCOMES.inc(res.triage)
+    if audit_log is not None and audit_log.record(req, res, wait=False) is None:
+        await run_in_threadpool(audit_log.record, req, res)
+
+def cache_key(req: TriageRequest):
+    return request_key(req.symptoms_text, req.age, req.fever_temp_c, req.duration_days, req.risk_factors)
+
+def score_cached(reqs: List[TriageRequest]) -> List[TriageResponse]:
+    if response_cache.maxsize == 0:
+        return score_requests(reqs)
+    keys = [cache_key(r) for r in reqs]
+    out = [response_cache.get(k) for k in keys]
+    misses = [i for i, res in enumerate(out) if res is None]
+    if misses:
+        for i, res in zip(misses, score_requests([reqs[i] for i in misses])):
+            response_cache.put(keys[i], res, version=res.model_version)
+            out[i] = res
+    return out
+
+def lookup_or_score(req: TriageRequest) -> TriageResponse:
+    key = cache_key(req) if response_cache.maxsize else None
+    res = response_cache.get(key) if key is not None else None
+    if res is None:
+        res = batcher.submit(req) if batcher is not None else score_requests([req])[0]
+        if key is not None:
+            response_cache.put(key, res, version=res.model_version)
+    record_outcome(req, res)
+    return res
 
 @app.post('/triage', response_model=TriageResponse)
-def triage(req: TriageRequest):
-    txt = req.symptoms_text or ''
-    X = vectorizer.transform([txt])
+async def triage(req: TriageRequest):
+    t0 = time.perf_counter()
+    if inference_pool is not None and batcher is None:
+        # on the event loop, so nothing here may block: cache calls skip a
+        # contended lock and the audit record does not wait for queue space
+        key = cache_key(req) if response_cache.maxsize else None
+        res = response_cache.get(key, wait=False) if key is not None else None
+        if res is None:
+            res = responses(*await inference_pool.score_one(case_tuple(req)))[0]
+            if key is not None:
+                response_cache.put(key, res, version=res.model_version, wait=False)
+        await record_outcome_async(req, res)
+    else:
+        res = await run_in_threadpool(lookup_or_score, req)
+    elapsed = time.perf_counter() - t0
+    STAGE_SECONDS.observe(elapsed, 'handler')
+    timing = _request_timing.get()
+    if timing is not None:
+        timing['handler'] = elapsed
+    return res
+
+def score_items(results: List[Optional[BatchItemResult]], valid: List[TriageRequest], positions: List[int]):
+    """Replace the placeholder at results[positions[j]] with the outcome for valid[j]."""
+    if not valid:
+        return
     try:
-        probs = clf.predict_proba(X)[0]
+        for i, req, res in zip(positions, valid, score_cached(valid)):
+            results[i] = BatchItemResult(index=results[i].index, ok=True, result=res)
+            record_outcome(req, res)
     except Exception:
-        decision = clf.decision_function(X)[0]
-        probs = 1 / (1 + np.exp(-decision))
-    labels = mlb.classes_
-    idx = np.argsort(-probs)[:3]
-    top_conditions = [labels[i] for i in idx]
-    top_probs = [float(probs[i]) for i in idx]
+        # fall back to per-item scoring to isolate the case that broke the batch
+        for i, req in zip(positions, valid):
+            index = results[i].index
+            try:
+                results[i] = BatchItemResult(index=index, ok=True, result=score_requests([req])[0])
+                record_outcome(req, results[i].result)
+            except Exception as e:
+                results[i] = BatchItemResult(index=index, ok=False, error=f'scoring failed: {e}')
+
+@app.post('/triage/batch', response_model=List[BatchItemResult])
+def triage_batch(items: List[Any] = Body(...)):
+    # Items are validated one by one so a single bad case is reported in place
+    # instead of failing the whole batch with a 422.
+    results: List[Optional[BatchItemResult]] = [None] * len(items)
+    valid, positions = [], []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = BatchItemResult(index=i, ok=False, error='expected a JSON object')
+            continue
+        try:
+            valid.append(TriageRequest(**item))
+            positions.append(i)
+            results[i] = BatchItemResult(index=i, ok=False)
+        except ValidationError as e:
+            results[i] = BatchItemResult(index=i, ok=False, error=str(e))
+    score_items(results, valid, positions)
+    return results
 
-    triage_label, redflag = triage_from_rules(txt, req.age, req.fever_temp_c, req.duration_days, req.risk_factors)
-    return TriageResponse(triage=triage_label, emergency=bool(redflag), top_conditions=top_conditions, top_probabilities=top_probs)
+# NDJSON streaming: one TriageRequest per line in, one BatchItemResult per line
+# out (index = 0-based line number, blank lines skipped). Lines are scored in
+# batches of MEDTRIAGE_STREAM_BATCH and each batch is written before more of the
+# body is read, so a slow reader or writer stalls the other end instead of
+# buffering: memory is bounded by one batch plus one line
+# (MEDTRIAGE_STREAM_MAX_LINE bytes), whatever the upload size.
+STREAM_BATCH = int(os.environ.get('MEDTRIAGE_STREAM_BATCH', '64'))
+STREAM_MAX_LINE = int(os.environ.get('MEDTRIAGE_STREAM_MAX_LINE', str(64 * 1024)))
+
+class BodyStreamingResponse(StreamingResponse):
+    # Under ASGI < 2.4 Starlette also runs a disconnect listener that calls
+    # receive() and would swallow request body chunks; here the body iterator
+    # is the only reader and sees a disconnect as ClientDisconnect instead.
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+async def iter_body_lines(request: Request, max_line: int):
+    """Yield (line_number, line_bytes, error) for each non-blank line of the body."""
+    buf, lineno, overlong = bytearray(), 0, False
+    async for chunk in request.stream():
+        buf += chunk
+        start = 0
+        while True:
+            end = buf.find(b'\n', start)
+            if end < 0:
+                break
+            if overlong:
+                overlong = False
+            elif end - start > max_line:
+                yield lineno, None, f'line longer than {max_line} bytes'
+            elif buf[start:end].strip():
+                yield lineno, bytes(buf[start:end]), None
+            lineno += 1
+            start = end + 1
+        del buf[:start]
+        if len(buf) > max_line:
+            if not overlong:
+                yield lineno, None, f'line longer than {max_line} bytes'
+            overlong = True
+            buf.clear()
+    if buf.strip() and not overlong:
+        yield lineno, bytes(buf), None
+
+@app.post('/triage/stream')
+async def triage_stream(request: Request):
+    async def flush(batch, valid, positions):
+        await run_in_threadpool(score_items, batch, valid, positions)
+        return ''.join(r.model_dump_json() + '\n' for r in batch)
+
+    async def results():
+        batch: List[BatchItemResult] = []
+        valid, positions = [], []
+        try:
+            async for lineno, line, error in iter_body_lines(request, STREAM_MAX_LINE):
+                if error is None:
+                    try:
+                        valid.append(TriageRequest.model_validate_json(line))
+                        positions.append(len(batch))
+                        batch.append(BatchItemResult(index=lineno, ok=False))
+                    except ValidationError as e:
+                        error = str(e)
+                if error is not None:
+                    batch.append(BatchItemResult(index=lineno, ok=False, error=error))
+                # error lines count towards the batch too, so a run of bad lines is still flushed
+                if len(batch) >= STREAM_BATCH:
+                    yield await flush(batch, valid, positions)
+                    batch, valid, positions = [], [], []
+        except ClientDisconnect:
+            return  # nobody is left to read the rest
+        if batch:
+            yield await flush(batch, valid, positions)
+    return BodyStreamingResponse(results(), media_type='application/x-ndjson')
 
 @app.get('/health')
 def health():
-    return {'status': 'ok'}
+    return {'status': 'ok', 'model_version': models.current.version}
+
+ADMIN_TOKEN = os.environ.get('MEDTRIAGE_ADMIN_TOKEN')
+
+def require_admin(token):
+    # admin endpoints are off unless MEDTRIAGE_ADMIN_TOKEN is set
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail='admin endpoints are disabled')
+    if not hmac.compare_digest((token or '').encode(), ADMIN_TOKEN.encode()):  # constant time
+        raise HTTPException(status_code=403, detail='invalid admin token')
+
+@app.get('/admin/model')
+def admin_model(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return {'version': models.current.version, 'root': models.root, 'dir_version': models.dir_version, 'last_reload': models.last_reload}
+
+@app.post('/admin/reload')
+def admin_reload(version: Optional[str] = None, wait: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """Load `version` (default: the CURRENT pointer), validate it on the smoke set and swap it in."""
+    require_admin(x_admin_token)
+    if version is not None and (os.sep in version or version.startswith('.')):
+        raise HTTPException(status_code=400, detail='invalid version name')
+    if wait:
+        return models.reload(version)
+    models.reload_async(version)
+    return {'status': 'loading', 'requested': version, 'current': models.current.version}
+
+# Profiling and memory introspection. Nothing runs until one of these is
+# called: the sampler thread lives for one profile and tracemalloc only traces
+# between /admin/memory/start and /stop. Under `uvicorn --workers N`, pass
+# ?pid= (see GET /admin/workers) to run the job on that worker, whichever worker
+# receives the request; the mailbox lives in MEDTRIAGE_ADMIN_DIR and is set up
+# with the app (lifespan) when admin endpoints are enabled.
+memory_tracker = profiling.MemoryTracker()
+
+def memory_sizes():
+    model = models.current
+    feat, scorer = model.featurizer, model.scorer
+    directory = models.last_reload.get('dir', '.')
+    files = {name: os.path.getsize(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+             if name.endswith(('.joblib', '.bin'))} if os.path.isdir(directory) else {}
+    entries = response_cache.entries()
+    return {
+        **profiling.process_memory(),
+        'model': {'version': model.version, 'dir': directory, 'artifact_files': files,
+                  'featurizer_bytes': profiling.deep_sizeof(feat), 'vocabulary_bytes': profiling.deep_sizeof(getattr(feat, 'vocabulary', None)),
+                  'scorer_bytes': profiling.deep_sizeof(scorer), 'labels_bytes': profiling.deep_sizeof(model.labels),
+                  'memory_mapped': getattr(getattr(scorer, 'weights', None), 'base', None) is not None},
+        'response_cache': {'entries': len(entries), 'bytes': profiling.deep_sizeof(entries)},
+        'microbatch_pending': batcher.stats()['pending'] if batcher is not None else None,
+        'audit_pending': audit_log.stats()['pending'] if audit_log is not None else None,
+        'tracemalloc': memory_tracker.status(),
+    }
+
+def run_admin_job(job):
+    op, p = job['op'], job.get('params', {})
+    if op == 'cpu':
+        prof = profiling.cpu_profile(p['seconds'], p['interval_ms'] / 1e3, p['include_idle'])
+        return {'seconds': p['seconds'], 'samples': prof.samples, 'top': prof.top(), 'collapsed': prof.collapsed()}
+    if op == 'memory_start':
+        return memory_tracker.start(p['frames'])
+    if op == 'memory_snapshot':
+        return memory_tracker.snapshot(p['compare_to'], p['limit'], p['group_by'])
+    if op == 'memory_stop':
+        return memory_tracker.stop()
+    if op == 'memory_status':
+        return memory_tracker.status()
+    if op == 'sizes':
+        return memory_sizes()
+    raise ValueError(f'unknown admin job {op!r}')
+
+mailbox, mailbox_error = None, None
+# job errors by exception type, the same whether the job ran here or on another worker; others are 500
+ADMIN_ERROR_STATUS = {'RuntimeError': 409, 'KeyError': 404}
+
+def admin_job(op, pid=None, timeout=30.0, **params):
+    """Run a job here, or on worker `pid` through the mailbox; errors map to HTTP statuses."""
+    job = {'op': op, 'params': params}
+    if pid is None or pid == os.getpid():
+        try:
+            return {'pid': os.getpid(), **run_admin_job(job)}
+        except Exception as e:
+            if type(e).__name__ not in ADMIN_ERROR_STATUS:
+                raise
+            raise HTTPException(status_code=ADMIN_ERROR_STATUS[type(e).__name__], detail=str(e))
+    if mailbox is None or not mailbox.enabled:
+        raise HTTPException(status_code=501, detail=mailbox_error or 'worker targeting is unavailable in this process')
+    try:
+        out = mailbox.forward(pid, job, timeout)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    if not out['ok']:
+        raise HTTPException(status_code=ADMIN_ERROR_STATUS.get(out.get('type'), 500), detail=out['error'])
+    return {'pid': pid, **out['result']}
+
+@app.get('/admin/workers')
+def admin_workers(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return {'pid': os.getpid(), 'workers': mailbox.workers() if mailbox is not None and mailbox.enabled else [os.getpid()]}
+
+@app.post('/admin/profile/cpu')
+def admin_profile_cpu(seconds: float = 10.0, interval_ms: float = 5.0, format: str = 'collapsed', include_idle: bool = False,
+                      pid: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    """Sample every thread's stack for `seconds`; collapsed stacks (text) or a JSON summary."""
+    require_admin(x_admin_token)
+    if not 0 < seconds <= 120 or not 0.5 <= interval_ms <= 1000 or format not in ('collapsed', 'json'):
+        raise HTTPException(status_code=400, detail='need 0 < seconds <= 120, 0.5 <= interval_ms <= 1000, format collapsed|json')
+    out = admin_job('cpu', pid, timeout=seconds + 30, seconds=seconds, interval_ms=interval_ms, include_idle=include_idle)
+    if format == 'collapsed':
+        return PlainTextResponse(out['collapsed'], headers={'X-Worker-Pid': str(out['pid']), 'X-Samples': str(out['samples'])})
+    return out
+
+@app.post('/admin/memory/start')
+def admin_memory_start(frames: int = 1, pid: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return admin_job('memory_start', pid, frames=max(1, min(frames, 50)))
+
+@app.post('/admin/memory/snapshot')
+def admin_memory_snapshot(compare_to: Optional[int] = None, limit: int = 25, group_by: str = 'lineno', pid: Optional[int] = None,
+                          x_admin_token: Optional[str] = Header(None)):
+    """Snapshot traced allocations and diff against `compare_to` (default: the previous snapshot)."""
+    require_admin(x_admin_token)
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        raise HTTPException(status_code=400, detail='group_by must be lineno, filename or traceback')
+    return admin_job('memory_snapshot', pid, compare_to=compare_to, limit=limit, group_by=group_by)
+
+@app.post('/admin/memory/stop')
+def admin_memory_stop(pid: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return admin_job('memory_stop', pid)
+
+@app.get('/admin/memory/status')
+def admin_memory_status(pid: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return admin_job('memory_status', pid)
+
+@app.get('/admin/memory/sizes')
+def admin_memory_sizes(pid: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    """Bytes held by the loaded model, the response cache and the queues, plus process RSS."""
+    require_admin(x_admin_token)
+    return admin_job('sizes', pid)
+
+@app.get('/stats/microbatch')
+def microbatch_stats(reset: bool = False):
+    if batcher is None:
+        return {'enabled': False}
+    return {'enabled': True, **batcher.stats(reset=reset)}
+
+@app.get('/stats/cache')
+def cache_stats():
+    return {'enabled': response_cache.maxsize > 0, **response_cache.stats()}
+
+@app.get('/stats/backend')
+def backend_stats():
+    if inference_pool is None:
+        return {'backend': BACKEND}
+    return {'backend': BACKEND, **inference_pool.stats()}
+
+@app.get('/stats/audit')
+def audit_stats():
+    if audit_log is None:
+        return {'enabled': False}
+    return {'enabled': True, **audit_log.stats()}
+
+@app.get('/metrics', response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+def _component_metrics():
+    c = response_cache.stats()
+    yield 'medtriage_cache_events_total', 'counter', 'Response cache events', [({'event': k}, c[k]) for k in ('hits', 'misses', 'evictions', 'expirations', 'invalidations')]
+    yield 'medtriage_cache_entries', 'gauge', 'Entries in the response cache', [({}, c['size'])]
+    if batcher is not None:
+        b = batcher.stats()
+        yield 'medtriage_microbatch_batches_total', 'counter', 'Micro-batches scored', [({}, b['batches'])]
+        yield 'medtriage_microbatch_items_total', 'counter', 'Requests scored through the micro-batcher', [({}, b['items'])]
+    if inference_pool is not None:
+        p = inference_pool.stats()
+        yield 'medtriage_pool_batches_total', 'counter', 'Scoring calls sent to inference worker processes', [({}, p['batches'])]
+        yield 'medtriage_pool_in_flight', 'gauge', 'Scoring calls waiting for or running in a worker process', [({}, p['in_flight'])]
+        yield 'medtriage_pool_restarts_total', 'counter', 'Inference pools replaced after a worker died', [({}, p['restarts'])]
+    if audit_log is not None:
+        a = audit_log.stats()
+        yield 'medtriage_audit_records_total', 'counter', 'Audit records by outcome', [({'event': k}, a[k]) for k in ('queued', 'written', 'dropped', 'write_errors')]
+        yield 'medtriage_audit_pending', 'gauge', 'Audit records waiting for the writer', [({}, a['pending'])]
+
+REGISTRY.add_collector(_component_metrics)
+
+class MetricsMiddleware:
+    """Times every HTTP request and derives the framework share of /triage.
+
+    The handler stores its own duration in a per-request dict; whatever is left
+    of the end-to-end time is request parsing, pydantic validation and response
+    serialization, observed as stage="framework".
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self.paths is None:
+            self.paths = {getattr(r, 'path', None) for r in app.routes}
+        path = scope['path'] if scope['path'] in self.paths else 'other'
+        status = [500]
+
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        timing = {}
+        token = _request_timing.set(timing)
+        IN_FLIGHT.inc(path)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - t0
+            IN_FLIGHT.dec(path)
+            _request_timing.reset(token)
+            HTTP_SECONDS.observe(elapsed, path)
+            HTTP_REQUESTS.inc(path, status[0])
+            if 'handler' in timing:
+                STAGE_SECONDS.observe(elapsed - timing['handler'], 'framework')
+
+app.add_middleware(MetricsMiddleware)
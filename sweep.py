@@ -0,0 +1,61 @@
+# sweep.py: evaluate a grid of classifier hyperparameters on cached features and rank them
+import argparse, itertools, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from sklearn.linear_model import LogisticRegression
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.metrics import f1_score
+from train_baseline import CLF_PARAMS, FEATURE_CACHE, feature_cache_key, load_features
+
+_features = None
+
+def _init_worker(data, cache_dir):
+    # every worker maps the same cache entry instead of receiving the matrices by pickle
+    global _features
+    _features = load_features(data, cache_dir)[2:6]
+
+def evaluate(config):
+    X_train, Y_train, X_val, Y_val = _features
+    params = {**CLF_PARAMS, **config}
+    t0 = time.perf_counter()
+    clf = OneVsRestClassifier(LogisticRegression(**params)).fit(X_train, Y_train)
+    fit_s = time.perf_counter() - t0
+    pred = clf.predict(X_val)
+    return {**config, 'macro_f1_val': round(float(f1_score(Y_val, pred, average='macro', zero_division=0)), 4),
+            'micro_f1_val': round(float(f1_score(Y_val, pred, average='micro', zero_division=0)), 4), 'fit_seconds': round(fit_s, 3)}
+
+def grid(args):
+    weights = [None if w == 'none' else w for w in args.class_weight]
+    return [{'C': c, 'class_weight': w} for c, w in itertools.product(args.C, weights)]
+
+def main(args):
+    t0 = time.perf_counter()
+    hit = load_features(args.data, args.feature_cache)[-1]  # build the cache entry once, before the workers start
+    configs = grid(args)
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(args.data, args.feature_cache)) as pool:
+        results = list(pool.map(evaluate, configs))
+    results.sort(key=lambda r: (-r['macro_f1_val'], -r['micro_f1_val'], r['fit_seconds']))
+    for rank, r in enumerate(results, 1):
+        r['rank'] = rank
+    report = {'data': args.data, 'feature_key': feature_cache_key(args.data), 'feature_cache_hit': hit,
+              'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+              'seconds': round(time.perf_counter() - t0, 2), 'results': results}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"{'rank':>4} {'C':>8} {'class_weight':>12} {'macro_f1':>9} {'micro_f1':>9} {'fit_s':>7}")
+    for r in results:
+        print(f"{r['rank']:>4} {r['C']:>8g} {str(r['class_weight']):>12} {r['macro_f1_val']:>9.4f} {r['micro_f1_val']:>9.4f} {r['fit_seconds']:>7.2f}")
+    print({'out': args.out, 'configs': len(results), 'seconds': report['seconds'], 'feature_cache_hit': hit})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Grid-search the one-vs-rest logistic classifier on cached TF-IDF features')
+    parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--feature-cache', type=str, default=FEATURE_CACHE)
+    parser.add_argument('--C', type=float, nargs='+', default=[0.25, 0.5, 1.0, 2.0, 4.0, 8.0])
+    parser.add_argument('--class-weight', nargs='+', choices=['balanced', 'none'], default=['balanced', 'none'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--out', type=str, default='sweep_report.json')
+    args = parser.parse_args()
+    if not args.feature_cache:
+        sys.exit('sweep needs a feature cache directory')
+    main(args)
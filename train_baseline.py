@@ -1,34 +1,235 @@
 # train_baseline.py: retrain the baseline model from CSV
-import json, argparse, pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import MultiLabelBinarizer
+import json, argparse, os, resource, shutil, tempfile, time
+import sklearn
+import numpy as np, pandas as pd, scipy.sparse as sp
+from collections import Counter
+from scipy.optimize import minimize
+from scipy.special import expit
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import LabelBinarizer, MultiLabelBinarizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.metrics import f1_score
-from joblib import dump
+from joblib import dump, load
+from featurizer import TfidfFeaturizer
+from inference import LinearScorer, TriageModel, ARTIFACTS, artifact_fingerprint, sha256_files
+from flat_artifact import write_flat
 
-def main(args):
-    df = pd.read_csv(args.data)
+VECTORIZER_PARAMS = dict(lowercase=True, ngram_range=(1,2), max_features=20000, strip_accents='unicode', min_df=2, sublinear_tf=True)
+CLF_PARAMS = dict(max_iter=2000, C=2.0, class_weight='balanced', solver='liblinear')
+
+def split_labels(s):
+    return [x.strip() for x in str(s).split(',') if x.strip()]
+
+FEATURE_CACHE = '.feature_cache'
+
+def build_features(path):
+    df = pd.read_csv(path)
     train = df[df.split == 'train'].copy()
     val = df[df.split == 'val'].copy()
     X_train_text = train['symptoms_text'].values
     X_val_text = val['symptoms_text'].values
     mlb = MultiLabelBinarizer()
-    Y_train = mlb.fit_transform(train['top_conditions'].apply(lambda s: [x.strip() for x in str(s).split(',') if x.strip()]).values)
-    Y_val = mlb.transform(val['top_conditions'].apply(lambda s: [x.strip() for x in str(s).split(',') if x.strip()]).values)
-    vectorizer = TfidfVectorizer(lowercase=True, ngram_range=(1,2), max_features=20000, strip_accents='unicode', min_df=2, sublinear_tf=True)
+    Y_train = mlb.fit_transform(train['top_conditions'].apply(split_labels).values)
+    Y_val = mlb.transform(val['top_conditions'].apply(split_labels).values)
+    vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
     X_train = vectorizer.fit_transform(X_train_text)
     X_val = vectorizer.transform(X_val_text)
-    clf = OneVsRestClassifier(LogisticRegression(max_iter=2000, C=2.0, class_weight='balanced', solver='liblinear'))
+    return vectorizer, mlb, X_train, Y_train, X_val, Y_val
+
+def feature_cache_key(path):
+    """Hash of the dataset bytes, the vectorizer parameters and the sklearn version."""
+    h = sha256_files([path])
+    h.update(json.dumps({'vectorizer': VECTORIZER_PARAMS, 'sklearn': sklearn.__version__}, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+def load_features(path, cache_dir=FEATURE_CACHE):
+    """(vectorizer, mlb, X_train, Y_train, X_val, Y_val, cache_hit), from `cache_dir` when present."""
+    if not cache_dir:
+        return (*build_features(path), False)
+    entry = os.path.join(cache_dir, feature_cache_key(path))
+    if not os.path.exists(os.path.join(entry, 'meta.json')):
+        vectorizer, mlb, X_train, Y_train, X_val, Y_val = build_features(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp_', dir=cache_dir)
+        sp.save_npz(os.path.join(tmp, 'X_train.npz'), X_train)
+        sp.save_npz(os.path.join(tmp, 'X_val.npz'), X_val)
+        np.save(os.path.join(tmp, 'Y_train.npy'), Y_train)
+        np.save(os.path.join(tmp, 'Y_val.npy'), Y_val)
+        dump(vectorizer, os.path.join(tmp, 'vectorizer.joblib')); dump(mlb, os.path.join(tmp, 'mlb.joblib'))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'data': os.path.abspath(path), 'vectorizer': VECTORIZER_PARAMS, 'sklearn': sklearn.__version__,
+                       'n_train': X_train.shape[0], 'n_val': X_val.shape[0], 'n_features': X_train.shape[1]}, f, indent=2)
+        try:
+            os.rename(tmp, entry)  # a concurrent run may have filled the same entry first
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return vectorizer, mlb, X_train, Y_train, X_val, Y_val, False
+    return (load(os.path.join(entry, 'vectorizer.joblib')), load(os.path.join(entry, 'mlb.joblib')),
+            sp.load_npz(os.path.join(entry, 'X_train.npz')), np.load(os.path.join(entry, 'Y_train.npy')),
+            sp.load_npz(os.path.join(entry, 'X_val.npz')), np.load(os.path.join(entry, 'Y_val.npy')), True)
+
+def train_in_memory(args):
+    vectorizer, mlb, X_train, Y_train, X_val, Y_val, hit = load_features(args.data, args.feature_cache)
+    print({'feature_cache': 'hit' if hit else ('miss' if args.feature_cache else 'off')})
+    # n_jobs fits the per-label estimators in parallel processes; each fit is unchanged
+    clf = OneVsRestClassifier(LogisticRegression(**CLF_PARAMS), n_jobs=args.n_jobs)
     clf.fit(X_train, Y_train)
     Y_val_pred = clf.predict(X_val)
     macro_f1 = f1_score(Y_val, Y_val_pred, average='macro', zero_division=0)
     micro_f1 = f1_score(Y_val, Y_val_pred, average='micro', zero_division=0)
+    return vectorizer, clf, mlb, macro_f1, micro_f1
+
+# --- out-of-core training (--out-of-core) ------------------------------------
+# The CSV is read in chunks and never held whole. Pass 1 counts document and
+# term frequencies to rebuild exactly the vocabulary and idf TfidfVectorizer
+# would fit. Pass 2 featurizes the training chunks once into sparse files under
+# a work directory. The 25 logistic regressions are then fitted jointly with
+# L-BFGS on liblinear's objective (balanced class weights, regularized
+# intercept), accumulating loss and gradient one chunk at a time, so memory is
+# bounded by the chunk size and the weight matrix.
+
+def iter_split(path, split, chunk_size):
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        part = chunk[chunk.split == split]
+        if len(part):
+            yield part
+
+def limit_features(df_arr, tf_arr):
+    """Indices of the terms TfidfVectorizer keeps, given document and term
+    frequencies over an alphabetical vocabulary (CountVectorizer._limit_features)."""
+    p = VECTORIZER_PARAMS
+    mask = df_arr >= p['min_df']
+    if mask.sum() > p['max_features']:
+        keep = np.where(mask)[0][(-tf_arr[mask]).argsort()[:p['max_features']]]
+        mask = np.zeros(len(df_arr), dtype=bool)
+        mask[keep] = True
+    return np.where(mask)[0]
+
+def fit_vectorizer_streaming(path, chunk_size):
+    p = VECTORIZER_PARAMS
+    counter = CountVectorizer(lowercase=p['lowercase'], strip_accents=p['strip_accents'], ngram_range=p['ngram_range'])
+    dfs, tfs, labels, n_docs = Counter(), Counter(), set(), 0
+    for part in iter_split(path, 'train', chunk_size):
+        X = counter.fit_transform(part['symptoms_text'].values)
+        chunk_df = np.bincount(X.indices, minlength=X.shape[1])
+        chunk_tf = np.asarray(X.sum(axis=0)).ravel()
+        for term, j in counter.vocabulary_.items():
+            dfs[term] += int(chunk_df[j])
+            tfs[term] += int(chunk_tf[j])
+        labels.update(x for s in part['top_conditions'] for x in split_labels(s))
+        n_docs += X.shape[0]
+    terms = sorted(dfs)
+    df_arr = np.array([dfs[t] for t in terms])
+    kept = limit_features(df_arr, np.array([tfs[t] for t in terms]))
+    vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+    vectorizer.vocabulary_ = {terms[i]: j for j, i in enumerate(kept)}
+    vectorizer.idf_ = np.log((1 + n_docs) / (1 + df_arr[kept])) + 1  # smooth_idf
+    mlb = MultiLabelBinarizer().fit([sorted(labels)])
+    return vectorizer, mlb, n_docs
+
+def featurize_to_disk(path, split, chunk_size, vectorizer, mlb, work_dir):
+    files, pos, n = [], 0, 0
+    index = {c: j for j, c in enumerate(mlb.classes_)}
+    for i, part in enumerate(iter_split(path, split, chunk_size)):
+        X = vectorizer.transform(part['symptoms_text'].values)
+        Y = np.zeros((X.shape[0], len(index)), dtype=np.int8)
+        for r, s in enumerate(part['top_conditions']):
+            Y[r, [index[x] for x in split_labels(s) if x in index]] = 1
+        x_path, y_path = os.path.join(work_dir, f'{split}_{i:05d}_X.npz'), os.path.join(work_dir, f'{split}_{i:05d}_Y.npy')
+        sp.save_npz(x_path, X)
+        np.save(y_path, Y)
+        files.append((x_path, y_path))
+        pos += Y.sum(axis=0)
+        n += X.shape[0]
+    return files, pos, n
+
+def fit_ovr_streaming(files, n_features, pos, n, C=2.0, max_iter=2000):
+    """Minimize 0.5*||[w, b]||^2 + C * sum_i cw_i * logloss_i per label, one chunk at a time."""
+    n_labels = len(pos)
+    cw_pos, cw_neg = C * n / (2.0 * pos), C * n / (2.0 * (n - pos))  # class_weight='balanced'
+
+    def loss_grad(flat):
+        W = flat.reshape(n_features + 1, n_labels)
+        loss, grad = 0.5 * float((W * W).sum()), W.copy()
+        for x_path, y_path in files:
+            X, Y = sp.load_npz(x_path), np.load(y_path).astype(bool)
+            margin = np.where(Y, 1.0, -1.0) * (np.asarray(X @ W[:-1]) + W[-1])
+            cw = np.where(Y, cw_pos, cw_neg)
+            loss += float((cw * np.logaddexp(0, -margin)).sum())
+            G = cw * np.where(Y, -1.0, 1.0) * expit(-margin)
+            grad[:-1] += np.asarray(X.T @ G)
+            grad[-1] += G.sum(axis=0)
+        return loss, grad.ravel()
+
+    res = minimize(loss_grad, np.zeros((n_features + 1) * n_labels), jac=True, method='L-BFGS-B',
+                   options={'maxiter': max_iter, 'ftol': 1e-12, 'gtol': 1e-6})
+    W = res.x.reshape(n_features + 1, n_labels)
+    return W[:-1], W[-1], res.nit
+
+def assemble_ovr(weights, intercept, n_iter):
+    """A fitted OneVsRestClassifier of LogisticRegressions holding the given weights."""
+    n_features, n_labels = weights.shape
+    clf = OneVsRestClassifier(LogisticRegression(**CLF_PARAMS))
+    clf.label_binarizer_ = LabelBinarizer(sparse_output=True).fit(np.eye(n_labels, dtype=int))
+    clf.classes_ = clf.label_binarizer_.classes_
+    clf.n_features_in_ = n_features
+    clf.estimators_ = []
+    for j in range(n_labels):
+        est = LogisticRegression(**CLF_PARAMS)
+        est.classes_, est.n_features_in_, est.n_iter_ = np.array([0, 1]), n_features, np.array([n_iter])
+        est.coef_, est.intercept_ = weights[:, j][np.newaxis, :].copy(), np.array([intercept[j]])
+        clf.estimators_.append(est)
+    return clf
+
+def f1_streaming(files, weights, intercept):
+    tp = fp = fn = 0
+    for x_path, y_path in files:
+        X, Y = sp.load_npz(x_path), np.load(y_path).astype(bool)
+        P = (np.asarray(X @ weights) + intercept) > 0
+        tp, fp, fn = tp + (P & Y).sum(axis=0), fp + (P & ~Y).sum(axis=0), fn + (~P & Y).sum(axis=0)
+    denom = 2 * tp + fp + fn
+    macro = float(np.mean(np.where(denom > 0, 2 * tp / np.maximum(denom, 1), 0.0)))  # zero_division=0
+    micro = float(2 * tp.sum() / max(denom.sum(), 1))
+    return macro, micro
+
+def train_out_of_core(args):
+    vectorizer, mlb, _ = fit_vectorizer_streaming(args.data, args.chunk_size)
+    with tempfile.TemporaryDirectory(prefix='medtriage_train_', dir=args.work_dir) as work_dir:
+        files, pos, n = featurize_to_disk(args.data, 'train', args.chunk_size, vectorizer, mlb, work_dir)
+        weights, intercept, n_iter = fit_ovr_streaming(files, len(vectorizer.vocabulary_), pos, n, C=CLF_PARAMS['C'], max_iter=CLF_PARAMS['max_iter'])
+        val_files, _, _ = featurize_to_disk(args.data, 'val', args.chunk_size, vectorizer, mlb, work_dir)
+        macro_f1, micro_f1 = f1_streaming(val_files, weights, intercept)
+    return vectorizer, assemble_ovr(weights, intercept, n_iter), mlb, macro_f1, micro_f1
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux; children covers worker processes that have exited
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(own / 1024, 1), round(children / 1024, 1)
+
+def main(args):
+    t0 = time.perf_counter()
+    train = train_out_of_core if args.out_of_core else train_in_memory
+    vectorizer, clf, mlb, macro_f1, micro_f1 = train(args)
     print({'macro_f1_val': round(float(macro_f1),4), 'micro_f1_val': round(float(micro_f1),4)})
+    own, children = peak_rss_mb()
+    print({'mode': 'out-of-core' if args.out_of_core else 'in-memory', 'n_jobs': args.n_jobs, 'seconds': round(time.perf_counter() - t0, 2),
+           'peak_rss_mb': own, 'peak_worker_rss_mb': children})
     dump(vectorizer, 'vectorizer.joblib'); dump(clf, 'classifier.joblib'); dump(mlb, 'mlb.joblib')
+    if args.flat_out:
+        # same model as aligned arrays in one file that serve.py memory-maps
+        model = TriageModel(TfidfFeaturizer.from_vectorizer(vectorizer), LinearScorer.from_classifier(clf), mlb.classes_, version=artifact_fingerprint(ARTIFACTS))
+        write_flat(args.flat_out, model)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--data', type=str, default='medtriage_dataset.csv')
+    parser.add_argument('--n-jobs', type=int, default=1, help='processes for the per-label fits (-1: all cores)')
+    parser.add_argument('--feature-cache', type=str, default=FEATURE_CACHE, help="featurized train/val cache directory ('' to disable)")
+    parser.add_argument('--out-of-core', action='store_true', help='stream the CSV in chunks instead of loading it')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='CSV rows per chunk (out-of-core)')
+    parser.add_argument('--work-dir', type=str, default=None, help='where out-of-core features are spilled (default: system temp)')
+    parser.add_argument('--flat-out', type=str, default='model_flat.bin', help="flat memory-mapped artifact path ('' to skip)")
     args = parser.parse_args()
     main(args)